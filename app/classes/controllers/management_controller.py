@@ -1,7 +1,9 @@
 import logging
+import datetime
 
 from app.classes.models.management import HelpersManagement
 from app.classes.models.servers import HelperServers
+from app.classes.shared.host_sampler import HostSampler
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +17,20 @@ class ManagementController:
     # **********************************************************************************
     @staticmethod
     def get_latest_hosts_stats():
-        return HelpersManagement.get_latest_hosts_stats()
+        # same keys as a host_stats row, but from memory instead of the DB
+        node_stats = HostSampler().snapshot()
+        return {
+            "time": datetime.datetime.now(),
+            "boot_time": node_stats["boot_time"],
+            "cpu_usage": node_stats["cpu_usage"],
+            "cpu_cores": node_stats["cpu_count"],
+            "cpu_cur_freq": node_stats["cpu_cur_freq"],
+            "cpu_max_freq": node_stats["cpu_max_freq"],
+            "mem_percent": node_stats["mem_percent"],
+            "mem_usage": node_stats["mem_usage"],
+            "mem_total": node_stats["mem_total"],
+            "disk_json": node_stats["disk_data"],
+        }
 
     @staticmethod
     def set_crafty_api_key(key):
@@ -12,6 +12,7 @@ from app.classes.shared.singleton import Singleton
 from app.classes.shared.server import ServerInstance
 from app.classes.shared.console import Console
 from app.classes.shared.helpers import Helpers
+from app.classes.shared.log_index import LogIndex
 from app.classes.shared.main_models import DatabaseShortcuts
 
 from app.classes.minecraft.stats import Stats
@@ -35,6 +36,8 @@ class ServersController(metaclass=Singleton):
         self.servers_helper: HelperServers = servers_helper
         self.management_helper = management_helper
         self.servers_list = []
+        # server_id -> ServerInstance, kept in step with servers_list
+        self.servers_by_id = {}
         self.stats = Stats(self.helper, self)
 
     # **********************************************************************************
@@ -136,9 +139,9 @@ class ServersController(metaclass=Singleton):
     # **********************************************************************************
 
     def get_server_instance_by_id(self, server_id: t.Union[str, int]) -> ServerInstance:
-        for server in self.servers_list:
-            if int(server["server_id"]) == int(server_id):
-                return server["server_obj"]
+        server_obj = self.servers_by_id.get(int(server_id))
+        if server_obj is not None:
+            return server_obj
 
         logger.warning(f"Unable to find server object for server id {server_id}")
         raise Exception(f"Unable to find server object for server id {server_id}")
@@ -188,6 +191,7 @@ class ServersController(metaclass=Singleton):
 
             # add this temp object to the list of init servers
             self.servers_list.append(temp_server_dict)
+            self.servers_by_id[int(server_id)] = temp_server_dict["server_obj"]
 
             if server["auto_start"]:
                 self.set_waiting_start(server["server_id"], True)
@@ -281,6 +285,38 @@ class ServersController(metaclass=Singleton):
             )
         return server_data
 
+    def get_dashboard_servers(self, user_id=None):
+        """
+        The dashboard rows of every server, or of the servers user_id can
+        see. Built from the in memory stats and state of each server, so
+        this runs no stats queries.
+        """
+        if user_id is None:
+            instances = [server["server_obj"] for server in self.servers_list]
+        else:
+            instances = ServersController.get_authorized_servers(user_id)
+
+        server_data = []
+        for srv in instances:
+            if user_id is None:
+                user_command_permission = True
+            else:
+                user_command_permission = (
+                    EnumPermissionsServer.COMMANDS
+                    in PermissionsServers.get_user_id_permissions_list(
+                        user_id, srv.server_id
+                    )
+                )
+            server_data.append(
+                {
+                    "server_data": DatabaseShortcuts.get_data_obj(srv.server_object),
+                    "stats": srv.stats_helper.get_latest_server_stats(),
+                    "user_command_permission": user_command_permission,
+                    "alert": bool(srv.last_backup_status()),
+                }
+            )
+        return server_data
+
     @staticmethod
     def get_authorized_servers_stats_api_key(api_key: ApiKeys):
         server_data = []
@@ -508,6 +544,25 @@ class ServersController(metaclass=Singleton):
 
         return json.loads(content)
 
+    @staticmethod
+    def get_log_index():
+        return LogIndex(
+            os.path.join(os.path.dirname(Helpers().db_path), "crafty_log_index.sqlite")
+        )
+
+    def index_logs(self):
+        log_index = ServersController.get_log_index()
+        for server in HelperServers.get_all_defined_servers():
+            logs_dir = pathlib.Path(
+                server["path"], os.path.split(server["log_path"])[0]
+            )
+            try:
+                log_index.index_server(server["server_id"], logs_dir)
+            except Exception as e:
+                logger.error(
+                    f"Unable to index the logs of server {server['server_id']}: {e}"
+                )
+
     def check_for_old_logs(self):
         servers = HelperServers.get_all_defined_servers()
         for server in servers:
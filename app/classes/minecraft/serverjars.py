@@ -1,7 +1,6 @@
 import json
 import threading
 import time
-import shutil
 import logging
 from datetime import datetime
 import requests
@@ -156,33 +155,28 @@ class ServerJars:
             except Exception as ex:
                 logger.debug(f"server not registered yet. Delaying download - {ex}")
 
-        # open a file stream
-        with requests.get(fetch_url, timeout=2, stream=True) as r:
-            try:
-                with open(path, "wb") as output:
-                    shutil.copyfileobj(r.raw, output)
-                    ServersController.finish_download(server_id)
-
-                    for user in server_users:
-                        self.helper.websocket_helper.broadcast_user(
-                            user, "notification", "Executable download finished"
-                        )
-                        time.sleep(3)
-                        self.helper.websocket_helper.broadcast_user(
-                            user, "send_start_reload", {}
-                        )
-                    return True
-            except Exception as e:
-                logger.error(f"Unable to save jar to {path} due to error:{e}")
-                ServersController.finish_download(server_id)
-                server_users = PermissionsServers.get_server_user_list(server_id)
-                for user in server_users:
-                    self.helper.websocket_helper.broadcast_user(
-                        user, "notification", "Executable download finished"
-                    )
-                    time.sleep(3)
-                    self.helper.websocket_helper.broadcast_user(
-                        user, "send_start_reload", {}
-                    )
-
-                return False
+        # the checksum serverjars publishes for this build, so a corrupt or
+        # tampered download never ends up in the jar cache
+        details = self._get_api_result(f"/api/fetchDetails/servers/{server}/{version}")
+        expected_md5 = details.get("md5") if isinstance(details, dict) else None
+        if not expected_md5:
+            logger.warning(
+                f"No checksum published for {server} {version}, "
+                "downloading it unverified"
+            )
+
+        # streams into the jar cache, verified and renamed into place
+        downloaded = self.helper.download_file(
+            fetch_url, path, expected_md5=expected_md5
+        )
+        if not downloaded:
+            logger.error(f"Unable to save jar to {path}")
+        ServersController.finish_download(server_id)
+        server_users = PermissionsServers.get_server_user_list(server_id)
+        for user in server_users:
+            self.helper.websocket_helper.broadcast_user(
+                user, "notification", "Executable download finished"
+            )
+            time.sleep(3)
+            self.helper.websocket_helper.broadcast_user(user, "send_start_reload", {})
+        return downloaded
@@ -4,12 +4,18 @@ import json
 import logging
 import datetime
 import base64
+import time
 import typing as t
 
 from app.classes.minecraft.mc_ping import ping
+from app.classes.models.base_model import database_proxy
 from app.classes.models.management import HostStats
+from app.classes.models.server_stats import HelperServerStats
 from app.classes.models.servers import HelperServers
+from app.classes.shared.database import DatabaseManager
 from app.classes.shared.null_writer import NullWriter
+from app.classes.shared.dir_size_service import DirSizeService
+from app.classes.shared.host_sampler import HostSampler
 from app.classes.shared.helpers import Helpers
 
 with redirect_stderr(NullWriter()):
@@ -56,165 +62,21 @@ class Stats:
     helper: Helpers
     controller: Controller
 
-    @staticmethod
-    def try_get_boot_time():
-        try:
-            return datetime.datetime.fromtimestamp(
-                psutil.boot_time(), datetime.timezone.utc
-            )
-        except Exception as e:
-            logger.debug(
-                "getting boot time failed due to the following error:", exc_info=e
-            )
-            # unix epoch with no timezone data
-            return datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
-
-    @staticmethod
-    def try_get_cpu_usage():
-        try:
-            return psutil.cpu_percent(interval=0.5) / psutil.cpu_count()
-        except Exception as e:
-            logger.debug(
-                "getting the cpu usage failed due to the following error:", exc_info=e
-            )
-            return -1
-
     def __init__(self, helper, controller):
         self.helper = helper
         self.controller = controller
+        self.dir_sizes = DirSizeService()
+        self.host_sampler = HostSampler(helper)
 
     def get_node_stats(self) -> NodeStatsReturnDict:
-        try:
-            cpu_freq = psutil.cpu_freq()
-        except NotImplementedError:
-            cpu_freq = None
-        if cpu_freq is None:
-            cpu_freq = psutil._common.scpufreq(current=-1, min=-1, max=-1)
-        memory = psutil.virtual_memory()
-        try:
-            node_stats: NodeStatsDict = {
-                "boot_time": str(Stats.try_get_boot_time()),
-                "cpu_usage": Stats.try_get_cpu_usage(),
-                "cpu_count": psutil.cpu_count(),
-                "cpu_cur_freq": round(cpu_freq[0], 2),
-                "cpu_max_freq": cpu_freq[2],
-                "mem_percent": memory.percent,
-                "mem_usage_raw": memory.used,
-                "mem_usage": Helpers.human_readable_file_size(memory.used),
-                "mem_total_raw": memory.total,
-                "mem_total": Helpers.human_readable_file_size(memory.total),
-                "disk_data": Stats._try_all_disk_usage(),
-            }
-        except Exception as e:
-            logger.debug(
-                "getting host stats failed due to the following error:", exc_info=e
-            )
-            node_stats: NodeStatsDict = {
-                "boot_time": str(
-                    datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
-                ),
-                "cpu_usage": -1,
-                "cpu_count": -1,
-                "cpu_cur_freq": -1,
-                "cpu_max_freq": -1,
-                "mem_percent": -1,
-                "mem_usage_raw": -1,
-                "mem_usage": "",
-                "mem_total_raw": -1,
-                "mem_total": "",
-                "disk_data": [],
-            }
-        # server_stats = self.get_servers_stats()
-        # data['servers'] = server_stats
-
+        # sampled in the background, this only reads the latest sample
         return {
-            "node_stats": node_stats,
+            "node_stats": self.host_sampler.snapshot(),
         }
 
-    @staticmethod
-    def _try_get_process_stats(process, running):
-        if running:
-            try:
-                return Stats._get_process_stats(process)
-            except Exception as e:
-                logger.debug(
-                    f"getting process stats for pid {process.pid} "
-                    "failed due to the following error:",
-                    exc_info=e,
-                )
-                return {"cpu_usage": -1, "memory_usage": -1, "mem_percentage": -1}
-        else:
-            return {"cpu_usage": 0, "memory_usage": 0, "mem_percentage": 0}
-
-    @staticmethod
-    def _get_process_stats(process):
-        if process is None:
-            return {"cpu_usage": -1, "memory_usage": -1, "mem_percentage": -1}
-        process_pid = process.pid
-        p = psutil.Process(process_pid)
-        _dummy = p.cpu_percent()
-
-        # call it first so we can be more accurate per the docs
-        # https://giamptest.readthedocs.io/en/latest/#psutil.Process.cpu_percent
-
-        real_cpu = round(p.cpu_percent(interval=0.5) / psutil.cpu_count(), 2)
-
-        # this is a faster way of getting data for a process
-        with p.oneshot():
-            process_stats = {
-                "cpu_usage": real_cpu,
-                "memory_usage": Helpers.human_readable_file_size(p.memory_info()[0]),
-                "mem_percentage": round(p.memory_percent(), 0),
-            }
-        return process_stats
-
-    @staticmethod
-    def _try_all_disk_usage():
-        try:
-            return Stats._all_disk_usage()
-        except Exception as e:
-            logger.debug(
-                "getting disk stats failed due to the following error:", exc_info=e
-            )
-            return []
-
-    # Source: https://github.com/giampaolo/psutil/blob/master/scripts/disk_usage.py
-    @staticmethod
-    def _all_disk_usage() -> t.List[DiskDataDict]:
-        disk_data = []
-        # print(templ % ("Device", "Total", "Used", "Free", "Use ", "Type","Mount"))
-
-        for part in psutil.disk_partitions(all=False):
-            if Helpers.is_os_windows():
-                if "cdrom" in part.opts or part.fstype == "":
-                    # skip cd-rom drives with no disk in it; they may raise
-                    # ENOENT, pop-up a Windows GUI error for a non-ready
-                    # partition or just hang.
-                    continue
-            usage = psutil.disk_usage(part.mountpoint)
-            disk_data.append(
-                {
-                    "device": part.device,
-                    "total_raw": usage.total,
-                    "total": Helpers.human_readable_file_size(usage.total),
-                    "used_raw": usage.used,
-                    "used": Helpers.human_readable_file_size(usage.used),
-                    "free_raw": usage.free,
-                    "free": Helpers.human_readable_file_size(usage.free),
-                    "percent_used": usage.percent,
-                    "fs": part.fstype,
-                    "mount": part.mountpoint,
-                }
-            )
-
-        return disk_data
-
-    @staticmethod
-    def get_world_size(server_path):
-
-        total_size = 0
-
-        total_size = Helpers.get_dir_size(server_path)
+    def get_world_size(self, server_path):
+        # sizes are computed in the background, this only reads the cache
+        total_size = self.dir_sizes.get_size(server_path)
 
         level_total_size = Helpers.human_readable_file_size(total_size)
 
@@ -315,26 +177,162 @@ class Stats:
         return ping_data
 
     def record_stats(self):
-        stats_to_send = self.get_node_stats()
-        node_stats = stats_to_send["node_stats"]
-
-        HostStats.insert(
-            {
-                HostStats.boot_time: node_stats.get("boot_time", "Unknown"),
-                HostStats.cpu_usage: round(node_stats.get("cpu_usage", 0), 2),
-                HostStats.cpu_cores: node_stats.get("cpu_count", 0),
-                HostStats.cpu_cur_freq: node_stats.get("cpu_cur_freq", 0),
-                HostStats.cpu_max_freq: node_stats.get("cpu_max_freq", 0),
-                HostStats.mem_usage: node_stats.get("mem_usage", "0 MB"),
-                HostStats.mem_percent: node_stats.get("mem_percent", 0),
-                HostStats.mem_total: node_stats.get("mem_total", "0 MB"),
-                HostStats.disk_json: node_stats.get("disk_data", "{}"),
-            }
-        ).execute()
+        # averaged over the samples taken since the last record
+        node_stats = self.host_sampler.take_average()
 
         # delete old data
         max_age = self.helper.get_setting("history_max_age")
         now = datetime.datetime.now()
         minimum_to_exist = now - datetime.timedelta(days=max_age)
+        # server history follows the same setting
+        HelperServerStats.get_metrics_store().set_history_max_age(max_age)
+
+        writer = DatabaseManager().get_writer(database_proxy.obj)
+        writer.submit(
+            HostStats.insert(
+                {
+                    HostStats.boot_time: node_stats.get("boot_time", "Unknown"),
+                    HostStats.cpu_usage: round(node_stats.get("cpu_usage", 0), 2),
+                    HostStats.cpu_cores: node_stats.get("cpu_count", 0),
+                    HostStats.cpu_cur_freq: node_stats.get("cpu_cur_freq", 0),
+                    HostStats.cpu_max_freq: node_stats.get("cpu_max_freq", 0),
+                    HostStats.mem_usage: node_stats.get("mem_usage", "0 MB"),
+                    HostStats.mem_percent: node_stats.get("mem_percent", 0),
+                    HostStats.mem_total: node_stats.get("mem_total", "0 MB"),
+                    HostStats.disk_json: node_stats.get("disk_data", "{}"),
+                }
+            ).execute
+        )
+        writer.submit(
+            HostStats.delete().where(HostStats.time < minimum_to_exist).execute
+        )
+
+
+class ProcessSampler:
+    """
+    Keeps a psutil handle on a server process and its children so stats can be
+    sampled without blocking. CPU usage is computed from the cpu time deltas
+    between two samples instead of sleeping inside psutil.cpu_percent.
+    """
+
+    # samples taken closer together than this reuse the previous result, the
+    # stats tick asks for process stats more than once
+    min_interval = 1.0
+
+    def __init__(self):
+        self.pid = None
+        self.proc = None
+        self.children = {}
+        self.cpu_times = {}
+        self.last_time = None
+        self.last_result = None
+
+    def reset(self):
+        self.pid = None
+        self.proc = None
+        self.children = {}
+        self.cpu_times = {}
+        self.last_time = None
+        self.last_result = None
+
+    @staticmethod
+    def empty_stats(value):
+        return {
+            "cpu_usage": value,
+            "memory_usage": value,
+            "mem_percentage": value,
+            "mem_raw": value,
+            "threads": value,
+            "open_fds": value,
+            "io_read_bytes": value,
+            "io_write_bytes": value,
+        }
 
-        HostStats.delete().where(HostStats.time < minimum_to_exist).execute()
+    def try_sample(self, process, running):
+        if not running:
+            self.reset()
+            return ProcessSampler.empty_stats(0)
+        if process is None:
+            return ProcessSampler.empty_stats(-1)
+        try:
+            return self.sample(process.pid)
+        except Exception as e:
+            logger.debug(
+                f"getting process stats for pid {process.pid} "
+                "failed due to the following error:",
+                exc_info=e,
+            )
+            self.reset()
+            return ProcessSampler.empty_stats(-1)
+
+    def _tree(self):
+        # re-use the handles we already have so cpu deltas stay per process
+        children = {}
+        for child in self.proc.children(recursive=True):
+            children[child.pid] = self.children.get(child.pid, child)
+        self.children = children
+        return [self.proc, *children.values()]
+
+    def sample(self, pid):
+        now = time.monotonic()
+        if self.pid != pid:
+            self.reset()
+            self.pid = pid
+            self.proc = psutil.Process(pid)
+        elif (
+            self.last_result is not None
+            and now - self.last_time < ProcessSampler.min_interval
+        ):
+            return self.last_result
+
+        cpu_delta = 0.0
+        mem_raw = 0
+        threads = 0
+        open_fds = 0
+        io_read = 0
+        io_write = 0
+        cpu_times = {}
+        for proc in self._tree():
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    total = times.user + times.system
+                    # new processes have done all of their work since last time
+                    cpu_delta += max(total - self.cpu_times.get(proc.pid, 0.0), 0.0)
+                    cpu_times[proc.pid] = total
+                    mem_raw += proc.memory_info().rss
+                    threads += proc.num_threads()
+                    if hasattr(proc, "num_fds"):
+                        open_fds += proc.num_fds()
+                    elif hasattr(proc, "num_handles"):
+                        open_fds += proc.num_handles()
+                    if hasattr(proc, "io_counters"):
+                        io = proc.io_counters()
+                        io_read += io.read_bytes
+                        io_write += io.write_bytes
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                # a child exited mid-walk, it'll drop out on the next sample
+                continue
+            except psutil.AccessDenied:
+                continue
+
+        cpu_usage = 0
+        if self.last_time is not None and now > self.last_time:
+            cpu_usage = round(
+                cpu_delta / (now - self.last_time) * 100 / psutil.cpu_count(), 2
+            )
+        self.cpu_times = cpu_times
+        self.last_time = now
+
+        mem_total = psutil.virtual_memory().total
+        self.last_result = {
+            "cpu_usage": cpu_usage,
+            "memory_usage": Helpers.human_readable_file_size(mem_raw),
+            "mem_percentage": round(mem_raw / mem_total * 100, 0),
+            "mem_raw": mem_raw,
+            "threads": threads,
+            "open_fds": open_fds,
+            "io_read_bytes": io_read,
+            "io_write_bytes": io_write,
+        }
+        return self.last_result
@@ -1,5 +1,6 @@
 import logging
 import datetime
+import threading
 from peewee import (
     ForeignKeyField,
     CharField,
@@ -115,6 +116,7 @@ class Schedules(BaseModel):
     cron_string = CharField(default="")
     parent = IntegerField(null=True)
     delay = IntegerField(default=0)
+    event = CharField(default="")
 
     class Meta:
         table_name = "schedules"
@@ -135,6 +137,12 @@ class Backups(BaseModel):
 
 
 class HelpersManagement:
+    # enabled schedules by (server_id, event), looked up for every console
+    # event, so kept in memory and dropped whenever a schedule changes
+    event_schedules = {}
+    event_schedules_version = 0
+    event_schedules_lock = threading.Lock()
+
     def __init__(self, database, helper):
         self.database = database
         self.helper = helper
@@ -270,6 +278,7 @@ class HelpersManagement:
         cron_string="* * * * *",
         parent=None,
         delay=0,
+        event="",
     ):
         sch_id = Schedules.insert(
             {
@@ -285,21 +294,35 @@ class HelpersManagement:
                 Schedules.cron_string: cron_string,
                 Schedules.parent: parent,
                 Schedules.delay: delay,
+                Schedules.event: event,
             }
         ).execute()
+        HelpersManagement.forget_event_schedules()
         return sch_id
 
     @staticmethod
     def delete_scheduled_task(schedule_id):
-        return Schedules.delete().where(Schedules.schedule_id == schedule_id).execute()
+        deleted = (
+            Schedules.delete().where(Schedules.schedule_id == schedule_id).execute()
+        )
+        HelpersManagement.forget_event_schedules()
+        return deleted
 
     @staticmethod
     def update_scheduled_task(schedule_id, updates):
         Schedules.update(updates).where(Schedules.schedule_id == schedule_id).execute()
+        HelpersManagement.forget_event_schedules()
 
     @staticmethod
     def delete_scheduled_task_by_server(server_id):
         Schedules.delete().where(Schedules.server_id == int(server_id)).execute()
+        HelpersManagement.forget_event_schedules()
+
+    @staticmethod
+    def forget_event_schedules():
+        with HelpersManagement.event_schedules_lock:
+            HelpersManagement.event_schedules = {}
+            HelpersManagement.event_schedules_version += 1
 
     @staticmethod
     def get_scheduled_task(schedule_id):
@@ -321,6 +344,27 @@ class HelpersManagement:
             .execute()
         )
 
+    @staticmethod
+    def get_event_schedules_by_server(server_id, event):
+        key = (int(server_id), event)
+        with HelpersManagement.event_schedules_lock:
+            cached = HelpersManagement.event_schedules.get(key)
+            version = HelpersManagement.event_schedules_version
+        if cached is not None:
+            return cached
+        schedules = list(
+            Schedules.select().where(
+                Schedules.server_id == server_id,
+                Schedules.event == event,
+                Schedules.enabled == True,  # pylint: disable=singleton-comparison
+            )
+        )
+        with HelpersManagement.event_schedules_lock:
+            # a schedule changed while we were reading, don't keep what we read
+            if version == HelpersManagement.event_schedules_version:
+                HelpersManagement.event_schedules[key] = schedules
+        return schedules
+
     @staticmethod
     def get_child_schedules(schedule_id):
         return Schedules.select().where(Schedules.parent == schedule_id)
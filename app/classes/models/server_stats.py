@@ -1,15 +1,20 @@
 import os
+import re
 import logging
+import time
 import datetime
+import threading
 
 from app.classes.models.servers import Servers, HelperServers
+from app.classes.shared.database import DatabaseManager
+from app.classes.shared.file_helpers import FileHelpers
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.main_models import DatabaseShortcuts
+from app.classes.shared.metrics_store import MetricsStore
 from app.classes.shared.migration import MigrationManager
 
 try:
     from peewee import (
-        SqliteDatabase,
         Model,
         ForeignKeyField,
         CharField,
@@ -18,7 +23,7 @@ try:
         BooleanField,
         IntegerField,
         FloatField,
-        DoesNotExist,
+        SqliteDatabase,
     )
 
 except ModuleNotFoundError as e:
@@ -28,6 +33,15 @@ logger = logging.getLogger(__name__)
 peewee_logger = logging.getLogger("peewee")
 peewee_logger.setLevel(logging.INFO)
 
+STATE_FLAGS = [
+    ("updating", False),
+    ("waiting_start", False),
+    ("first_run", True),
+    ("crashed", False),
+    ("downloading", False),
+]
+
+
 # **********************************************************************************
 #                                   Servers Stats Class
 # **********************************************************************************
@@ -49,6 +63,16 @@ class ServerStats(Model):
     players = CharField(default="")
     desc = CharField(default="Unable to Connect")
     version = CharField(default="")
+
+    class Meta:
+        table_name = "server_stats"
+
+
+# **********************************************************************************
+#                                   Servers State Class
+# **********************************************************************************
+class ServerState(Model):
+    server_id = IntegerField(primary_key=True)
     updating = BooleanField(default=False)
     waiting_start = BooleanField(default=False)
     first_run = BooleanField(default=True)
@@ -56,67 +80,196 @@ class ServerStats(Model):
     downloading = BooleanField(default=False)
 
     class Meta:
-        table_name = "server_stats"
+        table_name = "server_state"
 
 
 # **********************************************************************************
 #                                    Servers_Stats Methods
 # **********************************************************************************
 class HelperServerStats:
+    """
+    Current stats and state flags of a server.
+
+    All servers share one stats database. ServerStats holds a single
+    snapshot row per server that is updated in place every tick; the history
+    used for charts and idle checks lives in the MetricsStore.
+    """
+
     server_id: int
     database = None
+    migrated = set()
+    migrate_lock = threading.Lock()
+    states = {}
+    states_lock = threading.Lock()
+    # latest stats row of each server, see cache_latest
+    latest = {}
+    metrics_store = None
+    # ServerStats fields filled from the dict get_servers_stats returns
+    stats_fields = (
+        "started",
+        "running",
+        "cpu",
+        "mem",
+        "mem_percent",
+        "world_name",
+        "world_size",
+        "server_port",
+        "int_ping_results",
+        "online",
+        "max",
+        "players",
+        "desc",
+        "version",
+    )
+    size_re = re.compile(r"^\s*([\d.]+)\s*([KMGTPEZY]?)B$")
 
     def __init__(self, server_id):
         self.server_id = int(server_id)
         self.init_database(self.server_id)
 
+    @staticmethod
+    def get_db_file():
+        return os.path.join(
+            os.path.dirname(Helpers().db_path), "crafty_server_stats.sqlite"
+        )
+
+    @staticmethod
+    def get_metrics_store():
+        if HelperServerStats.metrics_store is None:
+            helper = Helpers()
+            HelperServerStats.metrics_store = MetricsStore(
+                os.path.join(os.path.dirname(helper.db_path), "crafty_metrics.sqlite"),
+                helper.get_setting("history_max_age", 7),
+            )
+        return HelperServerStats.metrics_store
+
     def init_database(self, server_id):
+        db_file = HelperServerStats.get_db_file()
+        self.database = DatabaseManager().get_database(db_file)
+        with HelperServerStats.migrate_lock:
+            if db_file not in HelperServerStats.migrated:
+                helper_stats = Helpers()
+                helper_stats.migration_dir = os.path.join(
+                    f"{helper_stats.migration_dir}", "stats"
+                )
+                helper_stats.db_path = db_file
+                migration_manager = MigrationManager(self.database, helper_stats)
+                migration_manager.up()  # Automatically runs migrations
+                HelperServerStats.migrated.add(db_file)
         try:
-            server = HelperServers.get_server_data_by_id(server_id)
-            db_folder = os.path.join(f"{server['path']}", "db_stats")
-            db_file = os.path.join(
-                db_folder,
-                "crafty_server_stats.sqlite",
-            )
-            self.database = SqliteDatabase(
-                db_file, pragmas={"journal_mode": "wal", "cache_size": -1024 * 10}
-            )
-            if not os.path.exists(db_file):
-                try:
-                    os.mkdir(db_folder)
-                except Exception as ex:
-                    logger.warning(
-                        f"Error try to create the db_stats folder for server : {ex}"
-                    )
-            helper_stats = Helpers()
-            helper_stats.migration_dir = os.path.join(
-                f"{helper_stats.migration_dir}", "stats"
-            )
-            helper_stats.db_path = db_file
-            migration_manager = MigrationManager(self.database, helper_stats)
-            migration_manager.up()  # Automatically runs migrations
+            self.import_legacy_stats(server_id)
         except Exception as ex:
             logger.warning(
-                f"Error try to look for the db_stats files for server : {ex}"
+                f"Error importing the db_stats file of server {server_id}: {ex}"
             )
-            return None
 
-    def select_database(self):
-        try:
-            server = HelperServers.get_server_data_by_id(self.server_id)
-            db_file = os.path.join(
-                f"{server['path']}",
-                "db_stats",
-                "crafty_server_stats.sqlite",
+    def import_legacy_stats(self, server_id):
+        """
+        Servers used to keep their own stats database in <server>/db_stats.
+        The first time we see such a server, carry its latest row (and with it
+        its flags) over into the shared database and its history, as far as
+        history_max_age keeps it, into the metrics store. The old database is
+        removed once it was imported.
+        """
+        server = HelperServers.get_server_data_by_id(server_id)
+        legacy_dir = os.path.join(f"{server['path']}", "db_stats")
+        legacy_file = os.path.join(legacy_dir, "crafty_server_stats.sqlite")
+        if not os.path.exists(legacy_file):
+            return
+        logger.info(f"Importing stats of server {server_id} from {legacy_file}")
+        found = HelperServerStats.read_legacy_stats(legacy_file, server_id)
+        if found is not None and not (
+            ServerStats.select()
+            .where(ServerStats.server_id == server_id)
+            .exists(self.database)
+        ):
+            latest, state = found
+            self.writer().run(ServerStats.insert(latest).execute, self.database)
+            self.writer().run(
+                ServerState.insert(server_id=server_id, **state)
+                .on_conflict_replace()
+                .execute,
+                self.database,
             )
-            self.database = SqliteDatabase(
-                db_file, pragmas={"journal_mode": "wal", "cache_size": -1024 * 10}
+            HelperServerStats.states.pop(server_id, None)
+        max_age = Helpers().get_setting("history_max_age", 7)
+        HelperServerStats.get_metrics_store().import_samples(
+            server_id,
+            HelperServerStats.read_legacy_history(
+                legacy_file, server_id, time.time() - max_age * 24 * 3600
+            ),
+        )
+        FileHelpers.del_dirs(legacy_dir)
+
+    @staticmethod
+    def read_legacy_stats(legacy_file, server_id):
+        """
+        The latest row of a server in a per-server stats database as a
+        (stats, state flags) pair, or None when there is no row. The flags
+        are columns ServerStats no longer declares, so they are selected by
+        name, as far as the database has them.
+        """
+        legacy_db = SqliteDatabase(legacy_file)
+        try:
+            columns = {column.name for column in legacy_db.get_columns("server_stats")}
+            stats_names = [
+                name
+                for name in ("created",) + HelperServerStats.stats_fields
+                if name in columns
+            ]
+            flag_names = [flag for flag, _ in STATE_FLAGS if flag in columns]
+            selected = ", ".join(f'"{name}"' for name in stats_names + flag_names)
+            row = legacy_db.execute_sql(
+                f"SELECT {selected} FROM server_stats WHERE server_id = ? "
+                "ORDER BY created DESC LIMIT 1",
+                [server_id],
+            ).fetchone()
+        finally:
+            legacy_db.close()
+        if row is None:
+            return None
+        latest = {"server_id": server_id}
+        for name, value in zip(stats_names, row):
+            latest[name] = ServerStats._meta.fields[name].python_value(value)
+        state = dict(STATE_FLAGS)
+        for name, value in zip(flag_names, row[len(stats_names) :]):
+            if value is not None:
+                state[name] = bool(value)
+        return latest, state
+
+    @staticmethod
+    def read_legacy_history(legacy_file, server_id, since):
+        """
+        The rows of a server in a per-server stats database created at or
+        after since (unix seconds), as (ts, sample) pairs for the metrics
+        store.
+        """
+        created = ServerStats._meta.fields["created"]
+        legacy_db = SqliteDatabase(legacy_file)
+        try:
+            rows = legacy_db.execute_sql(
+                "SELECT created, cpu, mem, mem_percent, online, max, world_size "
+                "FROM server_stats WHERE server_id = ? AND created >= ? "
+                "ORDER BY created",
+                [server_id, str(datetime.datetime.fromtimestamp(since))],
+            ).fetchall()
+        finally:
+            legacy_db.close()
+        history = []
+        for row in rows:
+            stats = dict(
+                zip(
+                    ("cpu", "mem", "mem_percent", "online", "max", "world_size"),
+                    row[1:],
+                )
             )
-        except Exception as ex:
-            logger.warning(
-                f"Error try to look for the db_stats files for server : {ex}"
+            history.append(
+                (
+                    created.python_value(row[0]).timestamp(),
+                    HelperServerStats._metrics_sample(stats),
+                )
             )
-            return None
+        return history
 
     def get_all_servers_stats(self):
         servers = HelperServers.get_all_defined_servers()
@@ -137,42 +290,45 @@ class HelperServerStats:
             )
         return server_data
 
-    def insert_server_stats(self, server_stats):
+    def writer(self):
+        return DatabaseManager().get_writer(self.database)
+
+    def insert_server_stats(self, server_stats, server_data=None):
         server_id = server_stats.get("id", 0)
 
         if server_id == 0:
             logger.warning("Stats saving failed with error: Server unknown (id = 0)")
             return
 
-        ServerStats.insert(
-            {
-                ServerStats.server_id: server_stats.get("id", 0),
-                ServerStats.started: server_stats.get("started", ""),
-                ServerStats.running: server_stats.get("running", False),
-                ServerStats.cpu: server_stats.get("cpu", 0),
-                ServerStats.mem: server_stats.get("mem", 0),
-                ServerStats.mem_percent: server_stats.get("mem_percent", 0),
-                ServerStats.world_name: server_stats.get("world_name", ""),
-                ServerStats.world_size: server_stats.get("world_size", ""),
-                ServerStats.server_port: server_stats.get("server_port", 0),
-                ServerStats.int_ping_results: server_stats.get(
-                    "int_ping_results", False
-                ),
-                ServerStats.online: server_stats.get("online", False),
-                ServerStats.max: server_stats.get("max", False),
-                ServerStats.players: server_stats.get("players", False),
-                ServerStats.desc: server_stats.get("desc", False),
-                ServerStats.version: server_stats.get("version", False),
-            }
-        ).execute(self.database)
-
-    def remove_old_stats(self, last_week):
-        # self.select_database(self.server_id)
-        ServerStats.delete().where(ServerStats.created < last_week).execute(
-            self.database
+        self.cache_latest(server_stats, server_data)
+        # queued, the writer commits inserts from all servers in batches
+        self.writer().submit(self._insert_server_stats, server_stats)
+
+    def cache_latest(self, server_stats, server_data=None):
+        """
+        Keeps the row _insert_server_stats is about to write in memory, in the
+        same shape a select would return it, so readers never wait for the
+        write or query for it.
+        """
+        previous = HelperServerStats.latest.get(self.server_id)
+        if previous is None:
+            try:
+                previous = self._select_latest()
+            except ServerStats.DoesNotExist:
+                previous = {}
+        now = datetime.datetime.now()
+        row = {"stats_id": previous.get("stats_id"), "created": now}
+        for name in HelperServerStats.stats_fields:
+            field = ServerStats._meta.fields[name]
+            row[name] = field.python_value(field.db_value(server_stats.get(name)))
+        row["server_id"] = (
+            server_data
+            or previous.get("server_id")
+            or HelperServers.get_server_data_by_id(self.server_id)
         )
+        HelperServerStats.latest[self.server_id] = row
 
-    def get_latest_server_stats(self):
+    def _select_latest(self):
         latest = (
             ServerStats.select()
             .where(ServerStats.server_id == self.server_id)
@@ -180,20 +336,93 @@ class HelperServerStats:
             .limit(1)
             .get(self.database)
         )
-        try:
-            return DatabaseShortcuts.get_data_obj(latest)
-        except IndexError:
-            return {}
+        return DatabaseShortcuts.get_data_obj(latest)
 
-    def get_server_stats(self):
-        stats = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .order_by(ServerStats.created.desc())
-            .limit(1)
-            .first(self.database)
+    def _insert_server_stats(self, server_stats):
+        server_id = server_stats.get("id", 0)
+        now = datetime.datetime.now()
+        snapshot = {
+            ServerStats.created: now,
+            ServerStats.started: server_stats.get("started", ""),
+            ServerStats.running: server_stats.get("running", False),
+            ServerStats.cpu: server_stats.get("cpu", 0),
+            ServerStats.mem: server_stats.get("mem", 0),
+            ServerStats.mem_percent: server_stats.get("mem_percent", 0),
+            ServerStats.world_name: server_stats.get("world_name", ""),
+            ServerStats.world_size: server_stats.get("world_size", ""),
+            ServerStats.server_port: server_stats.get("server_port", 0),
+            ServerStats.int_ping_results: server_stats.get("int_ping_results", False),
+            ServerStats.online: server_stats.get("online", False),
+            ServerStats.max: server_stats.get("max", False),
+            ServerStats.players: server_stats.get("players", False),
+            ServerStats.desc: server_stats.get("desc", False),
+            ServerStats.version: server_stats.get("version", False),
+        }
+        # one row per server, updated in place
+        updated = (
+            ServerStats.update(snapshot)
+            .where(ServerStats.server_id == server_id)
+            .execute(self.database)
         )
-        return DatabaseShortcuts.get_data_obj(stats)
+        if not updated:
+            snapshot[ServerStats.server_id] = server_id
+            ServerStats.insert(snapshot).execute(self.database)
+
+        HelperServerStats.get_metrics_store().record(
+            server_id, HelperServerStats._metrics_sample(server_stats)
+        )
+
+    @staticmethod
+    def _metrics_sample(server_stats):
+        return {
+            "cpu": server_stats.get("cpu") or 0,
+            "mem": HelperServerStats._to_bytes(server_stats.get("mem")),
+            "mem_percent": server_stats.get("mem_percent") or 0,
+            "online": int(server_stats.get("online") or 0),
+            "max_players": int(server_stats.get("max") or 0),
+            "world_size": HelperServerStats._to_bytes(server_stats.get("world_size")),
+        }
+
+    @staticmethod
+    def _to_bytes(value):
+        """Stats carry sizes as human readable strings, the metrics store wants bytes."""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+        match = HelperServerStats.size_re.match(str(value))
+        if match is None:
+            return None
+        number, unit = match.groups()
+        return int(float(number) * 1024 ** " KMGTPEZY".index(unit or " "))
+
+    def delete_server_stats(self):
+        self.writer().run(
+            ServerStats.delete().where(ServerStats.server_id == self.server_id).execute,
+            self.database,
+        )
+        self.writer().run(
+            ServerState.delete().where(ServerState.server_id == self.server_id).execute,
+            self.database,
+        )
+        HelperServerStats.states.pop(self.server_id, None)
+        HelperServerStats.latest.pop(self.server_id, None)
+
+    def get_stats_history(self, start, end, resolution=None):
+        return HelperServerStats.get_metrics_store().query(
+            self.server_id, start, end, resolution
+        )
+
+    def get_latest_server_stats(self):
+        latest = HelperServerStats.latest.get(self.server_id)
+        if latest is None:
+            try:
+                latest = self._select_latest()
+            except ServerStats.DoesNotExist:
+                return {}
+            HelperServerStats.latest[self.server_id] = latest
+        return dict(latest, **self.get_state())
+
+    def get_server_stats(self):
+        return self.get_latest_server_stats()
 
     def server_id_exists(self):
         # self.select_database(self.server_id)
@@ -201,140 +430,114 @@ class HelperServerStats:
             return False
         return True
 
+    # **********************************************************************************
+    #                                   State Flags
+    # **********************************************************************************
+    def get_state(self) -> dict:
+        """
+        The state flags of this server. Loaded once, after that reads and
+        writes go to the in memory record and writes are written through to
+        the server_state table.
+        """
+        state = HelperServerStats.states.get(self.server_id)
+        if state is not None:
+            return state
+        with HelperServerStats.states_lock:
+            if self.server_id not in HelperServerStats.states:
+                row = (
+                    ServerState.select()
+                    .where(ServerState.server_id == self.server_id)
+                    .dicts()
+                    .first(self.database)
+                )
+                if row is None:
+                    row = dict(STATE_FLAGS)
+                row.pop("server_id", None)
+                HelperServerStats.states[self.server_id] = row
+            return HelperServerStats.states[self.server_id]
+
+    def set_state(self, **flags):
+        if self.server_id is None:
+            return
+        state = self.get_state()
+        with HelperServerStats.states_lock:
+            state.update(flags)
+            row = dict(state, server_id=self.server_id)
+        self.writer().submit(
+            ServerState.insert(row).on_conflict_replace().execute, self.database
+        )
+
     def sever_crashed(self):
-        # self.select_database(self.server_id)
-        ServerStats.update(crashed=True).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(crashed=True)
 
     def set_download(self):
-        # self.select_database(self.server_id)
-        ServerStats.update(downloading=True).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(downloading=True)
 
     def finish_download(self):
-        # self.select_database(self.server_id)
-        ServerStats.update(downloading=False).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(downloading=False)
 
     def get_download_status(self):
-        # self.select_database(self.server_id)
-        download_status = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .get(self.database)
-        )
-        return download_status.downloading
+        return self.get_state()["downloading"]
 
     def server_crash_reset(self):
-        if self.server_id is None:
-            return
-
-        # self.select_database(self.server_id)
-        ServerStats.update(crashed=False).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(crashed=False)
 
     def is_crashed(self):
-        # self.select_database(self.server_id)
-        svr: ServerStats = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .get(self.database)
-        )
-        return svr.crashed
+        return self.get_state()["crashed"]
 
     def set_update(self, value):
-        if self.server_id is None:
-            return
-
-        # self.select_database(self.server_id)
-        try:
-            # Checks if server even exists
-            ServerStats.select().where(ServerStats.server_id == self.server_id).execute(
-                self.database
-            )
-        except DoesNotExist as ex:
-            logger.error(f"Database entry not found! {ex}")
-            return
-        ServerStats.update(updating=value).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(updating=value)
 
     def get_update_status(self):
-        # self.select_database(self.server_id)
-        update_status = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .get(self.database)
-        )
-        return update_status.updating
+        return self.get_state()["updating"]
 
     def set_first_run(self):
-        # self.select_database(self.server_id)
         # Sets first run to false
-        try:
-            # Checks if server even exists
-            ServerStats.select().where(ServerStats.server_id == self.server_id).execute(
-                self.database
-            )
-        except Exception as ex:
-            logger.error(f"Database entry not found! {ex}")
-            return
-        ServerStats.update(first_run=False).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(first_run=False)
 
     def get_first_run(self):
-        # self.select_database(self.server_id)
-        first_run = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .get(self.database)
-        )
-        return first_run.first_run
+        return self.get_state()["first_run"]
 
     def get_ttl_without_player(self):
-        # self.select_database(self.server_id)
-        last_stat = (
-            ServerStats.select()
+        last = (
+            ServerStats.select(ServerStats.created, ServerStats.started)
             .where(ServerStats.server_id == self.server_id)
-            .order_by(ServerStats.created.desc())
             .first(self.database)
         )
-        last_stat_with_player = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .where(ServerStats.online > 0)
-            .order_by(ServerStats.created.desc())
-            .first(self.database)
+        if last is None:
+            return datetime.timedelta(0)
+        # players from before the server was (re)started don't count, so the
+        # history is only searched back to the start
+        started = HelperServerStats._started_at(last.started)
+        found = HelperServerStats.get_metrics_store().last_online(
+            self.server_id, started.timestamp() if started is not None else 0
+        )
+        last_online = (
+            datetime.datetime.fromtimestamp(found) if found is not None else started
+        )
+        if last_online is None:
+            return datetime.timedelta(0)
+        return max(last.created - last_online, datetime.timedelta(0))
+
+    @staticmethod
+    def _started_at(started):
+        """The start time of a server as stored in stats (UTC), in local time."""
+        if not started:
+            return None
+        try:
+            utc = datetime.datetime.strptime(str(started), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+        return (
+            utc.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
         )
-        return last_stat.created - last_stat_with_player.created
 
     def can_stop_no_players(self, time_limit):
         ttl_no_players = self.get_ttl_without_player()
         return (time_limit == -1) or (ttl_no_players > time_limit)
 
     def set_waiting_start(self, value):
-        # self.select_database(self.server_id)
-        try:
-            # Checks if server even exists
-            ServerStats.select().where(ServerStats.server_id == self.server_id).execute(
-                self.database
-            )
-        except DoesNotExist as ex:
-            logger.error(f"Database entry not found! {ex}")
-            return
-        ServerStats.update(waiting_start=value).where(
-            ServerStats.server_id == self.server_id
-        ).execute(self.database)
+        self.set_state(waiting_start=value)
 
     def get_waiting_start(self):
-        waiting_start = (
-            ServerStats.select()
-            .where(ServerStats.server_id == self.server_id)
-            .get(self.database)
-        )
-        return waiting_start.waiting_start
+        return self.get_state()["waiting_start"]
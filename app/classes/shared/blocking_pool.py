@@ -0,0 +1,118 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class LoopSteps:
+    """
+    Awaits a coroutine step by step like await itself would, adding up the
+    time spent running each step between two suspensions. That is the time
+    the coroutine held the IOLoop; waiting on the pool, a client or a sleep
+    happens between steps and isn't counted.
+    """
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.held = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                if error is None:
+                    suspended_on = self.coro.send(value)
+                else:
+                    suspended_on = self.coro.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.held += time.perf_counter() - started
+            try:
+                value, error = (yield suspended_on), None
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+class BlockingPool(metaclass=Singleton):
+    """
+    The thread pool web handlers run blocking work in (disk, database,
+    psutil, network), so a slow request only ties up a worker instead of
+    the IOLoop that every page and websocket shares.
+
+    Every call is timed by name, split into time spent queued for a worker
+    and time spent running. Handlers report how long each request held the
+    IOLoop, measured by LoopSteps over the synchronous steps of the handler.
+    """
+
+    # requests that hold the loop this long get logged
+    slow_block = 0.5
+
+    def __init__(self, workers=16):
+        self.workers = max(int(workers), 1)
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="web_blocking"
+        )
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.calls = {}
+        self.blocks = {}
+
+    async def run(self, name, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on the pool and returns its result."""
+        queued_at = time.perf_counter()
+        with self.lock:
+            self.pending += 1
+
+        def call():
+            started = time.perf_counter()
+            with self.lock:
+                self.pending -= 1
+                self.running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finished = time.perf_counter()
+                with self.lock:
+                    self.running -= 1
+                    self._add(self.calls, name, started - queued_at, finished - started)
+
+        return await asyncio.get_running_loop().run_in_executor(self.pool, call)
+
+    def record_block(self, handler_name, seconds, uri=""):
+        with self.lock:
+            self._add(self.blocks, handler_name, 0.0, seconds)
+        if seconds >= BlockingPool.slow_block:
+            logger.warning(
+                f"{handler_name} held the IOLoop for {seconds:.3f}s serving {uri}"
+            )
+
+    @staticmethod
+    def _add(table, name, waited, took):
+        entry = table.get(name)
+        if entry is None:
+            entry = table[name] = {"count": 0, "wait": 0.0, "total": 0.0, "max": 0.0}
+        entry["count"] += 1
+        entry["wait"] += waited
+        entry["total"] += took
+        entry["max"] = max(entry["max"], took)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": self.running,
+                "calls": {name: dict(v) for name, v in self.calls.items()},
+                "loop_blocks": {name: dict(v) for name, v in self.blocks.items()},
+            }
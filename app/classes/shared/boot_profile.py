@@ -0,0 +1,55 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from app.classes.shared.console import Console
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class BootProfile(metaclass=Singleton):
+    """
+    How long each step of starting Crafty took, written to the log once it
+    is up.
+
+    main.py marks the steps it runs one after another, each mark covers the
+    time since the previous one. Steps that run in threads of their own
+    (and details like the migrations of each database) time themselves
+    with phase or record.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.lock = threading.Lock()
+        # [(name, seconds)] in the order they finished
+        self.steps = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self.lock:
+            self.steps.append((name, now - self.last_mark))
+            self.last_mark = now
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.steps.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        with self.lock:
+            steps = list(self.steps)
+        logger.info(f"Crafty started in {total:.2f}s")
+        Console.info(f"Crafty started in {total:.2f}s")
+        for name, seconds in steps:
+            logger.info(f"  {name:<40} {seconds * 1000:>10.1f}ms")
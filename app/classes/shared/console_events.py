@@ -0,0 +1,108 @@
+import re
+import logging
+import threading
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class ConsoleEventType:
+    SERVER_READY = "server_ready"
+    PLAYER_JOIN = "player_join"
+    PLAYER_LEAVE = "player_leave"
+    SERVER_LAG = "server_lag"
+    SAVE_COMPLETE = "save_complete"
+
+    ALL = [SERVER_READY, PLAYER_JOIN, PLAYER_LEAVE, SERVER_LAG, SAVE_COMPLETE]
+
+
+class ConsoleEventMatcher:
+    """
+    Matches console lines against every known event pattern in a single
+    regex pass. Each alternative is a named group; the name of the group that
+    matched tells us the event type.
+    """
+
+    # Player names must directly follow the log prefix so chat messages
+    # can't fake a join or leave.
+    # group name -> (event type, group holding the event value)
+    groups = {
+        "java_ready": (ConsoleEventType.SERVER_READY, "java_ready_time"),
+        "bedrock_ready": (ConsoleEventType.SERVER_READY, None),
+        "java_join": (ConsoleEventType.PLAYER_JOIN, "java_join_name"),
+        "bedrock_join": (ConsoleEventType.PLAYER_JOIN, "bedrock_join_name"),
+        "java_leave": (ConsoleEventType.PLAYER_LEAVE, "java_leave_name"),
+        "bedrock_leave": (ConsoleEventType.PLAYER_LEAVE, "bedrock_leave_name"),
+        "lag": (ConsoleEventType.SERVER_LAG, "lag_ms"),
+        "save": (ConsoleEventType.SAVE_COMPLETE, None),
+    }
+
+    pattern = re.compile(
+        r"(?P<java_ready>Done \((?P<java_ready_time>[\d.,]+)s\)!)"
+        r"|(?P<bedrock_ready>Server started\.)"
+        r"|(?P<java_join>\]: (?P<java_join_name>\w{1,16}) joined the game\s*$)"
+        r"|(?P<bedrock_join>Player connected: (?P<bedrock_join_name>[^,]+),)"
+        r"|(?P<java_leave>\]: (?P<java_leave_name>\w{1,16}) left the game\s*$)"
+        r"|(?P<bedrock_leave>Player disconnected: (?P<bedrock_leave_name>[^,]+),)"
+        r"|(?P<lag>Can't keep up!.*?Running (?P<lag_ms>\d+)ms)"
+        r"|(?P<save>Saved the (?:game|world))"
+    )
+
+    @staticmethod
+    def match(line: str):
+        """
+        Returns an (event type, value) tuple for the line, or None if the line
+        isn't an event we know about.
+        """
+        found = ConsoleEventMatcher.pattern.search(line)
+        if found is None:
+            return None
+        event_type, value_group = ConsoleEventMatcher.groups[found.lastgroup]
+        value = found.group(value_group) if value_group else None
+        return event_type, value
+
+
+class ConsoleEventBus(metaclass=Singleton):
+    """
+    Delivers console events to subscribers. Subscribers are called on the
+    server's virtual terminal thread, so they need to return quickly.
+
+    A subscriber either follows every server or, given a server_id, only
+    that one; events only go to the subscribers of their server.
+    """
+
+    def __init__(self):
+        # server_id (None for every server) -> callbacks
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback, server_id=None):
+        key = str(server_id) if server_id is not None else None
+        with self.lock:
+            # replaced, never changed in place, publish reads it without the lock
+            subscribers = dict(self.subscribers)
+            subscribers[key] = subscribers.get(key, []) + [callback]
+            self.subscribers = subscribers
+
+    def unsubscribe(self, callback, server_id=None):
+        key = str(server_id) if server_id is not None else None
+        with self.lock:
+            callbacks = [c for c in self.subscribers.get(key, []) if c != callback]
+            subscribers = dict(self.subscribers)
+            if callbacks:
+                subscribers[key] = callbacks
+            else:
+                subscribers.pop(key, None)
+            self.subscribers = subscribers
+
+    def publish(self, server_id, event_type: str, value=None):
+        subscribers = self.subscribers
+        for callback in subscribers.get(None, []) + subscribers.get(str(server_id), []):
+            try:
+                callback(server_id, event_type, value)
+            except Exception as e:
+                logger.error(
+                    f"Console event subscriber failed for {event_type} "
+                    f"on server {server_id}: {e}"
+                )
@@ -0,0 +1,208 @@
+import re
+import logging
+import threading
+
+from app.classes.shared.singleton import Singleton
+
+# re2 matches in linear time, without it user patterns are limited to
+# constructs that can't backtrack catastrophically
+try:
+    import re2
+except ImportError:
+    re2 = None
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse  # pylint: disable=deprecated-module
+
+logger = logging.getLogger(__name__)
+
+
+class ConsoleFilterError(ValueError):
+    pass
+
+
+class LineFilter:
+    """
+    What a console subscriber wants to see: any of levels, lines matching
+    regex and lines mentioning any of players. Every given criterion has to
+    match, an empty filter matches every line.
+    """
+
+    # user supplied patterns are compiled as is, keep them short
+    max_regex_length = 200
+    # only the start of a line is searched with a user pattern
+    max_search_length = 512
+    # a repeat above this many times counts as unbounded
+    max_bounded_repeat = 16
+    known_levels = {"INFO", "WARN", "ERROR"}
+    repeat_ops = {"MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"}
+    # backreferences, lookarounds and conditionals
+    rejected_ops = {
+        "GROUPREF",
+        "GROUPREF_EXISTS",
+        "ASSERT",
+        "ASSERT_NOT",
+    }
+
+    def __init__(self, levels=None, regex=None, players=None):
+        self.levels = frozenset(level.upper() for level in levels or [] if level)
+        unknown = self.levels - LineFilter.known_levels
+        if unknown:
+            raise ConsoleFilterError(f"Unknown log level {', '.join(unknown)}")
+        self.regex = regex or None
+        self.players = tuple(sorted({p for p in players or [] if p}))
+
+        self.pattern = None
+        if self.regex is not None:
+            if len(self.regex) > LineFilter.max_regex_length:
+                raise ConsoleFilterError("Filter regex is too long")
+            self.pattern = LineFilter.compile(self.regex)
+        self.player_pattern = None
+        if self.players:
+            names = "|".join(re.escape(p) for p in self.players)
+            self.player_pattern = re.compile(rf"\b(?:{names})\b", re.IGNORECASE)
+
+    @staticmethod
+    def compile(regex):
+        if re2 is not None:
+            try:
+                return re2.compile(regex)
+            except re2.error as e:
+                raise ConsoleFilterError(f"Invalid filter regex: {e}") from e
+        try:
+            parsed = sre_parse.parse(regex)
+        except re.error as e:
+            raise ConsoleFilterError(f"Invalid filter regex: {e}") from e
+        if LineFilter._unbounded_repeats(parsed) > 1:
+            raise ConsoleFilterError(
+                "Filter regex may only contain one unbounded repeat"
+            )
+        return re.compile(regex)
+
+    @staticmethod
+    def _unbounded_repeats(items, in_repeat=False):
+        """
+        Counts the unbounded repeats of a parsed pattern. Raises for what
+        backtracks exponentially: repeats or alternation inside a repeat,
+        backreferences and lookarounds.
+        """
+        count = 0
+        for op, av in items:
+            name = str(op)
+            if name in LineFilter.rejected_ops:
+                raise ConsoleFilterError(
+                    "Filter regex can't use backreferences or lookarounds"
+                )
+            if name in LineFilter.repeat_ops:
+                if in_repeat:
+                    raise ConsoleFilterError("Filter regex can't nest repeats")
+                _min, max_repeat, sub = av
+                if max_repeat > LineFilter.max_bounded_repeat:
+                    count += 1
+                count += LineFilter._unbounded_repeats(sub, True)
+            elif name == "BRANCH":
+                if in_repeat:
+                    raise ConsoleFilterError("Filter regex can't repeat an alternation")
+                for branch in av[1]:
+                    count += LineFilter._unbounded_repeats(branch, in_repeat)
+            elif name == "SUBPATTERN":
+                count += LineFilter._unbounded_repeats(av[-1], in_repeat)
+            elif name == "ATOMIC_GROUP":
+                count += LineFilter._unbounded_repeats(av, in_repeat)
+        return count
+
+    @property
+    def key(self):
+        return (self.levels, self.regex, self.players)
+
+    def matches(self, line, level):
+        if self.levels and level not in self.levels:
+            return False
+        if (
+            self.pattern is not None
+            and self.pattern.search(line[: LineFilter.max_search_length]) is None
+        ):
+            return False
+        if self.player_pattern is not None:
+            return self.player_pattern.search(line) is not None
+        return True
+
+
+class ConsoleSubscriptions(metaclass=Singleton):
+    """
+    Which websocket clients follow which server console, and with what filter.
+
+    Clients with the same filter share one compiled LineFilter, so each new
+    line is matched once per distinct filter rather than once per client,
+    and a line nobody wants is never escaped or highlighted.
+    """
+
+    level_re = re.compile(r"[/ \[](TRACE|DEBUG|INFO|WARN(?:ING)?|ERROR|SEVERE|FATAL)\]")
+    level_aliases = {"WARNING": "WARN", "SEVERE": "ERROR", "FATAL": "ERROR"}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # server_id -> {filter key: (LineFilter, set of clients)}
+        self.servers = {}
+        # server_id -> level of the last line that had one
+        self.last_level = {}
+
+    def subscribe(self, client, server_id, line_filter: LineFilter):
+        """Subscribes client to a server console, replacing its earlier filter."""
+        server_id = str(server_id)
+        with self.lock:
+            self._remove(client, server_id)
+            groups = dict(self.servers.get(server_id, {}))
+            current = groups.get(line_filter.key)
+            if current is None:
+                groups[line_filter.key] = (line_filter, frozenset([client]))
+            else:
+                groups[line_filter.key] = (current[0], current[1] | {client})
+            # replaced, never changed in place, readers use it without the lock
+            self.servers[server_id] = groups
+
+    def unsubscribe(self, client, server_id=None):
+        """Unsubscribes client from one server, or from all of them."""
+        with self.lock:
+            server_ids = [str(server_id)] if server_id is not None else self.servers
+            for sid in list(server_ids):
+                self._remove(client, sid)
+
+    def _remove(self, client, server_id):
+        groups = self.servers.get(server_id)
+        if not groups:
+            return
+        updated = {}
+        for key, (line_filter, clients) in groups.items():
+            clients = clients - {client}
+            if clients:
+                updated[key] = (line_filter, clients)
+        if updated:
+            self.servers[server_id] = updated
+        else:
+            self.servers.pop(server_id, None)
+            self.last_level.pop(server_id, None)
+
+    def line_level(self, server_id, line):
+        found = ConsoleSubscriptions.level_re.search(line, 0, 120)
+        if found is None:
+            # continuation lines (stack traces) keep the level of their line
+            return self.last_level.get(server_id)
+        level = found.group(1)
+        level = ConsoleSubscriptions.level_aliases.get(level, level)
+        self.last_level[server_id] = level
+        return level
+
+    def matching_clients(self, server_id, line):
+        """The clients that want this line of a server's output."""
+        server_id = str(server_id)
+        groups = self.servers.get(server_id)
+        if not groups:
+            return []
+        level = self.line_level(server_id, line)
+        clients = []
+        for line_filter, group_clients in groups.values():
+            if line_filter.matches(line, level):
+                clients.extend(group_clients)
+        return clients
@@ -0,0 +1,184 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import peewee
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+# Applied by peewee to every connection it opens.
+# WAL with synchronous=NORMAL only syncs on checkpoints, a crash can lose the
+# last transactions but never corrupts the database. busy_timeout makes a
+# connection wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "cache_size": -1024 * 10,
+    "synchronous": "normal",
+    "mmap_size": 64 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "memory",
+}
+
+
+class TimedSqliteDatabase(peewee.SqliteDatabase):
+    """SqliteDatabase that keeps count of the time spent per kind of statement."""
+
+    statements = {"SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "BEGIN"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timing_lock = threading.Lock()
+        # statement -> {"count", "total", "max"}
+        self.timings = {}
+
+    def execute_sql(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().execute_sql(sql, *args, **kwargs)
+        finally:
+            took = time.perf_counter() - started
+            statement = sql.lstrip()[:7].split(" ", 1)[0].upper()
+            if statement not in TimedSqliteDatabase.statements:
+                statement = "OTHER"
+            with self.timing_lock:
+                entry = self.timings.get(statement)
+                if entry is None:
+                    entry = self.timings[statement] = {
+                        "count": 0,
+                        "total": 0.0,
+                        "max": 0.0,
+                    }
+                entry["count"] += 1
+                entry["total"] += took
+                entry["max"] = max(entry["max"], took)
+
+    def query_timings(self):
+        with self.timing_lock:
+            return {statement: dict(v) for statement, v in self.timings.items()}
+
+
+class DatabaseWriter:
+    """
+    Serialises writes to one database through a dedicated thread.
+
+    Callers queue a function and carry on; the writer thread drains whatever
+    is queued and runs it in a single transaction, so a burst of stats
+    inserts from many servers costs one commit instead of one lock
+    round-trip and fsync per insert.
+    """
+
+    max_batch = 500
+    max_queue = 10000
+
+    def __init__(self, database: peewee.SqliteDatabase, name):
+        self.database = database
+        self.name = name
+        self.writes = queue.Queue(maxsize=DatabaseWriter.max_queue)
+        self.metrics = {"batches": 0, "writes": 0, "failed": 0, "largest_batch": 0}
+        self.thread = threading.Thread(
+            target=self._run, daemon=True, name=f"db_writer_{name}"
+        )
+        self.thread.start()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """
+        Queues func(*args, **kwargs) to run on the writer thread. The returned
+        future resolves to its result once the batch it ran in committed.
+        """
+        future = Future()
+        self.writes.put((func, args, kwargs, future))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Like submit, but waits for the write and returns its result."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def queue_depth(self):
+        return self.writes.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self.writes.get()]
+            while len(batch) < DatabaseWriter.max_batch:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        results = []
+        try:
+            with self.database.atomic():
+                for func, args, kwargs, _future in batch:
+                    # a savepoint per write so one bad write doesn't take
+                    # the rest of the batch down with it
+                    try:
+                        with self.database.atomic():
+                            results.append((func(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((None, e))
+        except Exception as e:
+            logger.error(f"Database writer {self.name} failed to commit: {e}")
+            results = [(None, e)] * len(batch)
+
+        self.metrics["batches"] += 1
+        self.metrics["writes"] += len(batch)
+        self.metrics["largest_batch"] = max(self.metrics["largest_batch"], len(batch))
+        for (_func, _args, _kwargs, future), (result, error) in zip(batch, results):
+            if error is not None:
+                self.metrics["failed"] += 1
+                logger.error(f"Database write on {self.name} failed: {error}")
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class DatabaseManager(metaclass=Singleton):
+    """
+    Hands out one tuned SqliteDatabase (and one writer) per database file.
+
+    peewee keeps a connection per thread for each database object, so
+    reusing the same object gives every thread its own read connection
+    instead of opening a new one per lookup.
+    """
+
+    def __init__(self):
+        self.databases = {}
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    def get_database(self, db_path) -> peewee.SqliteDatabase:
+        db_path = os.path.abspath(db_path)
+        with self.lock:
+            if db_path not in self.databases:
+                self.databases[db_path] = TimedSqliteDatabase(
+                    db_path, pragmas=SQLITE_PRAGMAS
+                )
+            return self.databases[db_path]
+
+    def get_writer(self, database: peewee.SqliteDatabase) -> DatabaseWriter:
+        with self.lock:
+            key = database.database
+            if key not in self.writers:
+                self.writers[key] = DatabaseWriter(database, os.path.basename(str(key)))
+            return self.writers[key]
+
+    def writer_metrics(self):
+        with self.lock:
+            return {
+                name: dict(writer.metrics, queued=writer.queue_depth())
+                for name, writer in self.writers.items()
+            }
+
+    def query_metrics(self):
+        with self.lock:
+            databases = list(self.databases.items())
+        return {
+            os.path.basename(path): database.query_timings()
+            for path, database in databases
+        }
@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class DirListing(metaclass=Singleton):
+    """
+    Sorted, paginated directory listings built on os.scandir.
+
+    The entry type comes from the DirEntry itself (d_type on Linux, the
+    find data on Windows), so listing by name needs no stat calls at all;
+    only the entries of the requested page are stat'ed for their size.
+
+    The scan, sorted by name, is cached until the directory's mtime
+    changes, so paging through a world/region folder with tens of thousands
+    of files scans it once instead of once per page. Sizes and mtimes of
+    the files change without the directory's mtime changing, so sorting by
+    them is never cached: it stats every entry again on each call.
+    """
+
+    hidden = {"crafty.sqlite", "crafty_managed.txt"}
+    sort_keys = ("name", "size", "mtime")
+    max_cached = 16
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def entry_type(entry: os.DirEntry):
+        try:
+            if entry.is_dir():
+                return "dir"
+            if entry.is_file():
+                return "file"
+        except OSError:
+            pass
+        return "other"
+
+    @staticmethod
+    def stat(entry: os.DirEntry):
+        # not entry.stat(), DirEntry caches it and the scan may be old
+        try:
+            return os.stat(entry.path)
+        except OSError:
+            # dangling symlink or gone since the scan
+            return None
+
+    def entries(self, folder, sort="name", reverse=False):
+        """All entries of folder, directories first, each group sorted by sort."""
+        if sort not in DirListing.sort_keys:
+            raise ValueError(f"Unknown sort key {sort}")
+        folder = os.path.abspath(folder)
+        if sort == "name":
+            return self._by_name(folder, reverse)
+
+        attr = "st_size" if sort == "size" else "st_mtime"
+
+        def sort_key(item):
+            stat = DirListing.stat(item[0])
+            return getattr(stat, attr, 0) if stat is not None else 0
+
+        listing = self._by_name(folder, False)
+        dirs = sorted(
+            (i for i in listing if i[1] == "dir"), key=sort_key, reverse=reverse
+        )
+        files = sorted(
+            (i for i in listing if i[1] != "dir"), key=sort_key, reverse=reverse
+        )
+        return dirs + files
+
+    def _by_name(self, folder, reverse):
+        version = os.stat(folder).st_mtime_ns
+        key = (folder, reverse)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end(key)
+                return cached[1]
+
+        with os.scandir(folder) as it:
+            scanned = [
+                (entry, DirListing.entry_type(entry))
+                for entry in it
+                if entry.name not in DirListing.hidden
+            ]
+
+        def sort_key(item):
+            return item[0].name.casefold()
+
+        dirs = sorted(
+            (i for i in scanned if i[1] == "dir"), key=sort_key, reverse=reverse
+        )
+        files = sorted(
+            (i for i in scanned if i[1] != "dir"), key=sort_key, reverse=reverse
+        )
+        listing = dirs + files
+
+        with self.lock:
+            self.cache[key] = (version, listing)
+            self.cache.move_to_end(key)
+            while len(self.cache) > DirListing.max_cached:
+                self.cache.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def describe(entry: os.DirEntry, entry_type):
+        # DirEntry caches its stat, the listing may be older than the file
+        try:
+            stat = os.stat(entry.path)
+        except OSError:
+            stat = None
+        return {
+            "name": entry.name,
+            "type": entry_type,
+            "symlink": entry.is_symlink(),
+            "size": stat.st_size if stat is not None and entry_type != "dir" else None,
+            "mtime": int(stat.st_mtime) if stat is not None else None,
+        }
+
+    def page(self, folder, offset=0, limit=500, sort="name", reverse=False):
+        listing = self.entries(folder, sort, reverse)
+        return {
+            "total": len(listing),
+            "offset": offset,
+            "entries": [
+                DirListing.describe(entry, entry_type)
+                for entry, entry_type in listing[offset : offset + limit]
+            ],
+        }
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DirNode:
+    __slots__ = ("mtime", "files_size", "children", "scanned")
+
+    def __init__(self):
+        self.mtime = None
+        self.files_size = 0
+        self.children = {}
+        self.scanned = 0.0
+
+    def total(self):
+        return self.files_size + sum(c.total() for c in self.children.values())
+
+
+class DirSizeService:
+    """
+    Computes directory sizes in a background thread and caches them per subtree.
+
+    The stats path only ever reads the cached total. A directory is re-listed
+    when its mtime changed (entries were added, removed or renamed) or when its
+    cached file sizes are older than full_rescan_age, which picks up files
+    that grew in place like region files.
+    """
+
+    # how often registered roots are checked for changes
+    check_interval = 60
+    # how long file sizes inside an unchanged directory are trusted
+    full_rescan_age = 600
+    # roots that haven't been asked for in this long are dropped
+    forget_after = 3600
+
+    def __init__(self):
+        self.roots = {}
+        self.totals = {}
+        self.last_access = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def get_size(self, path: str) -> int:
+        """
+        Returns the last computed size of path in bytes, or 0 if it hasn't
+        been computed yet. Unknown paths are queued for the background thread.
+        """
+        path = os.path.normpath(path)
+        with self.lock:
+            self.last_access[path] = time.monotonic()
+            if path not in self.roots:
+                self.roots[path] = DirNode()
+                self.wakeup.set()
+            self._ensure_thread()
+            return self.totals.get(path, 0)
+
+    def invalidate(self, path: str):
+        path = os.path.normpath(path)
+        with self.lock:
+            if path in self.roots:
+                self.roots[path] = DirNode()
+                self.wakeup.set()
+
+    def _ensure_thread(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(
+                target=self._run, daemon=True, name="dir_size_service"
+            )
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.monotonic()
+            with self.lock:
+                for path, last in list(self.last_access.items()):
+                    if now - last > DirSizeService.forget_after:
+                        self.roots.pop(path, None)
+                        self.totals.pop(path, None)
+                        self.last_access.pop(path, None)
+                roots = list(self.roots.items())
+
+            for path, node in roots:
+                try:
+                    self._refresh(path, node, now)
+                    total = node.total()
+                except OSError as e:
+                    logger.debug(f"Unable to compute size of {path}: {e}")
+                    continue
+                with self.lock:
+                    # the root may have been invalidated while we were scanning
+                    if self.roots.get(path) is node:
+                        self.totals[path] = total
+
+            self.wakeup.wait(DirSizeService.check_interval)
+
+    def _refresh(self, path, node: DirNode, now):
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == node.mtime and now - node.scanned < DirSizeService.full_rescan_age:
+            # nothing was added or removed here, only descend into sub dirs
+            for name, child in list(node.children.items()):
+                try:
+                    self._refresh(os.path.join(path, name), child, now)
+                except FileNotFoundError:
+                    node.children.pop(name, None)
+            return
+
+        files_size = 0
+        children = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        child = node.children.get(entry.name) or DirNode()
+                        self._refresh(entry.path, child, now)
+                        children[entry.name] = child
+                    else:
+                        files_size += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    # removed while we were looking at it
+                    continue
+        node.mtime = mtime
+        node.files_size = files_size
+        node.children = children
+        node.scanned = now
@@ -0,0 +1,352 @@
+import os
+import json
+import stat
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import requests
+
+# fcntl is unix only, on Windows objects are always copied
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadManager:
+    """
+    Streams executable downloads into a content addressed cache.
+
+    Downloads are written in chunks to a partial file that is resumed with a
+    Range request if the connection drops (guarded by If-Range, so a file
+    that changed remotely is started over), verified against the expected
+    sha256 or md5 (when one is published) and renamed into the cache as
+    <sha256>.jar. Servers get a copy of the cached object, a reflink where
+    the filesystem supports it: never a hardlink, servers write into their
+    jars in place (uploads, the editor) and that must not reach the cache
+    or other servers. The jar is only downloaded once. The URL index keeps
+    the ETag/Last-Modified of every download so later downloads of the same
+    URL can be answered with a conditional request.
+    """
+
+    chunk_size = 1024 * 1024
+    # (connect, read) timeouts passed to requests
+    timeout = (10, 60)
+    max_retries = 5
+    # cached objects that weren't used for this long are removed
+    unused_max_age = 7 * 24 * 60 * 60
+    # linux FICLONE ioctl, makes a copy on write clone on btrfs/xfs
+    ficlone = 0x40049409
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        # held while objects are copied out of the cache or pruned
+        self.objects_lock = threading.Lock()
+
+    # **********************************************************************************
+    #                                   Public API
+    # **********************************************************************************
+    def download(
+        self,
+        url,
+        dest_path,
+        expected_sha256=None,
+        progress=None,
+        expected_md5=None,
+    ) -> bool:
+        """
+        Downloads url to dest_path. progress, if given, is called with
+        (bytes done, total bytes or None) after every chunk.
+
+        Returns True on success. dest_path is only replaced once the
+        download is complete and verified.
+        """
+        try:
+            with self._url_lock(url):
+                digest = self._fetch(url, expected_sha256, expected_md5, progress)
+                self._copy_into_place(self._object_path(digest), dest_path)
+        except (DownloadError, requests.RequestException, OSError) as e:
+            logger.error(f"Unable to download {url} to {dest_path}: {e}")
+            return False
+        self.prune()
+        return True
+
+    def prune(self):
+        """Removes cached objects that weren't used for unused_max_age."""
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except FileNotFoundError:
+            return
+        with self.objects_lock:
+            for entry in entries:
+                if not entry.name.endswith(".jar"):
+                    continue
+                try:
+                    # the mtime is touched whenever the object is used
+                    if now - entry.stat().st_mtime > self.unused_max_age:
+                        logger.info(f"Removing unused cached executable {entry.name}")
+                        os.remove(entry.path)
+                except OSError as e:
+                    logger.debug(f"Unable to prune {entry.path}: {e}")
+
+    # **********************************************************************************
+    #                                   Internals
+    # **********************************************************************************
+    def _url_lock(self, url):
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.jar")
+
+    def _part_path(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.part")
+
+    @staticmethod
+    def _remove_part(part_path):
+        for path in (part_path, part_path + ".json"):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _read_part_validator(part_path):
+        """The If-Range value a partial file may be resumed with, or None."""
+        try:
+            with open(part_path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        etag = meta.get("etag")
+        # If-Range only takes strong etags
+        if etag and not etag.startswith("W/"):
+            return etag
+        return meta.get("last_modified")
+
+    @staticmethod
+    def _write_part_validator(part_path, headers):
+        with open(part_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                },
+                f,
+            )
+
+    def _read_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_index(self, url, entry):
+        with self.lock:
+            index = self._read_index()
+            index[url] = entry
+            tmp_file = self.index_file + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=4)
+            os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def _file_sha256(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(DownloadManager.chunk_size), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def _cached(self, digest):
+        path = self._object_path(digest)
+        if not os.path.isfile(path):
+            return False
+        # never hand out a cache object that no longer matches its name
+        if DownloadManager._file_sha256(path) != digest:
+            logger.warning(f"Cached executable {path} is corrupt, removing it")
+            os.remove(path)
+            return False
+        return True
+
+    def _fetch(self, url, expected_sha256, expected_md5, progress):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        expected_md5 = expected_md5.lower() if expected_md5 else None
+        known = self._read_index().get(url, {})
+        if expected_md5 and known.get("md5") == expected_md5 and known.get("sha256"):
+            # we downloaded exactly this file before
+            expected_sha256 = expected_sha256 or known["sha256"]
+        if expected_sha256:
+            if self._cached(expected_sha256):
+                logger.info(f"Using cached executable for {url}")
+                return expected_sha256
+
+        headers = {}
+        # with a checksum given the cache lookup above is authoritative
+        if (
+            not expected_sha256
+            and not expected_md5
+            and known.get("sha256")
+            and self._cached(known["sha256"])
+        ):
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        part_path = self._part_path(url)
+        attempt = 0
+        while True:
+            try:
+                digest, md5, response_headers = self._stream(
+                    url, part_path, headers, progress
+                )
+                break
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    f"Download of {url} interrupted ({e}), "
+                    f"resuming (attempt {attempt}/{self.max_retries})"
+                )
+                time.sleep(min(2**attempt, 30))
+
+        if digest is None:
+            logger.info(f"{url} has not changed, using cached executable")
+            return known["sha256"]
+
+        if expected_sha256 and digest != expected_sha256:
+            DownloadManager._remove_part(part_path)
+            raise DownloadError(
+                f"checksum mismatch, expected {expected_sha256} got {digest}"
+            )
+        if expected_md5 and md5 != expected_md5:
+            DownloadManager._remove_part(part_path)
+            raise DownloadError(f"checksum mismatch, expected md5 {expected_md5}")
+
+        object_path = self._object_path(digest)
+        with self.objects_lock:
+            os.replace(part_path, object_path)
+            # nothing may write into a cache object
+            os.chmod(object_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        DownloadManager._remove_part(part_path)
+        self._update_index(
+            url,
+            {
+                "sha256": digest,
+                "md5": md5,
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified"),
+            },
+        )
+        return digest
+
+    def _stream(self, url, part_path, headers, progress):
+        """
+        Downloads url into part_path, continuing an existing partial file.
+        Returns (sha256, md5, response headers), or (None, None, headers) if
+        the server told us our cached copy is still current.
+        """
+        request_headers = dict(headers)
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        validator = DownloadManager._read_part_validator(part_path) if offset else None
+        if offset and validator is None:
+            # nothing to tell whether the remote file is still the same one
+            DownloadManager._remove_part(part_path)
+            offset = 0
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            # the range is only honoured if the file didn't change, else we
+            # get a 200 with the whole new file
+            request_headers["If-Range"] = validator
+
+        with requests.get(
+            url, headers=request_headers, stream=True, timeout=self.timeout
+        ) as r:
+            if r.status_code == 304:
+                return None, None, r.headers
+            if r.status_code == 416:
+                # our partial file is bigger than the remote file, start over
+                DownloadManager._remove_part(part_path)
+                raise requests.ConnectionError("partial download is invalid")
+            r.raise_for_status()
+
+            sha = hashlib.sha256()
+            md5 = hashlib.md5()
+            if offset and r.status_code == 206:
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                        sha.update(chunk)
+                        md5.update(chunk)
+                mode = "ab"
+            else:
+                # a new or changed file, or the server ignored our range:
+                # whatever we had is thrown away
+                DownloadManager._remove_part(part_path)
+                DownloadManager._write_part_validator(part_path, r.headers)
+                offset = 0
+                mode = "wb"
+
+            length = r.headers.get("Content-Length")
+            total = offset + int(length) if length and length.isdigit() else None
+            done = offset
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    sha.update(chunk)
+                    md5.update(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+                f.flush()
+                os.fsync(f.fileno())
+
+            if total is not None and done != total:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"received {done} of {total} bytes"
+                )
+            return sha.hexdigest(), md5.hexdigest(), r.headers
+
+    @staticmethod
+    def _reflink(src, dst):
+        """Clones src into dst where the filesystem can, returns whether it did."""
+        if fcntl is None:
+            return False
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            try:
+                fcntl.ioctl(d.fileno(), DownloadManager.ficlone, s.fileno())
+                return True
+            except OSError:
+                return False
+
+    def _copy_into_place(self, object_path, dest_path):
+        dest_dir = os.path.dirname(os.path.abspath(dest_path))
+        os.makedirs(dest_dir, exist_ok=True)
+        tmp_path = os.path.join(dest_dir, f".{os.path.basename(dest_path)}.tmp")
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        with self.objects_lock:
+            if not DownloadManager._reflink(object_path, tmp_path):
+                shutil.copyfile(object_path, tmp_path)
+            # keeps the object from being pruned while it's in use
+            os.utime(object_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
@@ -0,0 +1,218 @@
+import os
+import codecs
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FileConflictError(Exception):
+    """The file changed since the client read it."""
+
+    def __init__(self, current_sha256):
+        super().__init__("File was changed by someone else")
+        self.current_sha256 = current_sha256
+
+
+class FileEditor:
+    """
+    Reads and writes files for the web editor without holding whole files
+    in memory.
+
+    Reads return windows (max_window bytes unless asked otherwise), cut at
+    utf-8 character boundaries. Writes replace a byte range; when the length
+    doesn't change the bytes are overwritten in place, otherwise the file
+    is rewritten into a temporary file next to it by copying around the
+    range, then swapped in. Clients send the sha256 they read the file at,
+    a write against a file that changed since then is refused.
+
+    Everything in here blocks, handlers run it in the executor.
+    """
+
+    max_window = 4 * 1024 * 1024
+    copy_chunk = 1024 * 1024
+    sniff_bytes = 8192
+    max_hashes = 256
+
+    hash_lock = threading.Lock()
+    # path -> ((size, mtime_ns, inode), sha256), hashing 300 MB takes a while
+    hashes = {}
+    write_locks = {}
+
+    @staticmethod
+    def _version(stat: os.stat_result):
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    @staticmethod
+    def sha256(path):
+        path = os.path.abspath(path)
+        version = FileEditor._version(os.stat(path))
+        with FileEditor.hash_lock:
+            cached = FileEditor.hashes.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(FileEditor.copy_chunk), b""):
+                digest.update(chunk)
+        with FileEditor.hash_lock:
+            if len(FileEditor.hashes) >= FileEditor.max_hashes:
+                FileEditor.hashes.clear()
+            FileEditor.hashes[path] = (version, digest.hexdigest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _write_lock(path):
+        with FileEditor.hash_lock:
+            return FileEditor.write_locks.setdefault(
+                os.path.abspath(path), threading.Lock()
+            )
+
+    @staticmethod
+    def is_binary(path):
+        with open(path, "rb") as f:
+            head = f.read(FileEditor.sniff_bytes)
+        if b"\0" in head:
+            return True
+        try:
+            # final=False, the sample may end in the middle of a character
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        except UnicodeDecodeError:
+            return True
+        return False
+
+    # **********************************************************************************
+    #                                   Reading
+    # **********************************************************************************
+    @staticmethod
+    def _char_start(data, index):
+        """Moves index forward past utf-8 continuation bytes."""
+        while index < len(data) and 0x80 <= data[index] < 0xC0:
+            index += 1
+        return index
+
+    @staticmethod
+    def _char_end(data):
+        """Length of data without a trailing incomplete utf-8 character."""
+        end = len(data)
+        # a character is at most 4 bytes, look back at most 3
+        for back in range(1, min(4, end) + 1):
+            byte = data[end - back]
+            if byte < 0x80:
+                return end
+            if byte >= 0xC0:
+                needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                return end if back >= needed else end - back
+        return end
+
+    @staticmethod
+    def read_window(path, offset=0, length=None, with_hash=False):
+        """
+        Up to length bytes of text from offset. offset and next_offset are
+        byte offsets that always fall on character boundaries.
+        """
+        length = length or FileEditor.max_window
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # read a few bytes more so a character cut at either end can be fixed
+            start = max(min(offset, size) - 3, 0)
+            f.seek(start)
+            data = f.read(length + (offset - start) + 3)
+        skip = FileEditor._char_start(data, min(offset, size) - start)
+        data = data[skip:]
+        at_end = start + skip + len(data) >= size
+        if len(data) > length:
+            data = data[:length]
+            at_end = False
+        if not at_end:
+            data = data[: FileEditor._char_end(data)]
+        window_start = start + skip
+        return {
+            "offset": window_start,
+            "next_offset": window_start + len(data),
+            "size": size,
+            "eof": window_start + len(data) >= size,
+            "content": data.decode("utf-8", errors="replace"),
+            "sha256": FileEditor.sha256(path) if with_hash else None,
+        }
+
+    # **********************************************************************************
+    #                                   Writing
+    # **********************************************************************************
+    @staticmethod
+    def _check_version(path, expected_sha256):
+        if expected_sha256:
+            current = FileEditor.sha256(path)
+            if current != expected_sha256:
+                raise FileConflictError(current)
+
+    @staticmethod
+    def write_range(path, offset, length, data: bytes, expected_sha256=None):
+        """
+        Replaces length bytes at offset with data and returns the new size
+        and sha256 of the file.
+        """
+        with FileEditor._write_lock(path):
+            FileEditor._check_version(path, expected_sha256)
+            size = os.path.getsize(path)
+            if offset < 0 or length < 0 or offset + length > size:
+                raise ValueError("Range is outside of the file")
+
+            if len(data) == length:
+                with open(path, "r+b") as f:
+                    f.seek(offset)
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                FileEditor._rewrite(
+                    path,
+                    lambda src, dst: FileEditor._copy_around(
+                        src, dst, offset, length, data
+                    ),
+                )
+            return {"size": os.path.getsize(path), "sha256": FileEditor.sha256(path)}
+
+    @staticmethod
+    def save(path, content: str, expected_sha256=None):
+        """Replaces the whole file, atomically."""
+        data = content.encode("utf-8")
+        with FileEditor._write_lock(path):
+            FileEditor._check_version(path, expected_sha256)
+            FileEditor._rewrite(path, lambda _src, dst: dst.write(data))
+            return {"size": len(data), "sha256": FileEditor.sha256(path)}
+
+    @staticmethod
+    def _copy_around(src, dst, offset, length, data):
+        remaining = offset
+        while remaining > 0:
+            chunk = src.read(min(FileEditor.copy_chunk, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+        dst.write(data)
+        src.seek(offset + length)
+        for chunk in iter(lambda: src.read(FileEditor.copy_chunk), b""):
+            dst.write(chunk)
+
+    @staticmethod
+    def _rewrite(path, fill):
+        folder = os.path.dirname(os.path.abspath(path))
+        mode = os.stat(path).st_mode
+        fd, tmp_path = tempfile.mkstemp(
+            dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                fill(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.chmod(tmp_path, mode & 0o7777)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -2,18 +2,19 @@ import os
 import shutil
 import logging
 import pathlib
-import tempfile
-import zipfile
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.console import Console
+from app.classes.shared.progress_tracker import ProgressRegistry
+from app.classes.shared.zip_extractor import ZipExtractor
 
 logger = logging.getLogger(__name__)
 
 
 class FileHelpers:
     allowed_quotes = ['"', "'", "`"]
+    copy_chunk_size = 1024 * 1024
 
     def __init__(self, helper):
         self.helper: Helpers = helper
@@ -55,237 +56,259 @@ class FileHelpers:
         shutil.copy(src_path, dest_path)
 
     @staticmethod
-    def move_dir(src_path, dest_path):
-        FileHelpers.copy_dir(src_path, dest_path)
+    def same_device(src_path, dest_path):
+        # dest usually doesn't exist yet, so we look at the directory it goes in
+        dest_parent = os.path.dirname(os.path.abspath(dest_path))
+        try:
+            return os.stat(src_path).st_dev == os.stat(dest_parent).st_dev
+        except OSError:
+            return False
+
+    @staticmethod
+    def copy_file_progress(src_path, dest_path, progress=None):
+        """
+        Copies a file in chunks, calling progress with the number of bytes
+        written after every chunk. Metadata is copied like shutil.copy2.
+        """
+        if progress is None:
+            return shutil.copy2(src_path, dest_path)
+        with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+            while True:
+                chunk = src.read(FileHelpers.copy_chunk_size)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                progress(len(chunk))
+        shutil.copystat(src_path, dest_path)
+        return dest_path
+
+    @staticmethod
+    def move_dir(src_path, dest_path, progress=None):
+        """
+        Moves a directory. This is a rename when src and dest are on the same
+        device, otherwise the tree is copied and then deleted. progress, if
+        given, is called with (bytes copied, total bytes) during a copy.
+        """
+        if not os.path.exists(dest_path) and FileHelpers.same_device(
+            src_path, dest_path
+        ):
+            try:
+                os.replace(src_path, dest_path)
+                return
+            except OSError as e:
+                logger.debug(f"Rename of {src_path} failed, copying instead: {e}")
+
+        total = Helpers.get_dir_size(src_path) if progress else 0
+        copied = 0
+
+        def copy_function(src, dest):
+            def file_progress(written):
+                nonlocal copied
+                copied += written
+                progress(copied, total)
+
+            return FileHelpers.copy_file_progress(
+                src, dest, file_progress if progress else None
+            )
+
+        shutil.copytree(src_path, dest_path, copy_function=copy_function)
         FileHelpers.del_dirs(src_path)
 
     @staticmethod
-    def move_file(src_path, dest_path):
-        FileHelpers.copy_file(src_path, dest_path)
+    def move_file(src_path, dest_path, progress=None):
+        """
+        Moves a file, renaming it when src and dest are on the same device.
+        Like shutil.copy, dest may be a directory to move the file into.
+        """
+        if os.path.isdir(dest_path):
+            dest_path = os.path.join(dest_path, os.path.basename(src_path))
+        if FileHelpers.same_device(src_path, dest_path):
+            try:
+                os.replace(src_path, dest_path)
+                return
+            except OSError as e:
+                logger.debug(f"Rename of {src_path} failed, copying instead: {e}")
+
+        total = os.path.getsize(src_path) if progress else 0
+        copied = 0
+
+        def file_progress(written):
+            nonlocal copied
+            copied += written
+            progress(copied, total)
+
+        FileHelpers.copy_file_progress(
+            src_path, dest_path, file_progress if progress else None
+        )
         FileHelpers.del_file(src_path)
 
     @staticmethod
-    def make_archive(path_to_destination, path_to_zip):
+    def path_size(path):
+        if os.path.isdir(path):
+            return Helpers.get_dir_size(path)
+        return os.path.getsize(path)
+
+    @staticmethod
+    def move_with_progress(src_path, dest_path, tracker=None, size=None):
+        """
+        move_dir/move_file reporting to a ProgressTracker: bytes while a copy
+        runs, and the whole item at once when the move was a rename. size is
+        what the item was counted as in the tracker's totals.
+        """
+        move = (
+            FileHelpers.move_dir if os.path.isdir(src_path) else FileHelpers.move_file
+        )
+        if tracker is None:
+            move(src_path, dest_path)
+            return
+        if size is None:
+            size = FileHelpers.path_size(src_path)
+        name = os.path.basename(src_path)
+        reported = 0
+
+        def progress(copied, _total):
+            nonlocal reported
+            tracker.advance(copied - reported, files=0, current_file=name)
+            reported = copied
+
+        move(src_path, dest_path, progress)
+        tracker.advance(max(size - reported, 0), current_file=name)
+
+    @staticmethod
+    def archive_entries(path_to_zip, excluded_dirs=None, skip_names=()):
+        """
+        Walks the tree once and returns (path, archive name, size) for every
+        file that goes into an archive of path_to_zip.
+        """
+        ex_replace = [p.replace("\\", "/") for p in excluded_dirs or []]
+        ziproot = path_to_zip
+        entries = []
+        for root, dirs, files in os.walk(path_to_zip, topdown=True):
+            dirs[:] = [
+                l_dir
+                for l_dir in dirs
+                if str(os.path.join(root, l_dir)).replace("\\", "/") not in ex_replace
+            ]
+            for file in files:
+                full_path = os.path.join(root, file)
+                if (
+                    str(full_path).replace("\\", "/") in ex_replace
+                    or file in skip_names
+                ):
+                    continue
+                if os.name == "nt":
+                    arcname = os.path.join(root.replace(ziproot, ""), file)
+                else:
+                    arcname = os.path.join(root.replace(ziproot, "/"), file)
+                try:
+                    size = os.stat(full_path).st_size
+                except OSError:
+                    size = 0
+                entries.append((full_path, arcname, size))
+        return entries
+
+    @staticmethod
+    def write_archive(path_to_destination, entries, compression, tracker=None):
+        """
+        Writes entries from archive_entries into a zip file, advancing the
+        tracker as files are written.
+        """
+        if tracker is not None:
+            tracker.start(sum(e[2] for e in entries), len(entries))
+        with ZipFile(path_to_destination, "w", compression) as zip_file:
+            for full_path, arcname, size in entries:
+                try:
+                    logger.info(f"archiving: {full_path}")
+                    zip_file.write(full_path, arcname)
+                except Exception as e:
+                    logger.warning(f"Error archiving: {full_path}! - Error was: {e}")
+                if tracker is not None:
+                    tracker.advance(size, current_file=arcname)
+        if tracker is not None:
+            tracker.finish()
+        return True
+
+    @staticmethod
+    def make_archive(path_to_destination, path_to_zip, tracker=None):
         # create a ZipFile object
         path_to_destination += ".zip"
-        with ZipFile(path_to_destination, "w") as zip_file:
-            for root, _dirs, files in os.walk(path_to_zip, topdown=True):
-                ziproot = path_to_zip
-                for file in files:
-                    try:
-                        logger.info(f"backing up: {os.path.join(root, file)}")
-                        if os.name == "nt":
-                            zip_file.write(
-                                os.path.join(root, file),
-                                os.path.join(root.replace(ziproot, ""), file),
-                            )
-                        else:
-                            zip_file.write(
-                                os.path.join(root, file),
-                                os.path.join(root.replace(ziproot, "/"), file),
-                            )
-
-                    except Exception as e:
-                        logger.warning(
-                            f"Error backing up: {os.path.join(root, file)}!"
-                            f" - Error was: {e}"
-                        )
-        return True
+        return FileHelpers.write_archive(
+            path_to_destination,
+            FileHelpers.archive_entries(path_to_zip),
+            ZIP_STORED,
+            tracker,
+        )
 
     @staticmethod
-    def make_compressed_archive(path_to_destination, path_to_zip):
+    def make_compressed_archive(path_to_destination, path_to_zip, tracker=None):
         # create a ZipFile object
         path_to_destination += ".zip"
-        with ZipFile(path_to_destination, "w", ZIP_DEFLATED) as zip_file:
-            for root, _dirs, files in os.walk(path_to_zip, topdown=True):
-                ziproot = path_to_zip
-                for file in files:
-                    try:
-                        logger.info(f"packaging: {os.path.join(root, file)}")
-                        if os.name == "nt":
-                            zip_file.write(
-                                os.path.join(root, file),
-                                os.path.join(root.replace(ziproot, ""), file),
-                            )
-                        else:
-                            zip_file.write(
-                                os.path.join(root, file),
-                                os.path.join(root.replace(ziproot, "/"), file),
-                            )
-
-                    except Exception as e:
-                        logger.warning(
-                            f"Error packaging: {os.path.join(root, file)}!"
-                            f" - Error was: {e}"
-                        )
+        return FileHelpers.write_archive(
+            path_to_destination,
+            FileHelpers.archive_entries(path_to_zip),
+            ZIP_DEFLATED,
+            tracker,
+        )
 
-        return True
+    @staticmethod
+    def backup_results(results):
+        """
+        backup_status has always sent the size of the backup as total_files,
+        the number of files is in file_count.
+        """
+        results = dict(results)
+        results["file_count"] = results.get("total_files", 0)
+        results["total_files"] = Helpers.human_readable_file_size(
+            results.get("total_bytes", 0)
+        )
+        return results
+
+    def backup_tracker(self, server_id):
+        def broadcast(results):
+            self.helper.websocket_helper.broadcast_page_params(
+                "/panel/server_detail",
+                {"id": str(server_id)},
+                "backup_status",
+                FileHelpers.backup_results(results),
+            )
+
+        return ProgressRegistry().create(("backup", str(server_id)), broadcast)
 
     def make_compressed_backup(
         self, path_to_destination, path_to_zip, excluded_dirs, server_id
     ):
         # create a ZipFile object
         path_to_destination += ".zip"
-        ex_replace = [p.replace("\\", "/") for p in excluded_dirs]
-        total_bytes = 0
-        dir_bytes = Helpers.get_dir_size(path_to_zip)
-        results = {
-            "percent": 0,
-            "total_files": self.helper.human_readable_file_size(dir_bytes),
-        }
-        self.helper.websocket_helper.broadcast_page_params(
-            "/panel/server_detail",
-            {"id": str(server_id)},
-            "backup_status",
-            results,
+        entries = FileHelpers.archive_entries(
+            path_to_zip, excluded_dirs, skip_names=("crafty.sqlite",)
         )
-        with ZipFile(path_to_destination, "w", ZIP_DEFLATED) as zip_file:
-            for root, dirs, files in os.walk(path_to_zip, topdown=True):
-                for l_dir in dirs:
-                    if str(os.path.join(root, l_dir)).replace("\\", "/") in ex_replace:
-                        dirs.remove(l_dir)
-                ziproot = path_to_zip
-                for file in files:
-                    if (
-                        str(os.path.join(root, file)).replace("\\", "/")
-                        not in ex_replace
-                        and file != "crafty.sqlite"
-                    ):
-                        try:
-                            logger.info(f"backing up: {os.path.join(root, file)}")
-                            if os.name == "nt":
-                                zip_file.write(
-                                    os.path.join(root, file),
-                                    os.path.join(root.replace(ziproot, ""), file),
-                                )
-                            else:
-                                zip_file.write(
-                                    os.path.join(root, file),
-                                    os.path.join(root.replace(ziproot, "/"), file),
-                                )
-
-                        except Exception as e:
-                            logger.warning(
-                                f"Error backing up: {os.path.join(root, file)}!"
-                                f" - Error was: {e}"
-                            )
-                    total_bytes += os.path.getsize(os.path.join(root, file))
-                    percent = round((total_bytes / dir_bytes) * 100, 2)
-                    results = {
-                        "percent": percent,
-                        "total_files": self.helper.human_readable_file_size(dir_bytes),
-                    }
-                    self.helper.websocket_helper.broadcast_page_params(
-                        "/panel/server_detail",
-                        {"id": str(server_id)},
-                        "backup_status",
-                        results,
-                    )
-
+        tracker = self.backup_tracker(server_id)
+        FileHelpers.write_archive(path_to_destination, entries, ZIP_DEFLATED, tracker)
+        ProgressRegistry().publish(tracker)
         return True
 
     def make_backup(self, path_to_destination, path_to_zip, excluded_dirs, server_id):
         # create a ZipFile object
         path_to_destination += ".zip"
-        ex_replace = [p.replace("\\", "/") for p in excluded_dirs]
-        total_bytes = 0
-        dir_bytes = Helpers.get_dir_size(path_to_zip)
-        results = {
-            "percent": 0,
-            "total_files": self.helper.human_readable_file_size(dir_bytes),
-        }
-        self.helper.websocket_helper.broadcast_page_params(
-            "/panel/server_detail",
-            {"id": str(server_id)},
-            "backup_status",
-            results,
+        entries = FileHelpers.archive_entries(
+            path_to_zip, excluded_dirs, skip_names=("crafty.sqlite",)
         )
-        with ZipFile(path_to_destination, "w") as zip_file:
-            for root, dirs, files in os.walk(path_to_zip, topdown=True):
-                for l_dir in dirs:
-                    if str(os.path.join(root, l_dir)).replace("\\", "/") in ex_replace:
-                        dirs.remove(l_dir)
-                ziproot = path_to_zip
-                for file in files:
-                    if (
-                        str(os.path.join(root, file)).replace("\\", "/")
-                        not in ex_replace
-                        and file != "crafty.sqlite"
-                    ):
-                        try:
-                            logger.info(f"backing up: {os.path.join(root, file)}")
-                            if os.name == "nt":
-                                zip_file.write(
-                                    os.path.join(root, file),
-                                    os.path.join(root.replace(ziproot, ""), file),
-                                )
-                            else:
-                                zip_file.write(
-                                    os.path.join(root, file),
-                                    os.path.join(root.replace(ziproot, "/"), file),
-                                )
-
-                        except Exception as e:
-                            logger.warning(
-                                f"Error backing up: {os.path.join(root, file)}!"
-                                f" - Error was: {e}"
-                            )
-                    total_bytes += os.path.getsize(os.path.join(root, file))
-                    percent = round((total_bytes / dir_bytes) * 100, 2)
-                    results = {
-                        "percent": percent,
-                        "total_files": self.helper.human_readable_file_size(dir_bytes),
-                    }
-                    self.helper.websocket_helper.broadcast_page_params(
-                        "/panel/server_detail",
-                        {"id": str(server_id)},
-                        "backup_status",
-                        results,
-                    )
+        tracker = self.backup_tracker(server_id)
+        FileHelpers.write_archive(path_to_destination, entries, ZIP_STORED, tracker)
+        ProgressRegistry().publish(tracker)
         return True
 
     @staticmethod
     def unzip_file(zip_path):
-        new_dir_list = zip_path.split("/")
-        new_dir = ""
-        for i in range(len(new_dir_list) - 1):
-            if i == 0:
-                new_dir += new_dir_list[i]
-            else:
-                new_dir += "/" + new_dir_list[i]
+        new_dir = os.path.dirname(zip_path)
 
         if Helpers.check_file_perms(zip_path) and os.path.isfile(zip_path):
             Helpers.ensure_dir_exists(new_dir)
-            temp_dir = tempfile.mkdtemp()
             try:
-                with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                for i in enumerate(zip_ref.filelist):
-                    if len(zip_ref.filelist) > 1 or not zip_ref.filelist[
-                        i
-                    ].filename.endswith("/"):
-                        break
-
-                full_root_path = temp_dir
-
-                for item in os.listdir(full_root_path):
-                    if os.path.isdir(os.path.join(full_root_path, item)):
-                        try:
-                            FileHelpers.move_dir(
-                                os.path.join(full_root_path, item),
-                                os.path.join(new_dir, item),
-                            )
-                        except Exception as ex:
-                            logger.error(f"ERROR IN ZIP IMPORT: {ex}")
-                    else:
-                        try:
-                            FileHelpers.move_file(
-                                os.path.join(full_root_path, item),
-                                os.path.join(new_dir, item),
-                            )
-                        except Exception as ex:
-                            logger.error(f"ERROR IN ZIP IMPORT: {ex}")
+                # members are written straight next to the archive
+                ZipExtractor(zip_path, new_dir).extract()
             except Exception as ex:
+                logger.error(f"ERROR IN ZIP EXTRACT: {ex}")
                 Console.error(ex)
         else:
             return "false"
@@ -4,12 +4,14 @@ import re
 import sys
 import json
 import tempfile
+import threading
 import time
 import uuid
 import string
 import base64
 import socket
 import secrets
+import shutil
 import logging
 import html
 import zipfile
@@ -23,8 +25,12 @@ from contextlib import redirect_stderr, suppress
 
 from app.classes.shared.null_writer import NullWriter
 from app.classes.shared.console import Console
+from app.classes.shared.dir_listing import DirListing
+from app.classes.shared.download_manager import DownloadManager
 from app.classes.shared.installer import installer
+from app.classes.shared.log_reader import LogReader
 from app.classes.shared.translation import Translation
+from app.classes.shared.zip_extractor import ZipExtractor
 from app.classes.web.websocket_helper import WebSocketHelper
 
 with redirect_stderr(NullWriter()):
@@ -58,6 +64,9 @@ class Helpers:
         self.config_dir = os.path.join(self.root_dir, "app", "config")
         self.webroot = os.path.join(self.root_dir, "app", "frontend")
         self.servers_dir = os.path.join(self.root_dir, "servers")
+        # archives are extracted here so importing them is a rename into
+        # servers_dir rather than another copy
+        self.import_dir = os.path.join(self.servers_dir, "import")
         self.backup_path = os.path.join(self.root_dir, "backups")
         self.migration_dir = os.path.join(self.root_dir, "app", "migrations")
 
@@ -70,6 +79,9 @@ class Helpers:
         )
         self.serverjar_cache = os.path.join(self.config_dir, "serverjars.json")
         self.credits_cache = os.path.join(self.config_dir, "credits.json")
+        self.download_manager = DownloadManager(
+            os.path.join(self.config_dir, "jar_cache")
+        )
         self.passhasher = PasswordHasher()
         self.exiting = False
 
@@ -453,36 +465,14 @@ class Helpers:
             logger.warning(f"Unable to find file to tail: {file_name}")
             return [f"Unable to find file to tail: {file_name}"]
 
-        # length of lines is X char here
-        avg_line_length = 255
-
-        # create our buffer number - number of lines * avg_line_length
-        line_buffer = number_lines * avg_line_length
-
-        # open our file
-        with open(file_name, "r", encoding="utf-8") as f:
-
-            # seek
-            f.seek(0, 2)
-
-            # get file size
-            fsize = f.tell()
-
-            # set pos @ last n chars
-            # (buffer from above = number of lines * avg_line_length)
-            f.seek(max(fsize - line_buffer, 0), 0)
-
-            # read file til the end
-            try:
-                lines = f.readlines()
-
-            except Exception as e:
-                logger.warning(
-                    f"Unable to read a line in the file:{file_name} - due to error: {e}"
-                )
+        try:
+            lines = LogReader.tail(file_name, number_lines).lines
+        except OSError as e:
+            logger.warning(f"Unable to read the file:{file_name} - due to error: {e}")
+            return []
 
-        # now we are done getting the lines, let's return it
-        return lines
+        # callers expect the lines as readlines() returns them
+        return [f"{line}\n" for line in lines]
 
     @staticmethod
     def check_writeable(path: str):
@@ -545,28 +535,6 @@ class Helpers:
         now = datetime.now()
         return now.strftime("%m/%d/%Y, %H:%M:%S")
 
-    @staticmethod
-    def calc_percent(source_path, dest_path):
-        # calculates percentable of zip from drive. Not with compression.
-        # (For backups and support logs)
-        source_size = 0
-        files_count = 0
-        for path, _dirs, files in os.walk(source_path):
-            for file in files:
-                full_path = os.path.join(path, file)
-                source_size += os.stat(full_path).st_size
-                files_count += 1
-        try:
-            dest_size = os.path.getsize(str(dest_path))
-            percent = round((dest_size / source_size) * 100, 1)
-        except:
-            percent = 0
-        if percent >= 0:
-            results = {"percent": percent, "total_files": files_count}
-        else:
-            results = {"percent": 0, "total_files": files_count}
-        return results
-
     @staticmethod
     def check_file_exists(path: str):
         logger.debug(f"Looking for path: {path}")
@@ -845,80 +813,42 @@ class Helpers:
         return data
 
     @staticmethod
-    def generate_tree(folder, output=""):
-        dir_list = []
-        unsorted_files = []
-        file_list = os.listdir(folder)
-        for item in file_list:
-            if os.path.isdir(os.path.join(folder, item)):
-                dir_list.append(item)
-            elif str(item) != "crafty.sqlite":
-                unsorted_files.append(item)
-        file_list = sorted(dir_list, key=str.casefold) + sorted(
-            unsorted_files, key=str.casefold
-        )
-        for raw_filename in file_list:
-            filename = html.escape(raw_filename)
-            rel = os.path.join(folder, raw_filename)
+    def tree_items(folder, dir_suffix=""):
+        items = []
+        for entry, entry_type in DirListing().entries(folder):
+            filename = html.escape(entry.name)
             dpath = os.path.join(folder, filename)
-            if os.path.isdir(rel):
-                output += f"""<li class="tree-item" data-path="{dpath}">
+            if entry_type == "dir":
+                items.append(f"""<li class="tree-item" data-path="{dpath}">
                     \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
                     <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
                       <i style="color: #8862e0;" class="far fa-folder"></i>
                       <i style="color: #8862e0;" class="far fa-folder-open"></i>
                       {filename}
                       </span>
-                    </div><li>
-                    \n"""
+                    </div><li>{dir_suffix}""")
             else:
-                if filename != "crafty_managed.txt":
-                    output += f"""<li
+                items.append(f"""<li
                     class="d-block tree-ctx-item tree-file tree-item"
                     data-path="{dpath}"
                     data-name="{filename}"
                     onclick="clickOnFile(event)"><span style="margin-right: 6px;">
-                    <i class="far fa-file"></i></span>{filename}</li>"""
-        return output
+                    <i class="far fa-file"></i></span>{filename}</li>""")
+        return items
 
     @staticmethod
-    def generate_dir(folder, output=""):
+    def generate_tree(folder, output=""):
+        return output + "".join(Helpers.tree_items(folder, "\n                    \n"))
 
-        dir_list = []
-        unsorted_files = []
-        file_list = os.listdir(folder)
-        for item in file_list:
-            if os.path.isdir(os.path.join(folder, item)):
-                dir_list.append(item)
-            elif str(item) != "crafty.sqlite":
-                unsorted_files.append(item)
-        file_list = sorted(dir_list, key=str.casefold) + sorted(
-            unsorted_files, key=str.casefold
+    @staticmethod
+    def generate_dir(folder, output=""):
+        items = Helpers.tree_items(folder)
+        return (
+            output
+            + f"""<ul class="tree-nested d-block" id="{folder}ul">"""
+            + "".join(items)
+            + "</ul>\n"
         )
-        output += f"""<ul class="tree-nested d-block" id="{folder}ul">"""
-        for raw_filename in file_list:
-            filename = html.escape(raw_filename)
-            dpath = os.path.join(folder, filename)
-            rel = os.path.join(folder, raw_filename)
-            if os.path.isdir(rel):
-                output += f"""<li class="tree-item" data-path="{dpath}">
-                    \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
-                    <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
-                      <i style="color: #8862e0;" class="far fa-folder"></i>
-                      <i style="color: #8862e0;" class="far fa-folder-open"></i>
-                      {filename}
-                      </span>
-                    </div><li>"""
-            else:
-                if filename != "crafty_managed.txt":
-                    output += f"""<li
-                    class="d-block tree-ctx-item tree-file tree-item"
-                    data-path="{dpath}"
-                    data-name="{filename}"
-                    onclick="clickOnFile(event)"><span style="margin-right: 6px;">
-                    <i class="far fa-file"></i></span>{filename}</li>"""
-        output += "</ul>\n"
-        return output
 
     @staticmethod
     def generate_zip_tree(folder, output=""):
@@ -965,32 +895,94 @@ class Helpers:
 
     def unzip_server(self, zip_path, user_id):
         if Helpers.check_file_perms(zip_path):
-            temp_dir = tempfile.mkdtemp()
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                # extracts archive to temp directory
-                zip_ref.extractall(temp_dir)
-            if user_id:
+            threading.Thread(
+                target=self.a_unzip_server,
+                daemon=True,
+                name="unzip_server",
+                args=(zip_path, user_id),
+            ).start()
+
+    def a_unzip_server(self, zip_path, user_id):
+        last_percent = -1
+        extracted = False
+
+        def progress(done, total):
+            nonlocal last_percent
+            percent = int(done / total * 100) if total else 100
+            if user_id and percent != last_percent:
+                last_percent = percent
                 self.websocket_helper.broadcast_user(
-                    user_id, "send_temp_path", {"path": temp_dir}
+                    user_id, "unzip_status", {"percent": percent}
                 )
 
+        self.prepare_import_dir()
+        temp_dir = tempfile.mkdtemp(dir=self.import_dir)
+        try:
+            ZipExtractor(zip_path, temp_dir, progress).extract()
+            extracted = True
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            logger.error(f"Unable to extract {zip_path}: {e}")
+            return
+        finally:
+            # on success the import removes it once the files are moved out
+            if not extracted:
+                self.remove_import_dir(temp_dir)
+        if user_id:
+            self.websocket_helper.broadcast_user(
+                user_id, "send_temp_path", {"path": temp_dir}
+            )
+
     def backup_select(self, path, user_id):
         if user_id:
             self.websocket_helper.broadcast_user(
                 user_id, "send_temp_path", {"path": path}
             )
 
-    @staticmethod
-    def unzip_backup_archive(backup_path, zip_name):
+    def unzip_backup_archive(self, backup_path, zip_name):
         zip_path = os.path.join(backup_path, zip_name)
         if Helpers.check_file_perms(zip_path):
-            temp_dir = tempfile.mkdtemp()
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            self.prepare_import_dir()
+            temp_dir = tempfile.mkdtemp(dir=self.import_dir)
+            extracted = False
+            try:
                 # extracts archive to temp directory
-                zip_ref.extractall(temp_dir)
+                ZipExtractor(zip_path, temp_dir).extract()
+                extracted = True
+            finally:
+                if not extracted:
+                    self.remove_import_dir(temp_dir)
             return temp_dir
         return False
 
+    # extractions nobody imported are removed after this
+    import_max_age = 24 * 60 * 60
+
+    def prepare_import_dir(self):
+        """Creates the import dir and removes abandoned extractions from it."""
+        self.ensure_dir_exists(self.import_dir)
+        now = time.time()
+        for entry in os.scandir(self.import_dir):
+            try:
+                if now - entry.stat().st_mtime > Helpers.import_max_age:
+                    logger.info(f"Removing abandoned import {entry.path}")
+                    self.remove_import_dir(entry.path)
+            except OSError as e:
+                logger.debug(f"Unable to check {entry.path}: {e}")
+
+    def remove_import_dir(self, path):
+        """
+        Removes the temporary extraction path belongs to. Paths outside the
+        import dir (a server imported from where it lies) are left alone.
+        """
+        import_dir = os.path.abspath(self.import_dir)
+        path = os.path.abspath(path)
+        if path == import_dir or not Helpers.in_path(import_dir, path):
+            return
+        top = os.path.join(
+            import_dir, os.path.relpath(path, import_dir).split(os.sep)[0]
+        )
+        shutil.rmtree(top, ignore_errors=True)
+
     @staticmethod
     def in_path(parent_path, child_path):
         # Smooth out relative path names, note: if you are concerned about
@@ -1007,24 +999,23 @@ class Helpers:
             [parent_path, child_path]
         )
 
-    @staticmethod
-    def download_file(executable_url, jar_path):
-        try:
-            response = requests.get(executable_url, timeout=5)
-        except Exception as ex:
-            logger.error("Could not download executable: %s", ex)
-            return False
-        if response.status_code != 200:
-            logger.error("Unable to download file from %s", executable_url)
-            return False
-
-        try:
-            with open(jar_path, "wb") as jar_file:
-                jar_file.write(response.content)
-        except Exception as e:
-            logger.error("Unable to finish executable download. Error: %s", e)
-            return False
-        return True
+    def download_file(
+        self,
+        executable_url,
+        jar_path,
+        progress=None,
+        expected_sha256=None,
+        expected_md5=None,
+    ):
+        # streams into the shared jar cache and copies the result into place,
+        # pass the published checksum when there is one
+        return self.download_manager.download(
+            executable_url,
+            jar_path,
+            expected_sha256=expected_sha256,
+            progress=progress,
+            expected_md5=expected_md5,
+        )
 
     @staticmethod
     def remove_prefix(text, prefix):
@@ -0,0 +1,273 @@
+from contextlib import redirect_stderr
+import time
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from app.classes.shared.helpers import Helpers
+from app.classes.shared.null_writer import NullWriter
+from app.classes.shared.singleton import Singleton
+
+with redirect_stderr(NullWriter()):
+    import psutil
+
+logger = logging.getLogger(__name__)
+
+
+class HostSampler(metaclass=Singleton):
+    """
+    Samples host cpu, memory and disk usage on its own thread and keeps the
+    latest values in memory.
+
+    CPU usage is the delta since the previous sample (cpu_percent with
+    interval=None), so sampling never sleeps. Disks are refreshed less often
+    on a separate pool: listing the mounts and the usage of all mounts run
+    in parallel under disk_timeout. A mount that hangs (a stale network
+    share for example) is skipped until its pending call returns instead of
+    blocking the whole sample, and a listing that hangs reuses the last one.
+
+    Subscribers are called with the latest snapshot whenever cpu or memory
+    usage changed. Between two calls of take_average() the samples are
+    accumulated, so the history written to the database is the average over
+    the recording interval, not whatever the last sample happened to be.
+    """
+
+    # never stat these, they can hang for as long as the remote end is gone
+    network_fs = {
+        "nfs",
+        "nfs4",
+        "cifs",
+        "smbfs",
+        "smb3",
+        "fuse.sshfs",
+        "sshfs",
+        "9p",
+        "afs",
+        "ceph",
+        "glusterfs",
+        "fuse.glusterfs",
+        "davfs",
+        "fuse.rclone",
+    }
+
+    def __init__(self, helper=None):
+        self.helper: Helpers = helper if helper is not None else Helpers()
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.latest = None
+        self.disk_data = []
+        self.disk_refreshed = 0
+        self.pending_mounts = {}
+        self.pending_listing = None
+        self.known_mounts = []
+        self.disk_pool = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="host_disk_usage"
+        )
+        self.accumulated = {"samples": 0, "cpu_usage": 0.0, "mem_percent": 0.0}
+        self.thread = None
+        self.interval = 1.0
+        self.disk_refresh = 60.0
+        self.disk_timeout = 2.0
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.interval = float(self.helper.get_setting("host_sample_interval", 1))
+            self.disk_refresh = float(
+                self.helper.get_setting("disk_refresh_interval", 60)
+            )
+            self.disk_timeout = float(self.helper.get_setting("disk_usage_timeout", 2))
+            # prime cpu_percent, the first call always returns 0.0
+            psutil.cpu_percent(interval=None)
+            self.thread = threading.Thread(
+                target=self._run, daemon=True, name="host_sampler"
+            )
+            self.thread.start()
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def snapshot(self):
+        """The latest sample, taken right now if the sampler isn't running."""
+        latest = self.latest
+        if latest is None:
+            latest = self.sample()
+        return latest
+
+    def take_average(self):
+        """
+        Returns the latest sample with cpu and memory usage averaged over the
+        samples taken since the previous call, and starts a new period.
+        """
+        snapshot = dict(self.snapshot())
+        with self.lock:
+            acc = self.accumulated
+            if acc["samples"]:
+                snapshot["cpu_usage"] = round(acc["cpu_usage"] / acc["samples"], 2)
+                snapshot["mem_percent"] = round(acc["mem_percent"] / acc["samples"], 1)
+            self.accumulated = {"samples": 0, "cpu_usage": 0.0, "mem_percent": 0.0}
+        return snapshot
+
+    def _run(self):
+        previous = None
+        while True:
+            try:
+                latest = self.sample()
+            except Exception as e:
+                logger.error(f"Unable to sample host stats: {e}")
+                time.sleep(max(self.interval, 1))
+                continue
+
+            with self.lock:
+                self.latest = latest
+                self.accumulated["samples"] += 1
+                self.accumulated["cpu_usage"] += max(latest["cpu_usage"], 0)
+                self.accumulated["mem_percent"] += max(latest["mem_percent"], 0)
+                subscribers = list(self.subscribers)
+
+            key = (latest["cpu_usage"], latest["mem_percent"])
+            if key != previous:
+                previous = key
+                for callback in subscribers:
+                    try:
+                        callback(latest)
+                    except Exception as e:
+                        logger.error(f"Host stats subscriber failed: {e}")
+            time.sleep(max(self.interval, 0.1))
+
+    # **********************************************************************************
+    #                                   Sampling
+    # **********************************************************************************
+    def sample(self):
+        try:
+            cpu_freq = psutil.cpu_freq()
+        except NotImplementedError:
+            cpu_freq = None
+        if cpu_freq is None:
+            cpu_freq = psutil._common.scpufreq(current=-1, min=-1, max=-1)
+        try:
+            cpu_usage = round(psutil.cpu_percent(interval=None) / psutil.cpu_count(), 2)
+        except Exception as e:
+            logger.debug(
+                "getting the cpu usage failed due to the following error:", exc_info=e
+            )
+            cpu_usage = -1
+        memory = psutil.virtual_memory()
+        return {
+            "boot_time": str(HostSampler.try_get_boot_time()),
+            "cpu_usage": cpu_usage,
+            "cpu_count": psutil.cpu_count(),
+            "cpu_cur_freq": round(cpu_freq[0], 2),
+            "cpu_max_freq": cpu_freq[2],
+            "mem_percent": memory.percent,
+            "mem_usage_raw": memory.used,
+            "mem_usage": Helpers.human_readable_file_size(memory.used),
+            "mem_total_raw": memory.total,
+            "mem_total": Helpers.human_readable_file_size(memory.total),
+            "disk_data": self.get_disk_data(),
+        }
+
+    @staticmethod
+    def try_get_boot_time():
+        try:
+            return datetime.datetime.fromtimestamp(
+                psutil.boot_time(), datetime.timezone.utc
+            )
+        except Exception as e:
+            logger.debug(
+                "getting boot time failed due to the following error:", exc_info=e
+            )
+            # unix epoch with no timezone data
+            return datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+
+    def get_disk_data(self):
+        if time.monotonic() - self.disk_refreshed >= self.disk_refresh:
+            self.disk_refreshed = time.monotonic()
+            try:
+                self.disk_data = self._all_disk_usage()
+            except Exception as e:
+                logger.debug(
+                    "getting disk stats failed due to the following error:",
+                    exc_info=e,
+                )
+                self.disk_data = []
+        return self.disk_data
+
+    def mounts(self):
+        for part in psutil.disk_partitions(all=False):
+            if part.fstype.lower() in HostSampler.network_fs:
+                continue
+            if Helpers.is_os_windows():
+                if "cdrom" in part.opts or part.fstype == "":
+                    # skip cd-rom drives with no disk in it; they may raise
+                    # ENOENT, pop-up a Windows GUI error for a non-ready
+                    # partition or just hang.
+                    continue
+            yield part
+
+    def _list_mounts(self):
+        """mounts() under the disk timeout, the last list when it hangs."""
+        if self.pending_listing is None or self.pending_listing.done():
+            self.pending_listing = self.disk_pool.submit(lambda: list(self.mounts()))
+        try:
+            self.known_mounts = self.pending_listing.result(timeout=self.disk_timeout)
+        except FutureTimeout:
+            logger.warning(
+                f"Listing mounts took longer than {self.disk_timeout}s, "
+                "using the last list"
+            )
+        except OSError as e:
+            logger.debug(f"Unable to list mounts: {e}")
+        return self.known_mounts
+
+    # Source: https://github.com/giampaolo/psutil/blob/master/scripts/disk_usage.py
+    def _all_disk_usage(self):
+        timeout = self.disk_timeout
+        running = []
+        for part in self._list_mounts():
+            pending = self.pending_mounts.get(part.mountpoint)
+            if pending is not None and not pending.done():
+                # still stuck from an earlier round, don't pile up threads
+                continue
+            future = self.disk_pool.submit(psutil.disk_usage, part.mountpoint)
+            self.pending_mounts[part.mountpoint] = future
+            running.append((part, future))
+
+        # all mounts share one deadline
+        deadline = time.monotonic() + timeout
+        disk_data = []
+        for part, future in running:
+            try:
+                usage = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                logger.warning(
+                    f"Disk usage of {part.mountpoint} took longer than "
+                    f"{timeout}s, skipping it"
+                )
+                continue
+            except OSError as e:
+                logger.debug(f"Unable to get disk usage of {part.mountpoint}: {e}")
+                continue
+            disk_data.append(
+                {
+                    "device": part.device,
+                    "total_raw": usage.total,
+                    "total": Helpers.human_readable_file_size(usage.total),
+                    "used_raw": usage.used,
+                    "used": Helpers.human_readable_file_size(usage.used),
+                    "free_raw": usage.free,
+                    "free": Helpers.human_readable_file_size(usage.free),
+                    "percent_used": usage.percent,
+                    "fs": part.fstype,
+                    "mount": part.mountpoint,
+                }
+            )
+        return disk_data
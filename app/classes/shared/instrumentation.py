@@ -0,0 +1,342 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from app.classes.shared.blocking_pool import BlockingPool
+from app.classes.shared.database import DatabaseManager
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus sense, in seconds."""
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * len(Histogram.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(Histogram.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(Histogram.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Instrumentation(metaclass=Singleton):
+    """
+    Where time goes in the panel: request latency per handler, IOLoop lag,
+    scheduler job durations, and on top of that what the BlockingPool, the
+    databases and the websocket clients report about themselves.
+
+    Everything is kept in memory since start and rendered in the Prometheus
+    text format at /metrics.
+    """
+
+    # how often the IOLoop is checked for lag, and when lag gets logged
+    lag_interval = 0.5
+    slow_lag = 1.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (handler, method) -> Histogram
+        self.requests = {}
+        # (handler, method, status) -> count
+        self.responses = {}
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+        # job id -> Histogram
+        self.jobs = {}
+        self.job_errors = {}
+        # (job id, scheduled run time) -> submitted at
+        self.running_jobs = {}
+
+    # **********************************************************************************
+    #                                   Requests
+    # **********************************************************************************
+    def observe_request(self, handler):
+        seconds = handler.request.request_time()
+        name = type(handler).__name__
+        method = handler.request.method
+        with self.lock:
+            histogram = self.requests.get((name, method))
+            if histogram is None:
+                histogram = self.requests[(name, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (name, method, handler.get_status())
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    # **********************************************************************************
+    #                                   IOLoop
+    # **********************************************************************************
+    async def watch_loop(self):
+        """Runs on the IOLoop for good, measuring how late its sleeps wake up."""
+        while True:
+            due = time.perf_counter() + Instrumentation.lag_interval
+            await asyncio.sleep(Instrumentation.lag_interval)
+            lag = max(time.perf_counter() - due, 0.0)
+            with self.lock:
+                self.loop_lag.observe(lag)
+                self.last_loop_lag = lag
+            if lag >= Instrumentation.slow_lag:
+                logger.warning(f"The IOLoop was blocked for {lag:.3f}s")
+
+    # **********************************************************************************
+    #                                   Scheduler
+    # **********************************************************************************
+    def scheduler_listener(self, event):
+        """apscheduler listener for submitted, executed and failed jobs."""
+        now = time.perf_counter()
+        with self.lock:
+            run_times = getattr(event, "scheduled_run_times", None)
+            if run_times is not None:
+                # submitted
+                for run_time in run_times:
+                    self.running_jobs[(event.job_id, run_time)] = now
+                return
+            started = self.running_jobs.pop(
+                (event.job_id, event.scheduled_run_time), None
+            )
+            if started is None:
+                return
+            histogram = self.jobs.get(event.job_id)
+            if histogram is None:
+                histogram = self.jobs[event.job_id] = Histogram()
+            histogram.observe(now - started)
+            if event.exception:
+                self.job_errors[event.job_id] = self.job_errors.get(event.job_id, 0) + 1
+
+    # **********************************************************************************
+    #                                   Rendering
+    # **********************************************************************************
+    @staticmethod
+    def _labels(**labels):
+        if not labels:
+            return ""
+        pairs = []
+        for key, value in labels.items():
+            value = (
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n")
+            )
+            pairs.append(f'{key}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    @staticmethod
+    def _histogram(lines, name, histogram: Histogram, **labels):
+        for bound, count in histogram.cumulative():
+            lines.append(
+                f"{name}_bucket{Instrumentation._labels(**labels, le=bound)} {count}"
+            )
+        lines.append(
+            f"{name}_bucket{Instrumentation._labels(**labels, le='+Inf')} "
+            f"{histogram.count}"
+        )
+        lines.append(f"{name}_sum{Instrumentation._labels(**labels)} {histogram.sum}")
+        lines.append(
+            f"{name}_count{Instrumentation._labels(**labels)} {histogram.count}"
+        )
+
+    @staticmethod
+    def _header(lines, name, kind, description):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self, websocket_helper=None):
+        lines = []
+        labels = Instrumentation._labels
+        with self.lock:
+            Instrumentation._header(
+                lines, "crafty_http_requests_total", "counter", "Finished requests."
+            )
+            for (name, method, status), count in sorted(self.responses.items()):
+                lines.append(
+                    f"crafty_http_requests_total"
+                    f"{labels(handler=name, method=method, code=status)} {count}"
+                )
+            Instrumentation._header(
+                lines,
+                "crafty_http_request_duration_seconds",
+                "histogram",
+                "Request latency per handler.",
+            )
+            for (name, method), histogram in sorted(self.requests.items()):
+                Instrumentation._histogram(
+                    lines,
+                    "crafty_http_request_duration_seconds",
+                    histogram,
+                    handler=name,
+                    method=method,
+                )
+
+            Instrumentation._header(
+                lines,
+                "crafty_ioloop_lag_seconds",
+                "histogram",
+                "How late the IOLoop ran a timer.",
+            )
+            Instrumentation._histogram(
+                lines, "crafty_ioloop_lag_seconds", self.loop_lag
+            )
+            Instrumentation._header(
+                lines,
+                "crafty_ioloop_last_lag_seconds",
+                "gauge",
+                "IOLoop lag of the latest check.",
+            )
+            lines.append(f"crafty_ioloop_last_lag_seconds {self.last_loop_lag}")
+
+            Instrumentation._header(
+                lines,
+                "crafty_scheduler_job_duration_seconds",
+                "histogram",
+                "Run time of scheduler jobs.",
+            )
+            for job_id, histogram in sorted(self.jobs.items()):
+                Instrumentation._histogram(
+                    lines,
+                    "crafty_scheduler_job_duration_seconds",
+                    histogram,
+                    job=job_id,
+                )
+            Instrumentation._header(
+                lines,
+                "crafty_scheduler_job_errors_total",
+                "counter",
+                "Scheduler jobs that raised.",
+            )
+            for job_id, count in sorted(self.job_errors.items()):
+                lines.append(
+                    f"crafty_scheduler_job_errors_total{labels(job=job_id)} {count}"
+                )
+
+        Instrumentation._render_pool(lines)
+        Instrumentation._render_databases(lines)
+        if websocket_helper is not None:
+            Instrumentation._render_websockets(lines, websocket_helper)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_pool(lines):
+        labels = Instrumentation._labels
+        pool = BlockingPool().metrics()
+        for name, description in (
+            ("workers", "BlockingPool threads."),
+            ("pending", "Calls waiting for a BlockingPool thread."),
+            ("running", "Calls running on the BlockingPool."),
+        ):
+            Instrumentation._header(
+                lines, f"crafty_blocking_pool_{name}", "gauge", description
+            )
+            lines.append(f"crafty_blocking_pool_{name} {pool[name]}")
+        for metric, table, key, description in (
+            (
+                "crafty_blocking_call_seconds",
+                "calls",
+                "total",
+                "Run time of pool calls.",
+            ),
+            (
+                "crafty_blocking_wait_seconds",
+                "calls",
+                "wait",
+                "Queue time of pool calls.",
+            ),
+            (
+                "crafty_ioloop_block_seconds",
+                "loop_blocks",
+                "total",
+                "Time requests held the IOLoop, per handler.",
+            ),
+        ):
+            Instrumentation._header(lines, metric, "summary", description)
+            for name, entry in sorted(pool[table].items()):
+                lines.append(f"{metric}_sum{labels(name=name)} {entry[key]}")
+                lines.append(f"{metric}_count{labels(name=name)} {entry['count']}")
+
+    @staticmethod
+    def _render_databases(lines):
+        labels = Instrumentation._labels
+        manager = DatabaseManager()
+        Instrumentation._header(
+            lines, "crafty_db_query_seconds", "summary", "Time spent in SQL statements."
+        )
+        queries = manager.query_metrics()
+        for database, statements in sorted(queries.items()):
+            for statement, entry in sorted(statements.items()):
+                label = labels(database=database, statement=statement)
+                lines.append(f"crafty_db_query_seconds_sum{label} {entry['total']}")
+                lines.append(f"crafty_db_query_seconds_count{label} {entry['count']}")
+        Instrumentation._header(
+            lines,
+            "crafty_db_query_max_seconds",
+            "gauge",
+            "Slowest SQL statement since start.",
+        )
+        for database, statements in sorted(queries.items()):
+            for statement, entry in sorted(statements.items()):
+                lines.append(
+                    f"crafty_db_query_max_seconds"
+                    f"{labels(database=database, statement=statement)} {entry['max']}"
+                )
+
+        writers = manager.writer_metrics()
+        for name, kind, description in (
+            ("batches", "counter", "Transactions committed by the writer."),
+            ("writes", "counter", "Writes run by the writer."),
+            ("failed", "counter", "Writes that failed."),
+            ("queued", "gauge", "Writes waiting for the writer."),
+        ):
+            metric = f"crafty_db_writer_{name}" + (
+                "_total" if kind == "counter" else ""
+            )
+            Instrumentation._header(lines, metric, kind, description)
+            for path, entry in sorted(writers.items()):
+                database = os.path.basename(str(path))
+                lines.append(f"{metric}{labels(database=database)} {entry[name]}")
+
+    @staticmethod
+    def _render_websockets(lines, websocket_helper):
+        labels = Instrumentation._labels
+        pages = {}
+        pending = 0
+        most_pending = 0
+        for client in list(websocket_helper.clients):
+            page = client.page or ""
+            pages[page] = pages.get(page, 0) + 1
+            pending += client.pending_sends
+            most_pending = max(most_pending, client.pending_sends)
+        Instrumentation._header(
+            lines, "crafty_websocket_clients", "gauge", "Connected websocket clients."
+        )
+        for page, count in sorted(pages.items()):
+            lines.append(f"crafty_websocket_clients{labels(page=page)} {count}")
+        Instrumentation._header(
+            lines,
+            "crafty_websocket_pending_sends",
+            "gauge",
+            "Messages queued for websocket clients and not yet written.",
+        )
+        lines.append(f"crafty_websocket_pending_sends {pending}")
+        Instrumentation._header(
+            lines,
+            "crafty_websocket_max_pending_sends",
+            "gauge",
+            "Most messages queued for a single websocket client.",
+        )
+        lines.append(f"crafty_websocket_max_pending_sends {most_pending}")
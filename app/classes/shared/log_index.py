@@ -0,0 +1,334 @@
+import os
+import re
+import gzip
+import logging
+import datetime
+import threading
+
+from app.classes.shared.database import DatabaseManager
+from app.classes.shared.log_reader import LogReader
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class LogIndex(metaclass=Singleton):
+    """
+    Full-text index over the current and rotated logs of all servers.
+
+    Lines go into log_entries and an external content FTS5 table over them.
+    Plain log files are indexed incrementally from the offset reached last
+    time; a file that got rotated or truncated is dropped and indexed again.
+    Gzipped archives never change, so they are indexed once. Entries of
+    files that were deleted are removed on the next pass.
+
+    Log lines only carry the time of day, the date comes from the archive
+    name (2024-01-31-1.log.gz) or the modification time of the file, and
+    is moved on by a day whenever the time of day goes backwards.
+    """
+
+    # lines per write, every batch is its own transaction on the writer
+    batch_size = 2000
+    # plain files are indexed at most this far per pass
+    max_bytes_per_pass = 32 * 1024 * 1024
+    log_suffixes = (".log", ".log.gz", ".txt", ".txt.gz")
+
+    date_re = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+    time_re = re.compile(r"^\[(?:[^\]]*?[ T])?(\d{1,2}):(\d{2}):(\d{2})")
+
+    def __init__(self, db_path):
+        self.database = DatabaseManager().get_database(db_path)
+        self.writer = DatabaseManager().get_writer(self.database)
+        self.index_lock = threading.Lock()
+        self.writer.run(self._create)
+
+    # **********************************************************************************
+    #                                   Schema
+    # **********************************************************************************
+    def _create(self):
+        self.database.execute_sql(
+            "CREATE TABLE IF NOT EXISTS log_files ("
+            "id INTEGER PRIMARY KEY, server_id INTEGER NOT NULL, "
+            "path TEXT NOT NULL UNIQUE, ident TEXT NOT NULL, "
+            "offset INTEGER NOT NULL, last_ts INTEGER)"
+        )
+        self.database.execute_sql(
+            "CREATE TABLE IF NOT EXISTS log_entries ("
+            "id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, "
+            "server_id INTEGER NOT NULL, ts INTEGER NOT NULL, line TEXT NOT NULL)"
+        )
+        self.database.execute_sql(
+            "CREATE INDEX IF NOT EXISTS log_entries_server_ts "
+            "ON log_entries (server_id, ts)"
+        )
+        self.database.execute_sql(
+            "CREATE INDEX IF NOT EXISTS log_entries_file ON log_entries (file_id)"
+        )
+        self.database.execute_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS log_search USING fts5("
+            "line, content='log_entries', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        # keep the full-text index in step with log_entries
+        self.database.execute_sql(
+            "CREATE TRIGGER IF NOT EXISTS log_entries_ai AFTER INSERT ON log_entries "
+            "BEGIN INSERT INTO log_search (rowid, line) VALUES (new.id, new.line); END"
+        )
+        self.database.execute_sql(
+            "CREATE TRIGGER IF NOT EXISTS log_entries_ad AFTER DELETE ON log_entries "
+            "BEGIN INSERT INTO log_search (log_search, rowid, line) "
+            "VALUES ('delete', old.id, old.line); END"
+        )
+
+    # **********************************************************************************
+    #                                   Indexing
+    # **********************************************************************************
+    def index_server(self, server_id, logs_dir):
+        """Indexes new lines of every log file in logs_dir."""
+        if not os.path.isdir(logs_dir):
+            return
+        with self.index_lock:
+            known = self._known_files(server_id)
+            present = set()
+            for entry in os.scandir(logs_dir):
+                if not entry.is_file() or not entry.name.endswith(
+                    LogIndex.log_suffixes
+                ):
+                    continue
+                path = os.path.abspath(entry.path)
+                present.add(path)
+                try:
+                    self._index_file(server_id, path, entry.stat(), known.get(path))
+                except OSError as e:
+                    logger.warning(f"Unable to index log file {path}: {e}")
+                except EOFError as e:
+                    # an archive that is still being written
+                    logger.debug(f"Skipping incomplete log archive {path}: {e}")
+            for path, state in known.items():
+                if path not in present:
+                    self.writer.run(self._forget_file, state["id"])
+
+    def remove_server(self, server_id):
+        with self.index_lock:
+            for state in self._known_files(server_id).values():
+                self.writer.run(self._forget_file, state["id"])
+
+    def _known_files(self, server_id):
+        cursor = self.database.execute_sql(
+            "SELECT id, path, ident, offset, last_ts FROM log_files "
+            "WHERE server_id = ?",
+            [int(server_id)],
+        )
+        return {
+            row[1]: {"id": row[0], "ident": row[2], "offset": row[3], "last_ts": row[4]}
+            for row in cursor.fetchall()
+        }
+
+    def _forget_file(self, file_id):
+        self.database.execute_sql(
+            "DELETE FROM log_entries WHERE file_id = ?", [file_id]
+        )
+        self.database.execute_sql("DELETE FROM log_files WHERE id = ?", [file_id])
+
+    def _index_file(self, server_id, path, stat, state):
+        is_gz = path.endswith(".gz")
+        if is_gz:
+            # archives don't change once written
+            ident = f"{stat.st_size:x}-{int(stat.st_mtime):x}"
+        else:
+            ident = LogReader.file_id(stat)
+        if state is not None and (
+            state["ident"] != ident
+            or state["offset"] > stat.st_size
+            or (is_gz and state["offset"] != stat.st_size)
+        ):
+            # rotated, replaced, truncated or an archive that wasn't
+            # finished last time, start over
+            self.writer.run(self._forget_file, state["id"])
+            state = None
+        if state is not None and state["offset"] == stat.st_size:
+            return
+
+        offset = state["offset"] if state is not None else 0
+        last_ts = state["last_ts"] if state is not None else None
+        file_id = (
+            state["id"]
+            if state is not None
+            else self.writer.run(self._add_file, server_id, path, ident)
+        )
+        dater = LogDater(path, stat.st_mtime, last_ts)
+
+        # the offset is stored with every batch, so an interrupted pass
+        # neither loses nor repeats lines
+        if is_gz:
+            with gzip.open(path, "rb") as f:
+                for batch in self._batches(f.readline, dater, finished=True):
+                    self.writer.run(
+                        self._insert, file_id, server_id, batch, 0, dater.last_ts
+                    )
+            self.writer.run(self._update_file, file_id, stat.st_size, dater.last_ts)
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for batch in self._batches(f.readline, dater):
+                    self.writer.run(
+                        self._insert,
+                        file_id,
+                        server_id,
+                        batch,
+                        offset + dater.consumed,
+                        dater.last_ts,
+                    )
+                    if dater.consumed >= LogIndex.max_bytes_per_pass:
+                        break
+
+    def _batches(self, readline, dater, finished=False):
+        batch = []
+        while True:
+            raw = readline()
+            if not raw:
+                break
+            if not raw.endswith(b"\n") and not finished:
+                # still being written, pick it up next time
+                break
+            dater.consumed += len(raw)
+            line = raw.rstrip(b"\r\n").decode("utf-8", errors="replace")
+            if not line.strip():
+                continue
+            batch.append((dater.stamp(line), line))
+            if len(batch) >= LogIndex.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _add_file(self, server_id, path, ident):
+        cursor = self.database.execute_sql(
+            "INSERT INTO log_files (server_id, path, ident, offset) VALUES (?, ?, ?, 0)",
+            [int(server_id), path, ident],
+        )
+        return cursor.lastrowid
+
+    def _insert(self, file_id, server_id, batch, offset, last_ts):
+        self.database.cursor().executemany(
+            "INSERT INTO log_entries (file_id, server_id, ts, line) VALUES (?, ?, ?, ?)",
+            [(file_id, int(server_id), ts, line) for ts, line in batch],
+        )
+        self._update_file(file_id, offset, last_ts)
+
+    def _update_file(self, file_id, offset, last_ts):
+        self.database.execute_sql(
+            "UPDATE log_files SET offset = ?, last_ts = ? WHERE id = ?",
+            [offset, last_ts, file_id],
+        )
+
+    # **********************************************************************************
+    #                                   Searching
+    # **********************************************************************************
+    @staticmethod
+    def build_match(query):
+        """
+        Turns user input into an FTS5 query: every word has to match, quoted
+        so punctuation in player names, ips or class names can't break the
+        syntax. A trailing * makes a word a prefix.
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*") and len(word) > 1
+            word = word.rstrip("*")
+            if word:
+                quoted = word.replace('"', '""')
+                terms.append(f'"{quoted}"' + ("*" if prefix else ""))
+        return " ".join(terms)
+
+    def search(self, query, server_ids, start=None, end=None, limit=100):
+        """
+        Newest lines of the given servers matching query, optionally within
+        [start, end) (unix seconds).
+        """
+        match = LogIndex.build_match(query)
+        if not match or not server_ids:
+            return []
+        server_ids = [int(s) for s in server_ids]
+        where = [
+            "log_search MATCH ?",
+            f"e.server_id IN ({', '.join(['?'] * len(server_ids))})",
+        ]
+        params = [match] + server_ids
+        if start is not None:
+            where.append("e.ts >= ?")
+            params.append(int(start))
+        if end is not None:
+            where.append("e.ts < ?")
+            params.append(int(end))
+        params.append(int(limit))
+        cursor = self.database.execute_sql(
+            "SELECT e.server_id, e.ts, f.path, e.line FROM log_search "
+            "JOIN log_entries e ON e.id = log_search.rowid "
+            "JOIN log_files f ON f.id = e.file_id "
+            f"WHERE {' AND '.join(where)} ORDER BY e.ts DESC, e.id DESC LIMIT ?",
+            params,
+        )
+        return [
+            {
+                "server_id": row[0],
+                "time": row[1],
+                "file": os.path.basename(row[2]),
+                "line": row[3],
+            }
+            for row in cursor.fetchall()
+        ]
+
+
+class LogDater:
+    """Works out the timestamp of each line while a log file is read front to back."""
+
+    def __init__(self, path, mtime, last_ts=None):
+        # bytes of complete lines read so far
+        self.consumed = 0
+        self.last_ts = last_ts
+        self.mtime = mtime
+        self.day = None
+        if last_ts is None:
+            found = LogIndex.date_re.search(os.path.basename(path))
+            if found:
+                try:
+                    self.day = datetime.datetime(*map(int, found.groups()))
+                except ValueError:
+                    self.day = None
+
+    def stamp(self, line):
+        found = LogIndex.time_re.match(line)
+        if found is None:
+            # continuation lines (stack traces) belong to the line before
+            return self.last_ts if self.last_ts is not None else int(self.mtime)
+        hours, minutes, seconds = map(int, found.groups())
+        if hours > 23 or minutes > 59 or seconds > 59:
+            return self.last_ts if self.last_ts is not None else int(self.mtime)
+        seconds_of_day = hours * 3600 + minutes * 60 + seconds
+
+        if self.day is None:
+            if self.last_ts is not None:
+                self.day = LogDater._midnight(self.last_ts)
+            else:
+                # first line of a file without a date in its name: the file
+                # was last written on its mtime day, a later time of day than
+                # that means the file started the day before
+                self.day = LogDater._midnight(self.mtime)
+                mtime_of_day = self.mtime - self.day.timestamp()
+                if seconds_of_day > mtime_of_day + 60:
+                    self.day -= datetime.timedelta(days=1)
+
+        ts = int(self.day.timestamp()) + seconds_of_day
+        if self.last_ts is not None and ts < self.last_ts - 60:
+            # the clock went past midnight
+            self.day += datetime.timedelta(days=1)
+            ts = int(self.day.timestamp()) + seconds_of_day
+        self.last_ts = ts
+        return ts
+
+    @staticmethod
+    def _midnight(ts):
+        return datetime.datetime.fromtimestamp(ts).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
@@ -0,0 +1,198 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LogCursorError(ValueError):
+    pass
+
+
+class LogChunk:
+    """
+    Lines read from a log file, with cursors for the byte offsets right
+    before the first and right after the last line. reset is set when the
+    file the cursor pointed into was rotated or truncated and the lines are
+    a fresh tail instead of a continuation.
+    """
+
+    def __init__(self, lines, start, end, file_id, reset=False):
+        self.lines = lines
+        self.start = start
+        self.end = end
+        self.file_id = file_id
+        self.reset = reset
+
+    @property
+    def start_cursor(self):
+        return LogReader.make_cursor(self.file_id, self.start)
+
+    @property
+    def end_cursor(self):
+        return LogReader.make_cursor(self.file_id, self.end)
+
+    def to_dict(self):
+        return {
+            "lines": self.lines,
+            "start": self.start_cursor,
+            "end": self.end_cursor,
+            "reset": self.reset,
+        }
+
+
+class LogReader:
+    """
+    Reads lines from (possibly huge) log files by byte offset.
+
+    Files are read in binary, so offsets are exact and nothing depends on
+    the encoding or on guessing line lengths. The tail is found by scanning
+    backwards block by block for newlines, so reading the last lines of a
+    2 GB log costs the same as of a 2 KB one. Only complete lines are
+    returned; a line still being written is picked up by the next read. A
+    line longer than max_bytes is the exception, it is handed out in pieces
+    so reading never gets stuck on it.
+
+    Cursors are opaque to clients: they carry the offset and an id of the
+    file (inode and device) so a cursor into a rotated log is detected.
+    """
+
+    block_size = 64 * 1024
+    # never return more than this much in one response
+    max_bytes = 1024 * 1024
+
+    @staticmethod
+    def make_cursor(file_id, offset):
+        return f"{file_id}.{offset:x}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        try:
+            file_id, offset = cursor.rsplit(".", 1)
+            return file_id, int(offset, 16)
+        except (AttributeError, ValueError) as e:
+            raise LogCursorError(f"Invalid log cursor {cursor}") from e
+
+    @staticmethod
+    def file_id(stat: os.stat_result):
+        return f"{stat.st_dev:x}-{stat.st_ino:x}"
+
+    @staticmethod
+    def _decode(raw_lines):
+        return [line.decode("utf-8", errors="replace") for line in raw_lines]
+
+    @staticmethod
+    def tail(path, max_lines) -> LogChunk:
+        """The last max_lines complete lines of the file."""
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            end = LogReader._last_newline_end(f, stat.st_size)
+            start = LogReader._scan_back(f, end, max_lines)
+            f.seek(start)
+            data = f.read(end - start)
+        return LogChunk(
+            LogReader._decode(data.splitlines()),
+            start,
+            end,
+            LogReader.file_id(stat),
+        )
+
+    @staticmethod
+    def read_before(path, cursor, max_lines) -> LogChunk:
+        """Up to max_lines lines ending at cursor, for scrolling back."""
+        file_id, offset = LogReader.parse_cursor(cursor)
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if file_id != LogReader.file_id(stat) or offset > stat.st_size:
+                chunk = LogReader.tail(path, max_lines)
+                chunk.reset = True
+                return chunk
+            start = LogReader._scan_back(f, offset, max_lines)
+            f.seek(start)
+            data = f.read(offset - start)
+        return LogChunk(LogReader._decode(data.splitlines()), start, offset, file_id)
+
+    @staticmethod
+    def read_after(path, cursor, max_lines) -> LogChunk:
+        """
+        Complete lines written after cursor, up to max_lines and max_bytes.
+        When there is nothing new the chunk is empty and end equals cursor.
+        """
+        file_id, offset = LogReader.parse_cursor(cursor)
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if file_id != LogReader.file_id(stat) or offset > stat.st_size:
+                # rotated or truncated, start over from the tail
+                chunk = LogReader.tail(path, max_lines)
+                chunk.reset = True
+                return chunk
+            f.seek(offset)
+            data = f.read(min(stat.st_size - offset, LogReader.max_bytes))
+        # only hand out complete lines
+        end = data.rfind(b"\n") + 1
+        if end == 0 and len(data) == LogReader.max_bytes:
+            # a whole window without a newline, hand out the piece
+            end = len(data)
+        start = 0
+        if data.count(b"\n", 0, end) > max_lines:
+            # the client is far behind, skip ahead to the newest lines
+            start = end - 1
+            for _ in range(max_lines):
+                start = data.rfind(b"\n", 0, start)
+            start += 1
+        return LogChunk(
+            LogReader._decode(data[start:end].splitlines()),
+            offset + start,
+            offset + end,
+            file_id,
+        )
+
+    # **********************************************************************************
+    #                                   Scanning
+    # **********************************************************************************
+    @staticmethod
+    def _last_newline_end(f, size):
+        """
+        Offset right after the last newline, so a partial last line is
+        skipped. Looks back max_bytes at most, a last line longer than that
+        is taken as it is.
+        """
+        pos = size
+        limit = max(size - LogReader.max_bytes, 0)
+        while pos > limit:
+            read_from = max(pos - LogReader.block_size, limit)
+            f.seek(read_from)
+            block = f.read(pos - read_from)
+            index = block.rfind(b"\n")
+            if index != -1:
+                return read_from + index + 1
+            pos = read_from
+        return size if limit > 0 else 0
+
+    @staticmethod
+    def _scan_back(f, end, max_lines):
+        """Offset where the max_lines lines ending at end start."""
+        pos = end
+        # the newline that terminates the last line doesn't start a line
+        newlines_needed = max_lines + 1
+        limit = max(end - LogReader.max_bytes, 0)
+        while pos > limit:
+            read_from = max(pos - LogReader.block_size, limit)
+            f.seek(read_from)
+            block = f.read(pos - read_from)
+            index = len(block)
+            while True:
+                index = block.rfind(b"\n", 0, index)
+                if index == -1:
+                    break
+                newlines_needed -= 1
+                if newlines_needed == 0:
+                    return read_from + index + 1
+            pos = read_from
+        if limit > 0:
+            # too much to return, start at the first line boundary after limit
+            f.seek(limit)
+            f.readline()
+            boundary = f.tell()
+            # or at limit, if a single line fills the whole window
+            return boundary if boundary < end else limit
+        return 0
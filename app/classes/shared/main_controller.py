@@ -1,17 +1,10 @@
 import os
 import pathlib
 from pathlib import Path
-import platform
 import shutil
-import time
 import logging
 from peewee import DoesNotExist
 
-# TZLocal is set as a hidden import on win pipeline
-from tzlocal import get_localzone
-from tzlocal.utils import ZoneInfoNotFoundError
-from apscheduler.schedulers.background import BackgroundScheduler
-
 from app.classes.models.server_permissions import EnumPermissionsServer
 from app.classes.shared.main_models import DatabaseShortcuts
 from app.classes.models.users import HelperUsers
@@ -26,8 +19,12 @@ from app.classes.controllers.server_perms_controller import ServerPermsControlle
 from app.classes.controllers.servers_controller import ServersController
 from app.classes.shared.authentication import Authentication
 from app.classes.shared.console import Console
+from app.classes.shared.console_events import ConsoleEventBus
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.file_helpers import FileHelpers
+from app.classes.shared.progress_tracker import ProgressRegistry
+from app.classes.shared.status_snapshot import StatusSnapshot
+from app.classes.shared.support_bundle import SupportBundleBuilder, SupportBundleJob
 from app.classes.minecraft.serverjars import ServerJars
 
 logger = logging.getLogger(__name__)
@@ -59,18 +56,8 @@ class Controller:
         self.users: UsersController = UsersController(
             self.helper, self.users_helper, self.authentication
         )
-        try:
-            tz = get_localzone()
-        except ZoneInfoNotFoundError:
-            logger.error(
-                "Could not capture time zone from system. Falling back to Europe/London"
-            )
-            tz = "Europe/London"
-        self.support_scheduler: BackgroundScheduler = BackgroundScheduler(
-            timezone=str(tz)
-        )
         self.first_login = False
-        self.support_scheduler.start()
+        self.support_bundles = SupportBundleBuilder(self.helper)
 
     @staticmethod
     def check_system_user():
@@ -94,30 +81,17 @@ class Controller:
                 ):
                     logger.debug("No transversal detected. Going for the delete.")
                     self.del_support_file(exec_user["support_logs"])
-        # pausing so on screen notifications can run for user
-        time.sleep(7)
         self.helper.websocket_helper.broadcast_user(
             exec_user["user_id"], "notification", "Preparing your support logs"
         )
-        self.helper.ensure_dir_exists(
-            os.path.join(self.project_root, "temp", str(exec_user["user_id"]))
-        )
-        temp_dir = os.path.join(
-            self.project_root, "temp", str(exec_user["user_id"]), "support_logs"
+        user_temp = os.path.join(self.project_root, "temp", str(exec_user["user_id"]))
+        self.helper.ensure_dir_exists(os.path.join(user_temp, "zip"))
+        job = SupportBundleJob(
+            exec_user["user_id"],
+            os.path.join(user_temp, "zip", "support_logs.zip"),
+            self.support_tracker(exec_user),
+            self.finish_support_logs,
         )
-
-        self.helper.ensure_dir_exists(
-            os.path.join(self.project_root, "temp", str(exec_user["user_id"]), "zip")
-        )
-        temp_zip_storage = os.path.join(
-            self.project_root, "temp", str(exec_user["user_id"]), "zip"
-        )
-        os.mkdir(temp_dir)
-        temp_zip_storage = os.path.join(temp_zip_storage, "support_logs")
-        crafty_path = os.path.join(temp_dir, "crafty")
-        os.mkdir(crafty_path)
-        server_path = os.path.join(temp_dir, "server")
-        os.mkdir(server_path)
         if exec_user["superuser"]:
             defined_servers = self.servers.list_defined_servers()
             user_servers = []
@@ -152,62 +126,37 @@ class Controller:
                         f"{server['server_name']}. Skipping."
                     )
         # we'll iterate through our list of log paths from auth servers.
+        used_names = set()
         for server in auth_servers:
-            final_path = os.path.join(server_path, str(server["server_name"]))
-            try:
-                os.mkdir(final_path)
-            except FileExistsError:
-                final_path += "_" + server["server_uuid"]
-                os.mkdir(final_path)
-            try:
-                FileHelpers.copy_file(
-                    pathlib.Path(server["path"], server["log_path"]),
-                    final_path,
-                )
-            except Exception as e:
-                logger.warning(f"Failed to copy file with error: {e}")
-        # Copy crafty logs to archive dir
-        full_log_name = os.path.join(crafty_path, "logs")
-        FileHelpers.copy_dir(os.path.join(self.project_root, "logs"), full_log_name)
-        self.support_scheduler.add_job(
-            self.log_status,
-            "interval",
-            seconds=1,
-            id="logs_" + str(exec_user["user_id"]),
-            args=[temp_dir, temp_zip_storage + ".zip", exec_user],
+            server_name = str(server["server_name"])
+            if server_name in used_names:
+                server_name += "_" + server["server_uuid"]
+            used_names.add(server_name)
+            log_file = pathlib.Path(server["path"], server["log_path"])
+            job.add_file(log_file, os.path.join("server", server_name, log_file.name))
+        job.add_dir(
+            os.path.join(self.project_root, "logs"), os.path.join("crafty", "logs")
         )
-        # Make version file .txt when we download it for support
-        # Most people have a default editor for .txt also more mobile friendly...
-        FileHelpers.copy_file(
-            os.path.join(self.project_root, "app", "config", "version.json"),
-            os.path.join(temp_dir, "crafty_sys_info.txt"),
+        job.add_text(
+            "crafty_sys_info.txt",
+            SupportBundleBuilder.system_info(
+                os.path.join(self.project_root, "app", "config", "version.json")
+            ),
         )
-        with open(
-            os.path.join(temp_dir, "crafty_sys_info.txt"), "a", encoding="utf-8"
-        ) as f:
-            f.write("\n")
-            f.write("OS Info:\n")
-            f.write("OS: " + str(platform.system()) + "\n")
-            f.write("Version: " + str(platform.release()))
-        FileHelpers.make_compressed_archive(temp_zip_storage, temp_dir)
-        if len(self.helper.websocket_helper.clients) > 0:
+        self.support_bundles.submit(job)
+
+    def finish_support_logs(self, job: SupportBundleJob, success: bool):
+        ProgressRegistry().publish(job.tracker)
+        if success:
+            self.users.set_support_path(job.user_id, job.zip_path)
             self.helper.websocket_helper.broadcast_user(
-                exec_user["user_id"],
-                "support_status_update",
-                Helpers.calc_percent(temp_dir, temp_zip_storage + ".zip"),
+                job.user_id, "send_logs_bootbox", {}
             )
-
-        temp_zip_storage += ".zip"
-        self.helper.websocket_helper.broadcast_user(
-            exec_user["user_id"], "send_logs_bootbox", {}
-        )
-
-        self.users.set_support_path(exec_user["user_id"], temp_zip_storage)
-
-        self.users.stop_prepare(exec_user["user_id"])
-        self.support_scheduler.remove_job("logs_" + str(exec_user["user_id"]))
-
-        FileHelpers.del_dirs(temp_dir)
+        else:
+            self.helper.websocket_helper.broadcast_user(
+                job.user_id, "notification", "Unable to prepare your support logs"
+            )
+        self.users.stop_prepare(job.user_id)
 
     def del_support_file(self, temp_zip_storage):
         try:
@@ -229,20 +178,21 @@ class Controller:
             False,
         )
 
-    def log_status(self, source_path, dest_path, exec_user):
-        results = Helpers.calc_percent(source_path, dest_path)
-        self.log_stats = results
+    def support_tracker(self, exec_user):
+        def broadcast(results):
+            if len(self.helper.websocket_helper.clients) > 0:
+                self.helper.websocket_helper.broadcast_user(
+                    exec_user["user_id"], "support_status_update", results
+                )
 
-        if len(self.helper.websocket_helper.clients) > 0:
-            self.helper.websocket_helper.broadcast_user(
-                exec_user["user_id"], "support_status_update", results
-            )
+        return ProgressRegistry().create(
+            ("support_logs", str(exec_user["user_id"])), broadcast
+        )
 
-    def send_log_status(self):
-        try:
-            return self.log_stats
-        except:
-            return {"percent": 0, "total_files": 0}
+    def send_log_status(self, user_id):
+        return ProgressRegistry().snapshot(
+            ("support_logs", str(user_id)), {"percent": 0, "total_files": 0}
+        )
 
     def create_api_server(self, data: dict):
         server_fs_uuid = Helpers.create_uuid()
@@ -595,6 +545,7 @@ class Controller:
         min_mem: int,
         max_mem: int,
         port: int,
+        tracker=None,
     ):
         server_id = Helpers.create_uuid()
         new_server_dir = os.path.join(self.helper.servers_dir, server_id)
@@ -609,21 +560,28 @@ class Controller:
         Helpers.ensure_dir_exists(new_server_dir)
         Helpers.ensure_dir_exists(backup_path)
         has_properties = False
+        items = os.listdir(temp_dir)
+        sizes = {}
+        if tracker is not None:
+            for item in items:
+                sizes[item] = FileHelpers.path_size(os.path.join(temp_dir, item))
+            tracker.add_total(sum(sizes.values()), len(items))
         # extracts archive to temp directory
-        for item in os.listdir(temp_dir):
-            if str(item) == "server.properties":
-                has_properties = True
-            try:
-                if not os.path.isdir(os.path.join(temp_dir, item)):
-                    FileHelpers.move_file(
-                        os.path.join(temp_dir, item), os.path.join(new_server_dir, item)
-                    )
-                else:
-                    FileHelpers.move_dir(
-                        os.path.join(temp_dir, item), os.path.join(new_server_dir, item)
+        try:
+            for item in items:
+                if str(item) == "server.properties":
+                    has_properties = True
+                try:
+                    FileHelpers.move_with_progress(
+                        os.path.join(temp_dir, item),
+                        os.path.join(new_server_dir, item),
+                        tracker,
+                        sizes.get(item),
                     )
-            except Exception as ex:
-                logger.error(f"ERROR IN ZIP IMPORT: {ex}")
+                except Exception as ex:
+                    logger.error(f"ERROR IN ZIP IMPORT: {ex}")
+        finally:
+            self.helper.remove_import_dir(temp_dir)
         if not has_properties:
             logger.info(
                 f"No server.properties found on zip file import. "
@@ -734,7 +692,7 @@ class Controller:
         return new_id
 
     def import_bedrock_zip_server(
-        self, server_name: str, zip_path: str, server_exe: str, port: int
+        self, server_name: str, zip_path: str, server_exe: str, port: int, tracker=None
     ):
         server_id = Helpers.create_uuid()
         new_server_dir = os.path.join(self.helper.servers_dir, server_id)
@@ -749,21 +707,28 @@ class Controller:
         Helpers.ensure_dir_exists(new_server_dir)
         Helpers.ensure_dir_exists(backup_path)
         has_properties = False
+        items = os.listdir(temp_dir)
+        sizes = {}
+        if tracker is not None:
+            for item in items:
+                sizes[item] = FileHelpers.path_size(os.path.join(temp_dir, item))
+            tracker.add_total(sum(sizes.values()), len(items))
         # extracts archive to temp directory
-        for item in os.listdir(temp_dir):
-            if str(item) == "server.properties":
-                has_properties = True
-            try:
-                if not os.path.isdir(os.path.join(temp_dir, item)):
-                    FileHelpers.move_file(
-                        os.path.join(temp_dir, item), os.path.join(new_server_dir, item)
-                    )
-                else:
-                    FileHelpers.move_dir(
-                        os.path.join(temp_dir, item), os.path.join(new_server_dir, item)
+        try:
+            for item in items:
+                if str(item) == "server.properties":
+                    has_properties = True
+                try:
+                    FileHelpers.move_with_progress(
+                        os.path.join(temp_dir, item),
+                        os.path.join(new_server_dir, item),
+                        tracker,
+                        sizes.get(item),
                     )
-            except Exception as ex:
-                logger.error(f"ERROR IN ZIP IMPORT: {ex}")
+                except Exception as ex:
+                    logger.error(f"ERROR IN ZIP IMPORT: {ex}")
+        finally:
+            self.helper.remove_import_dir(temp_dir)
         if not has_properties:
             logger.info(
                 f"No server.properties found on zip file import. "
@@ -807,7 +772,7 @@ class Controller:
     #                                   BEDROCK IMPORTS END
     # **********************************************************************************
 
-    def rename_backup_dir(self, old_server_id, new_server_id, new_uuid):
+    def rename_backup_dir(self, old_server_id, new_server_id, new_uuid, tracker=None):
         server_data = self.servers.get_server_data_by_id(old_server_id)
         server_obj = self.servers.get_server_obj(new_server_id)
         old_bu_path = server_data["backup_path"]
@@ -824,7 +789,13 @@ class Controller:
         except:
             logger.error("Could not delete default backup dir")
         self.servers.update_server(server_obj)
-        backup_path.rename(new_bu_path)
+        size = None
+        if tracker is not None:
+            size = FileHelpers.path_size(str(backup_path))
+            tracker.add_total(size, 1)
+        FileHelpers.move_with_progress(
+            str(backup_path), str(new_bu_path), tracker, size
+        )
 
     def register_server(
         self,
@@ -893,6 +864,7 @@ class Controller:
 
                 srv_obj = server["server_obj"]
                 srv_obj.server_scheduler.shutdown()
+                ConsoleEventBus().unsubscribe(srv_obj.handle_console_event, server_id)
                 running = srv_obj.check_running()
 
                 if running:
@@ -925,11 +897,16 @@ class Controller:
                     HelpersManagement.delete_scheduled_task_by_server(server_id)
                 except DoesNotExist:
                     logger.info("No scheduled jobs exist. Continuing.")
+                # stats live in the shared stats database, not the server dir
+                srv_obj.stats_helper.delete_server_stats()
+                StatusSnapshot().remove(server_id)
+                self.servers.get_log_index().remove_server(server_id)
                 # remove the server from the DB
                 self.servers.remove_server(server_id)
 
                 # remove the server from servers list
                 self.servers.servers_list.pop(counter)
+                self.servers.servers_by_id.pop(int(server_id), None)
 
             counter += 1
 
@@ -0,0 +1,338 @@
+import time
+import logging
+import threading
+
+from app.classes.shared.database import DatabaseManager
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsStore(metaclass=Singleton):
+    """
+    Time series of server stats for all servers in one database.
+
+    Samples go into compact raw rows keyed by (server_id, ts) and are rolled
+    up into 1 minute and 1 hour buckets once each bucket is complete. Every
+    resolution is split into time partitions (one table per period), so
+    retention is dropping whole tables instead of deleting rows, and a ranged
+    query only touches the partitions that overlap the range.
+
+    Nothing is kept longer than the history_max_age setting: the retention
+    below is the most a resolution keeps, 1h buckets cover the whole
+    history.
+    """
+
+    # resolution -> (bucket seconds, partition seconds, retention seconds)
+    resolutions = {
+        "raw": (0, 24 * 3600, 2 * 24 * 3600),
+        "1m": (60, 7 * 24 * 3600, 30 * 24 * 3600),
+        "1h": (3600, 90 * 24 * 3600, 2 * 365 * 24 * 3600),
+    }
+    # which resolution each rollup reads from
+    rollup_sources = {"1m": "raw", "1h": "1m"}
+
+    raw_columns = [
+        "cpu REAL",
+        "mem INTEGER",
+        "mem_percent REAL",
+        "online INTEGER",
+        "max_players INTEGER",
+        "world_size INTEGER",
+    ]
+    rollup_columns = [
+        "samples INTEGER",
+        "cpu_avg REAL",
+        "cpu_max REAL",
+        "mem_avg INTEGER",
+        "mem_max INTEGER",
+        "mem_percent_avg REAL",
+        "online_avg REAL",
+        "online_max INTEGER",
+        "max_players INTEGER",
+        "world_size INTEGER",
+    ]
+    sample_fields = [c.split()[0] for c in raw_columns]
+
+    def __init__(self, db_path, history_max_age=None):
+        self.database = DatabaseManager().get_database(db_path)
+        self.writer = DatabaseManager().get_writer(self.database)
+        self.lock = threading.Lock()
+        # seconds, None keeps the default retention
+        self.history_max_age = None
+        self.set_history_max_age(history_max_age)
+        self.partitions = set()
+        self.rolled_until = {}
+        self.writer.run(self._load)
+
+    def set_history_max_age(self, days):
+        self.history_max_age = days * 24 * 3600 if days else None
+
+    def retention(self, resolution):
+        kept = MetricsStore.resolutions[resolution][2]
+        if self.history_max_age is None:
+            return kept
+        if resolution == "1h":
+            return self.history_max_age
+        return min(kept, self.history_max_age)
+
+    # **********************************************************************************
+    #                                   Schema
+    # **********************************************************************************
+    def _load(self):
+        self.database.execute_sql(
+            "CREATE TABLE IF NOT EXISTS metrics_rollup_state "
+            "(resolution TEXT PRIMARY KEY, rolled_until INTEGER NOT NULL)"
+        )
+        cursor = self.database.execute_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name LIKE 'metrics\\_%\\_%' ESCAPE '\\'"
+        )
+        with self.lock:
+            self.partitions = {row[0] for row in cursor.fetchall()}
+            self.partitions.discard("metrics_rollup_state")
+            names = list(self.partitions)
+        for name in names:
+            MetricsStore._index_rollup_source(self.database, name)
+        cursor = self.database.execute_sql(
+            "SELECT resolution, rolled_until FROM metrics_rollup_state"
+        )
+        self.rolled_until = dict(cursor.fetchall())
+
+    @staticmethod
+    def _partition_name(resolution, ts):
+        span = MetricsStore.resolutions[resolution][1]
+        return f"metrics_{resolution}_{int(ts) // span}"
+
+    @staticmethod
+    def _partition_range(name):
+        _, resolution, index = name.split("_")
+        span = MetricsStore.resolutions[resolution][1]
+        return resolution, int(index) * span, (int(index) + 1) * span
+
+    def _ensure_partition(self, resolution, ts):
+        # only called on the writer thread
+        name = MetricsStore._partition_name(resolution, ts)
+        if name in self.partitions:
+            return name
+        columns = (
+            MetricsStore.raw_columns
+            if resolution == "raw"
+            else MetricsStore.rollup_columns
+        )
+        self.database.execute_sql(
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            f"server_id INTEGER NOT NULL, ts INTEGER NOT NULL, "
+            f"{', '.join(columns)}, PRIMARY KEY (server_id, ts)) WITHOUT ROWID"
+        )
+        MetricsStore._index_rollup_source(self.database, name)
+        with self.lock:
+            self.partitions.add(name)
+        return name
+
+    @staticmethod
+    def _index_rollup_source(database, name):
+        # rollups read a time range across all servers, the primary key only
+        # serves ranges of one server
+        resolution = name.split("_")[1]
+        if resolution in MetricsStore.rollup_sources.values():
+            database.execute_sql(f"CREATE INDEX IF NOT EXISTS {name}_ts ON {name} (ts)")
+
+    def _overlapping(self, resolution, start, end):
+        """Existing partitions of resolution that overlap [start, end), oldest first."""
+        with self.lock:
+            names = list(self.partitions)
+        found = []
+        for name in names:
+            res, p_start, p_end = MetricsStore._partition_range(name)
+            if res == resolution and p_start < end and p_end > start:
+                found.append((p_start, name))
+        return [name for _, name in sorted(found)]
+
+    # **********************************************************************************
+    #                                   Writing
+    # **********************************************************************************
+    def record(self, server_id, sample: dict, ts=None):
+        """
+        Queues a sample for a server. sample holds numeric values for
+        sample_fields, missing values are stored as NULL.
+        """
+        ts = int(ts if ts is not None else time.time())
+        values = [sample.get(field) for field in MetricsStore.sample_fields]
+        self.writer.submit(self._insert_raw, int(server_id), ts, values)
+
+    def _insert_raw(self, server_id, ts, values):
+        name = self._ensure_partition("raw", ts)
+        placeholders = ", ".join(["?"] * (len(values) + 2))
+        self.database.execute_sql(
+            f"INSERT OR REPLACE INTO {name} VALUES ({placeholders})",
+            [server_id, ts] + values,
+        )
+        self._rollup(ts)
+
+    def import_samples(self, server_id, samples):
+        """
+        Writes older samples of a server, given as (ts, sample) pairs, and
+        waits for them. Regular rollups only move forward, so the buckets
+        the samples fall in are rolled up right away.
+        """
+        rows = [
+            (int(ts), [sample.get(field) for field in MetricsStore.sample_fields])
+            for ts, sample in samples
+        ]
+        if rows:
+            self.writer.run(self._import_raw, int(server_id), rows)
+
+    def _import_raw(self, server_id, rows):
+        placeholders = ", ".join(["?"] * (len(MetricsStore.sample_fields) + 2))
+        for ts, values in rows:
+            name = self._ensure_partition("raw", ts)
+            self.database.execute_sql(
+                f"INSERT OR REPLACE INTO {name} VALUES ({placeholders})",
+                [server_id, ts] + values,
+            )
+        now = int(time.time())
+        start = min(ts for ts, _ in rows)
+        for resolution in ("1m", "1h"):
+            bucket = MetricsStore.resolutions[resolution][0]
+            rolled = self.rolled_until.get(resolution)
+            if rolled is None:
+                rolled = now // bucket * bucket
+                self._set_rolled(resolution, rolled)
+            # later buckets are left to the regular rollups
+            self._rollup_range(resolution, start // bucket * bucket, rolled, server_id)
+        self._drop_expired(now)
+
+    def _rollup(self, now):
+        for resolution in ("1m", "1h"):
+            bucket = MetricsStore.resolutions[resolution][0]
+            complete_until = now // bucket * bucket
+            rolled = self.rolled_until.get(resolution)
+            if rolled is None:
+                # first run, start rolling up from here
+                self._set_rolled(resolution, complete_until)
+                continue
+            if complete_until <= rolled:
+                continue
+            self._rollup_range(resolution, rolled, complete_until)
+            self._set_rolled(resolution, complete_until)
+            if resolution == "1h":
+                self._drop_expired(now)
+
+    def _set_rolled(self, resolution, ts):
+        self.database.execute_sql(
+            "INSERT OR REPLACE INTO metrics_rollup_state VALUES (?, ?)",
+            [resolution, ts],
+        )
+        self.rolled_until[resolution] = ts
+
+    def _rollup_range(self, resolution, start, end, server_id=None):
+        bucket = MetricsStore.resolutions[resolution][0]
+        source = MetricsStore.rollup_sources[resolution]
+        if source == "raw":
+            select = (
+                f"SELECT server_id, ts / {bucket} * {bucket}, count(*), "
+                "avg(cpu), max(cpu), avg(mem), max(mem), avg(mem_percent), "
+                "avg(online), max(online), max(max_players), max(world_size)"
+            )
+        else:
+            # weight the averages by how many samples went into each bucket
+            select = (
+                f"SELECT server_id, ts / {bucket} * {bucket}, sum(samples), "
+                "sum(cpu_avg * samples) / sum(samples), max(cpu_max), "
+                "sum(mem_avg * samples) / sum(samples), max(mem_max), "
+                "sum(mem_percent_avg * samples) / sum(samples), "
+                "sum(online_avg * samples) / sum(samples), max(online_max), "
+                "max(max_players), max(world_size)"
+            )
+        for source_name in self._overlapping(source, start, end):
+            # buckets never straddle partitions, partition spans are
+            # multiples of the bucket size
+            _, p_start, p_end = MetricsStore._partition_range(source_name)
+            range_start, range_end = max(start, p_start), min(end, p_end)
+            ts = range_start
+            while ts < range_end:
+                dest = self._ensure_partition(resolution, ts)
+                _, _, dest_end = MetricsStore._partition_range(dest)
+                chunk_end = min(range_end, dest_end)
+                where, params = "ts >= ? AND ts < ?", [ts, chunk_end]
+                if server_id is not None:
+                    where, params = f"server_id = ? AND {where}", [server_id] + params
+                self.database.execute_sql(
+                    f"INSERT OR REPLACE INTO {dest} {select} FROM {source_name} "
+                    f"WHERE {where} GROUP BY server_id, ts / {bucket}",
+                    params,
+                )
+                ts = chunk_end
+
+    def _drop_expired(self, now):
+        with self.lock:
+            names = list(self.partitions)
+        for name in names:
+            resolution, _, p_end = MetricsStore._partition_range(name)
+            if p_end < now - self.retention(resolution):
+                logger.info(f"Dropping expired stats partition {name}")
+                self.database.execute_sql(f"DROP TABLE IF EXISTS {name}")
+                with self.lock:
+                    self.partitions.discard(name)
+
+    # **********************************************************************************
+    #                                   Reading
+    # **********************************************************************************
+    def pick_resolution(self, start, end, now=None):
+        now = now if now is not None else time.time()
+        span = end - start
+        raw_kept = now - self.retention("raw")
+        if span <= 2 * 3600 and start >= raw_kept:
+            return "raw"
+        if span <= 3 * 24 * 3600:
+            return "1m"
+        return "1h"
+
+    def query(self, server_id, start, end, resolution=None):
+        """
+        Returns the samples of a server in [start, end) (unix seconds) as a
+        list of dicts ordered by ts. resolution is raw, 1m or 1h, by default
+        it is picked from the length of the range.
+        """
+        start, end = int(start), int(end)
+        if resolution is None:
+            resolution = self.pick_resolution(start, end)
+        if resolution not in MetricsStore.resolutions:
+            raise ValueError(f"Unknown resolution {resolution}")
+        columns = ["ts"] + [
+            c.split()[0]
+            for c in (
+                MetricsStore.raw_columns
+                if resolution == "raw"
+                else MetricsStore.rollup_columns
+            )
+        ]
+        rows = []
+        for name in self._overlapping(resolution, start, end):
+            cursor = self.database.execute_sql(
+                f"SELECT {', '.join(columns)} FROM {name} "
+                f"WHERE server_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                [int(server_id), start, end],
+            )
+            rows.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+        return rows
+
+    def last_online(self, server_id, since=0):
+        """
+        Returns the last ts at or after since a server had players online, or
+        None. Looks at the newest partitions first and stops at the first hit.
+        """
+        since = int(since)
+        for resolution, column in (("raw", "online"), ("1m", "online_max")):
+            for name in reversed(self._overlapping(resolution, since, 2**62)):
+                # walks the primary key backwards and stops at the first hit
+                cursor = self.database.execute_sql(
+                    f"SELECT ts FROM {name} WHERE server_id = ? AND ts >= ? "
+                    f"AND {column} > 0 ORDER BY ts DESC LIMIT 1",
+                    [int(server_id), since],
+                )
+                found = cursor.fetchone()
+                if found is not None:
+                    return found[0]
+        return None
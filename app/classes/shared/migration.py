@@ -5,17 +5,19 @@ import typing as t
 import sys
 import os
 import re
+import time
+import zlib
 from functools import wraps
 from functools import cached_property
 import peewee
 from playhouse.migrate import (
     SqliteMigrator,
     Operation,
-    SQL,
     SqliteDatabase,
     make_index_name,
 )
 
+from app.classes.shared.boot_profile import BootProfile
 from app.classes.shared.console import Console
 from app.classes.shared.helpers import Helpers
 
@@ -105,7 +107,7 @@ class Migrator(object):
         """
         Executes raw SQL.
         """
-        self.operations.append(SQL(sql, *params))
+        self.operations.append(lambda: self.database.execute_sql(sql, params))
 
     def create_table(self, model: peewee.Model) -> peewee.Model:
         """
@@ -297,6 +299,8 @@ class Migrator(object):
 # noinspection PyProtectedMember
 class MigrationManager(object):
     filemask = re.compile(r"[\d]+_[^\.]+\.py$")
+    # path -> (mtime_ns, code object) of migrations compiled in this process
+    compiled = {}
 
     def __init__(self, database: t.Union[peewee.Database, peewee.Proxy], helper):
         """
@@ -343,6 +347,23 @@ class MigrationManager(object):
             if self.filemask.match(f)
         )
 
+    @property
+    def fingerprint(self) -> int:
+        """
+        Schema version the database has once every migration on disk is
+        applied, a checksum of their names that fits sqlite's user_version.
+        """
+        names = "\n".join(self.todo).encode("utf-8")
+        return (zlib.crc32(names) & 0x7FFFFFFF) or 1
+
+    @property
+    def schema_version(self) -> int:
+        return self.database.execute_sql("PRAGMA user_version").fetchone()[0]
+
+    @schema_version.setter
+    def schema_version(self, version: int):
+        self.database.execute_sql(f"PRAGMA user_version = {int(version)}")
+
     @property
     def diff(self) -> t.List[str]:
         """
@@ -393,19 +414,37 @@ class MigrationManager(object):
     def clear(self):
         """Clear migrations."""
         self.model.delete().execute()
+        self.schema_version = 0
 
     def up(self, name: t.Optional[str] = None):
         """
         Runs all unapplied migrations.
         """
+        started = time.perf_counter()
+        db_name = os.path.basename(str(self.database.database))
         logger.info("Starting migrations")
         Console.info("Starting migrations")
 
+        # the database records which set of migrations it is up to date
+        # with, if that's the set on disk there's nothing to look at
+        fingerprint = self.fingerprint
+        if self.schema_version == fingerprint:
+            logger.info(f"Schema of {db_name} is up to date")
+            Console.info("There is nothing to migrate")
+            BootProfile().record(
+                f"migrations {db_name} (up to date)", time.perf_counter() - started
+            )
+            return []
+
         done = []
         diff = self.diff
         if not diff:
             logger.info("There is nothing to migrate")
             Console.info("There is nothing to migrate")
+            self.schema_version = fingerprint
+            BootProfile().record(
+                f"migrations {db_name} (up to date)", time.perf_counter() - started
+            )
             return done
 
         migrator = self.migrator
@@ -414,6 +453,12 @@ class MigrationManager(object):
             if name and name == mname:
                 break
 
+        if len(done) == len(diff):
+            self.schema_version = fingerprint
+        BootProfile().record(
+            f"migrations {db_name} ({len(done)} applied)",
+            time.perf_counter() - started,
+        )
         return done
 
     def read(self, name: str):
@@ -424,16 +469,20 @@ class MigrationManager(object):
         if Helpers.is_os_windows() and sys.version_info >= (3, 0):
             # if system is windows - force utf-8 encoding
             call_params["encoding"] = "utf-8"
-        with open(
-            os.path.join(self.helper.migration_dir, name + ".py"), **call_params
-        ) as f:
-            code = f.read()
-            scope = {}
-            code = compile(code, "<string>", "exec", dont_inherit=True)
-            exec(code, scope, None)
-            return scope.get("migrate", lambda m, d: None), scope.get(
-                "rollback", lambda m, d: None
-            )
+        path = os.path.join(self.helper.migration_dir, name + ".py")
+        mtime = os.stat(path).st_mtime_ns
+        cached = MigrationManager.compiled.get(path)
+        if cached is not None and cached[0] == mtime:
+            code = cached[1]
+        else:
+            with open(path, **call_params) as f:
+                code = compile(f.read(), "<string>", "exec", dont_inherit=True)
+            MigrationManager.compiled[path] = (mtime, code)
+        scope = {}
+        exec(code, scope, None)
+        return scope.get("migrate", lambda m, d: None), scope.get(
+            "rollback", lambda m, d: None
+        )
 
     def up_one(
         self, name: str, migrator: Migrator, fake: bool = False, rollback: bool = False
@@ -453,11 +502,12 @@ class MigrationManager(object):
                     rollback_fn(migrator, self.database)
                     migrator.run()
                     self.model.delete().where(self.model.name == name).execute()
+                    self.schema_version = 0
                 else:
                     logger.info('Migrate "{}"'.format(name))
                     migrate_fn(migrator, self.database)
                     migrator.run()
-                    if name not in self.done:
+                    if not self.model.select().where(self.model.name == name).exists():
                         self.model.create(name=name)
 
                 logger.info('Done "{}"'.format(name))
@@ -0,0 +1,299 @@
+from contextlib import redirect_stderr
+import os
+import math
+import time
+import logging
+import threading
+
+from app.classes.minecraft.stats import ProcessSampler
+from app.classes.shared.helpers import Helpers
+from app.classes.shared.null_writer import NullWriter
+
+with redirect_stderr(NullWriter()):
+    import psutil
+
+logger = logging.getLogger(__name__)
+
+CGROUP_MOUNT = "/sys/fs/cgroup"
+CGROUP_CONTROLLERS = ["cpu", "memory", "io"]
+# the leaf Crafty moves itself into, so its own cgroup may have children
+CGROUP_LEAF = "crafty"
+
+
+class ProcessIsolation:
+    """
+    Optional per-server resource isolation.
+
+    When enabled, every server process tree is placed in its own cgroup v2
+    group with the configured cpu weight, memory max and io weight. If cgroups
+    are not usable we fall back to nice/ionice on the launched process, which
+    can't cap memory.
+
+    Nothing runs between fork and exec, Crafty has too many threads for that
+    to be safe. The server is moved into its cgroup (or reniced) by pid right
+    after it was started, see apply_to.
+    """
+
+    # the cgroup servers are created in, set up once per process
+    cgroup_root = None
+    cgroup_root_lock = threading.Lock()
+
+    def __init__(self, helper, server_id):
+        self.helper: Helpers = helper
+        self.server_id = server_id
+        self.enabled = False
+        self.cpu_weight = 100
+        self.memory_max = 0
+        self.io_weight = 100
+        self.cgroup_path = None
+        self.last_cpu_usec = None
+        self.last_cpu_time = None
+        self.last_result = None
+
+    def reload_settings(self):
+        self.enabled = bool(self.helper.get_setting("server_isolation", False))
+        self.cpu_weight = ProcessIsolation._clamp(
+            int(self.helper.get_setting("server_cpu_weight", 100)), 1, 10000
+        )
+        self.memory_max = (
+            max(int(self.helper.get_setting("server_memory_max_mb", 0)), 0)
+            * 1024
+            * 1024
+        )
+        self.io_weight = ProcessIsolation._clamp(
+            int(self.helper.get_setting("server_io_weight", 100)), 1, 10000
+        )
+
+    @staticmethod
+    def _clamp(value, low, high):
+        return max(low, min(high, value))
+
+    # **********************************************************************************
+    #                                   cgroup v2
+    # **********************************************************************************
+    @staticmethod
+    def cgroups_available():
+        if Helpers.is_os_windows():
+            return False
+        return os.path.isfile(os.path.join(CGROUP_MOUNT, "cgroup.controllers"))
+
+    @staticmethod
+    def get_own_cgroup():
+        # On a unified (v2) hierarchy this file has a single "0::/path" line
+        try:
+            with open("/proc/self/cgroup", "r", encoding="utf-8") as f:
+                for line in f.readlines():
+                    if line.startswith("0::"):
+                        return os.path.join(CGROUP_MOUNT, line[3:].strip().lstrip("/"))
+        except OSError as e:
+            logger.debug(f"Unable to read our own cgroup: {e}")
+        return None
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(str(value))
+
+    @staticmethod
+    def _delegate_root():
+        """
+        Our own cgroup, with its controllers enabled for children.
+
+        cgroup v2 doesn't let a group that has processes of its own hand out
+        controllers (no internal processes rule, EBUSY), so every process in
+        it, Crafty included, is moved into a leaf child first. Servers become
+        siblings of that leaf.
+        """
+        with ProcessIsolation.cgroup_root_lock:
+            if ProcessIsolation.cgroup_root is not None:
+                return ProcessIsolation.cgroup_root
+            root = ProcessIsolation.get_own_cgroup()
+            if root is None:
+                return None
+            if os.path.basename(root) == CGROUP_LEAF:
+                # started inside the leaf already
+                root = os.path.dirname(root)
+            leaf = os.path.join(root, CGROUP_LEAF)
+            Helpers.ensure_dir_exists(leaf)
+            with open(os.path.join(root, "cgroup.procs"), "r", encoding="utf-8") as f:
+                pids = f.read().split()
+            for pid in pids:
+                try:
+                    ProcessIsolation._write(os.path.join(leaf, "cgroup.procs"), pid)
+                except OSError as e:
+                    # kernel threads and processes we don't own stay behind,
+                    # enabling the controllers below fails then
+                    logger.debug(f"Unable to move pid {pid} into {leaf}: {e}")
+
+            with open(
+                os.path.join(root, "cgroup.controllers"), "r", encoding="utf-8"
+            ) as f:
+                available = f.read().split()
+            controllers = [c for c in CGROUP_CONTROLLERS if c in available]
+            # children only get the controllers their parent delegates to them
+            ProcessIsolation._write(
+                os.path.join(root, "cgroup.subtree_control"),
+                " ".join(f"+{c}" for c in controllers),
+            )
+            ProcessIsolation.cgroup_root = (root, controllers)
+            return ProcessIsolation.cgroup_root
+
+    def _setup_cgroup(self):
+        try:
+            delegated = ProcessIsolation._delegate_root()
+            if delegated is None:
+                return None
+            parent, controllers = delegated
+            cgroup_path = os.path.join(parent, f"crafty_server_{self.server_id}")
+            Helpers.ensure_dir_exists(cgroup_path)
+            if "cpu" in controllers:
+                ProcessIsolation._write(
+                    os.path.join(cgroup_path, "cpu.weight"), self.cpu_weight
+                )
+            if "memory" in controllers:
+                ProcessIsolation._write(
+                    os.path.join(cgroup_path, "memory.max"),
+                    self.memory_max if self.memory_max > 0 else "max",
+                )
+            if "io" in controllers:
+                ProcessIsolation._write(
+                    os.path.join(cgroup_path, "io.weight"), f"default {self.io_weight}"
+                )
+            return cgroup_path
+        except OSError as e:
+            logger.warning(
+                f"Unable to create a cgroup for server {self.server_id}, "
+                f"falling back to nice/ionice: {e}"
+            )
+            return None
+
+    def remove_cgroup(self):
+        if self.cgroup_path is None:
+            return
+        try:
+            # only succeeds once every process in the group has exited
+            os.rmdir(self.cgroup_path)
+        except OSError as e:
+            logger.debug(f"Could not remove cgroup {self.cgroup_path}: {e}")
+        self.cgroup_path = None
+        self.last_cpu_usec = None
+        self.last_cpu_time = None
+        self.last_result = None
+
+    # **********************************************************************************
+    #                                   nice fallback
+    # **********************************************************************************
+    def _nice_value(self):
+        # Each nice level is roughly a 1.25x weight change in CFS,
+        # weight 100 (the cgroup default) maps to nice 0
+        nice = round(math.log(100 / self.cpu_weight, 1.25))
+        # unprivileged users may only lower their priority
+        return ProcessIsolation._clamp(nice, 0, 19)
+
+    def _ionice_level(self):
+        # best effort levels go from 0 (highest) to 7, default is 4
+        return ProcessIsolation._clamp(4 - round(math.log2(self.io_weight / 100)), 0, 7)
+
+    def _apply_fallback_limits(self, pid):
+        # There is no rlimit for memory that works with the JVM: RLIMIT_AS
+        # counts the address space it reserves (heap, metaspace, code cache,
+        # malloc arenas, thread stacks), which is far more than -Xmx.
+        if self.memory_max > 0:
+            logger.warning(
+                f"server_memory_max_mb needs cgroups, the memory of server "
+                f"{self.server_id} is not limited"
+            )
+        try:
+            process = psutil.Process(pid)
+            nice = self._nice_value()
+            if nice > 0:
+                process.nice(nice)
+            process.ionice(psutil.IOPRIO_CLASS_BE, self._ionice_level())
+        except (AttributeError, psutil.Error, OSError) as e:
+            logger.debug(f"Unable to renice server {self.server_id}: {e}")
+
+    def popen_kwargs(self):
+        """
+        Extra arguments for subprocess.Popen, the new server process gets
+        its own session so signals to Crafty don't reach it.
+        """
+        self.reload_settings()
+        if not self.enabled or Helpers.is_os_windows():
+            return {}
+
+        if ProcessIsolation.cgroups_available():
+            self.cgroup_path = self._setup_cgroup()
+        if self.cgroup_path:
+            logger.info(f"Isolating server {self.server_id} in {self.cgroup_path}")
+        else:
+            logger.info(f"Isolating server {self.server_id} with nice/ionice")
+        return {"start_new_session": True}
+
+    def apply_to(self, pid):
+        """Moves a just started server process into its cgroup, or renices it."""
+        if not self.enabled or Helpers.is_os_windows():
+            return
+        if self.cgroup_path is not None:
+            try:
+                # children the server starts from now on inherit the cgroup
+                ProcessIsolation._write(
+                    os.path.join(self.cgroup_path, "cgroup.procs"), pid
+                )
+                return
+            except OSError as e:
+                logger.warning(
+                    f"Unable to move server {self.server_id} into "
+                    f"{self.cgroup_path}, falling back to nice/ionice: {e}"
+                )
+        self._apply_fallback_limits(pid)
+
+    # **********************************************************************************
+    #                                   Stats
+    # **********************************************************************************
+    def get_stats(self):
+        """
+        Reads cpu and memory usage for the whole server process tree straight
+        from the cgroup counters. Returns None if the server isn't in a cgroup.
+        """
+        if self.cgroup_path is None:
+            return None
+        now = time.monotonic()
+        if (
+            self.last_result is not None
+            and now - self.last_cpu_time < ProcessSampler.min_interval
+        ):
+            return self.last_result
+        try:
+            with open(
+                os.path.join(self.cgroup_path, "cpu.stat"), "r", encoding="utf-8"
+            ) as f:
+                cpu_usec = int(f.readline().split()[1])
+            with open(
+                os.path.join(self.cgroup_path, "memory.current"), "r", encoding="utf-8"
+            ) as f:
+                mem_bytes = int(f.read().strip())
+        except (OSError, ValueError, IndexError) as e:
+            logger.debug(f"Unable to read cgroup stats for {self.cgroup_path}: {e}")
+            return None
+
+        cpu_usage = 0
+        if self.last_cpu_usec is not None and now > self.last_cpu_time:
+            elapsed_usec = (now - self.last_cpu_time) * 1_000_000
+            cpu_usage = round(
+                (cpu_usec - self.last_cpu_usec)
+                / elapsed_usec
+                * 100
+                / psutil.cpu_count(),
+                2,
+            )
+        self.last_cpu_usec = cpu_usec
+        self.last_cpu_time = now
+
+        mem_total = psutil.virtual_memory().total
+        self.last_result = {
+            "cpu_usage": cpu_usage,
+            "memory_usage": Helpers.human_readable_file_size(mem_bytes),
+            "mem_percentage": round(mem_bytes / mem_total * 100, 0),
+            "mem_raw": mem_bytes,
+        }
+        return self.last_result
@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressTracker:
+    """
+    Progress of a long running file operation, updated by the worker doing
+    the writing. Totals are set once when the job starts, after that updating
+    is just adding to counters, so the writer can call advance() per file.
+    """
+
+    def __init__(self, key, on_update=None):
+        self.key = key
+        self.on_update = on_update
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+        self.total_files = 0
+        self.done_bytes = 0
+        self.done_files = 0
+        self.current_file = None
+        self.finished = False
+        self.started = time.monotonic()
+        # bumped on every change so the publisher can skip idle trackers
+        self.version = 0
+        self.updated = self.started
+
+    def start(self, total_bytes, total_files):
+        with self.lock:
+            self.total_bytes = total_bytes
+            self.total_files = total_files
+            self.done_bytes = 0
+            self.done_files = 0
+            self.finished = False
+            self.started = time.monotonic()
+            self.version += 1
+            self.updated = time.monotonic()
+
+    def add_total(self, num_bytes, files):
+        """Grows the totals, for jobs made of steps that are sized one by one."""
+        with self.lock:
+            self.total_bytes += num_bytes
+            self.total_files += files
+            self.finished = False
+            self.version += 1
+            self.updated = time.monotonic()
+
+    def advance(self, num_bytes, files=1, current_file=None):
+        with self.lock:
+            self.done_bytes += num_bytes
+            self.done_files += files
+            self.current_file = current_file
+            self.version += 1
+            self.updated = time.monotonic()
+
+    def finish(self):
+        with self.lock:
+            self.done_bytes = self.total_bytes
+            self.done_files = self.total_files
+            self.finished = True
+            self.version += 1
+            self.updated = time.monotonic()
+
+    def percent(self):
+        if self.finished:
+            return 100
+        if not self.total_bytes:
+            return 0
+        return min(round(self.done_bytes / self.total_bytes * 100, 1), 100)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "percent": self.percent(),
+                "total_files": self.total_files,
+                "current_file": self.done_files,
+                "total_bytes": self.total_bytes,
+                "done_bytes": self.done_bytes,
+                "finished": self.finished,
+            }
+
+
+class ProgressRegistry(metaclass=Singleton):
+    """
+    Keeps the trackers of running jobs and publishes their progress at most
+    once per publish_interval, only for trackers that changed since the last
+    round. Reading progress is a dictionary lookup, never a filesystem walk.
+
+    Finished trackers are dropped once their final state was published and
+    finished_max_age passed, trackers of jobs that died without finishing
+    after idle_max_age without an update.
+    """
+
+    publish_interval = 1.0
+    finished_max_age = 60
+    idle_max_age = 60 * 60
+
+    def __init__(self):
+        self.trackers = {}
+        self.published = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def create(self, key, on_update=None) -> ProgressTracker:
+        tracker = ProgressTracker(key, on_update)
+        with self.lock:
+            self.trackers[key] = tracker
+            self.published.pop(key, None)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run, daemon=True, name="progress_publisher"
+                )
+                self.thread.start()
+        return tracker
+
+    def get(self, key):
+        with self.lock:
+            return self.trackers.get(key)
+
+    def snapshot(self, key, default=None):
+        tracker = self.get(key)
+        if tracker is None:
+            return default
+        return tracker.snapshot()
+
+    def publish(self, tracker: ProgressTracker):
+        if tracker.on_update is None:
+            return
+        try:
+            tracker.on_update(tracker.snapshot())
+        except Exception as e:
+            logger.error(f"Unable to publish progress of {tracker.key}: {e}")
+
+    def _evict(self, tracker: ProgressTracker):
+        idle = time.monotonic() - tracker.updated
+        if tracker.finished:
+            if idle < ProgressRegistry.finished_max_age:
+                return
+        elif idle < ProgressRegistry.idle_max_age:
+            return
+        with self.lock:
+            # create() may have replaced it under the same key
+            if self.trackers.get(tracker.key) is tracker:
+                del self.trackers[tracker.key]
+                self.published.pop(tracker.key, None)
+
+    def _run(self):
+        while True:
+            time.sleep(ProgressRegistry.publish_interval)
+            with self.lock:
+                trackers = list(self.trackers.values())
+            for tracker in trackers:
+                if self.published.get(tracker.key) == tracker.version:
+                    self._evict(tracker)
+                    continue
+                self.published[tracker.key] = tracker.version
+                self.publish(tracker)
@@ -0,0 +1,43 @@
+import time
+import threading
+
+
+class RateLimiter:
+    """
+    Token bucket per client key (usually the remote ip). Each key may do
+    `rate` requests per `per` seconds, with bursts up to `rate`.
+    """
+
+    # buckets idle for this long are full again and can be forgotten
+    cleanup_interval = 300
+
+    def __init__(self, rate, per=60.0):
+        self.rate = max(float(rate), 1.0)
+        self.per = float(per)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_cleanup = time.monotonic()
+
+    def allow(self, key) -> bool:
+        now = time.monotonic()
+        refill = self.rate / self.per
+        with self.lock:
+            tokens, last = self.buckets.get(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+
+            if now - self.last_cleanup > RateLimiter.cleanup_interval:
+                self.last_cleanup = now
+                full_after = self.per
+                self.buckets = {
+                    k: v for k, v in self.buckets.items() if now - v[1] < full_after
+                }
+        return allowed
+
+    def retry_after(self, key) -> int:
+        with self.lock:
+            tokens, _last = self.buckets.get(key, (self.rate, 0))
+        return max(int((1 - tokens) * self.per / self.rate) + 1, 1)
@@ -5,6 +5,7 @@ import shutil
 import time
 import datetime
 import base64
+import queue
 import threading
 import logging.config
 import subprocess
@@ -16,7 +17,7 @@ from tzlocal.utils import ZoneInfoNotFoundError
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.base import JobLookupError
 
-from app.classes.minecraft.stats import Stats
+from app.classes.minecraft.stats import Stats, ProcessSampler
 from app.classes.minecraft.mc_ping import ping, ping_bedrock
 from app.classes.models.servers import HelperServers, Servers
 from app.classes.models.server_stats import HelperServerStats
@@ -24,9 +25,18 @@ from app.classes.models.management import HelpersManagement
 from app.classes.models.users import HelperUsers
 from app.classes.models.server_permissions import PermissionsServers
 from app.classes.shared.console import Console
+from app.classes.shared.console_subscriptions import ConsoleSubscriptions
+from app.classes.shared.console_events import (
+    ConsoleEventBus,
+    ConsoleEventMatcher,
+    ConsoleEventType,
+)
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.file_helpers import FileHelpers
 from app.classes.shared.null_writer import NullWriter
+from app.classes.shared.process_isolation import ProcessIsolation
+from app.classes.shared.progress_tracker import ProgressRegistry
+from app.classes.shared.status_snapshot import StatusSnapshot
 
 with redirect_stderr(NullWriter()):
     import psutil
@@ -81,20 +91,127 @@ class ServerOutBuf:
     def new_line_handler(self, new_line):
         new_line = re.sub("(\033\\[(0;)?[0-9]*[A-z]?(;[0-9])?m?)", " ", new_line)
         new_line = re.sub("[A-z]{2}\b\b", "", new_line)
+
+        event = ConsoleEventMatcher.match(new_line)
+        if event is not None:
+            ConsoleEventBus().publish(self.server_id, *event)
+
+        # only escape and highlight lines somebody subscribed to
+        clients = ConsoleSubscriptions().matching_clients(self.server_id, new_line)
+        if not clients:
+            return
         highlighted = self.helper.log_colors(html.escape(new_line))
 
         logger.debug("Broadcasting new virtual terminal line")
 
-        # TODO: Do not send data to clients who do not have permission to view
-        # this server's console
-        self.helper.websocket_helper.broadcast_page_params(
-            "/panel/server_detail",
-            {"id": self.server_id},
+        self.helper.websocket_helper.send_to_clients(
+            clients,
             "vterm_new_line",
             {"line": highlighted + "<br />"},
         )
 
 
+class ServerCommandWriter:
+    """
+    Owns a server's stdin. Commands are queued and written by a dedicated
+    thread so a server that stops reading its stdin can only block that thread,
+    never the scheduler or web threads that send commands.
+    """
+
+    max_queue = 100
+    # how long send() waits, in total, for the command to be queued and
+    # written before giving up
+    write_timeout = 5
+
+    def __init__(self, proc, server_id):
+        self.proc = proc
+        self.server_id = str(server_id)
+        self.commands = queue.Queue(maxsize=ServerCommandWriter.max_queue)
+        self.metrics = {
+            "queued": 0,
+            "written": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "last_write_ms": 0,
+        }
+
+    def start(self):
+        threading.Thread(
+            target=self.write_loop,
+            daemon=True,
+            name=f"{self.server_id}_command_writer",
+        ).start()
+
+    def send(self, command, wait=True):
+        """
+        Queues a command for the server. When wait is set, returns whether the
+        command was written to stdin within write_timeout, otherwise whether it
+        was queued (a full queue is given up on at once).
+        """
+        deadline = time.monotonic() + ServerCommandWriter.write_timeout
+        delivered = threading.Event()
+        item = {"data": f"{command}\n".encode("utf-8"), "delivered": delivered}
+        try:
+            if wait:
+                self.commands.put(item, timeout=ServerCommandWriter.write_timeout)
+            else:
+                self.commands.put_nowait(item)
+        except queue.Full:
+            self.metrics["rejected"] += 1
+            logger.error(
+                f"Command queue for server {self.server_id} is full, "
+                f"dropping command {command}"
+            )
+            return False
+        self.metrics["queued"] += 1
+        if not wait:
+            return True
+        if not delivered.wait(max(deadline - time.monotonic(), 0)):
+            self.metrics["timed_out"] += 1
+            logger.warning(
+                f"Server {self.server_id} did not accept command {command} "
+                f"within {ServerCommandWriter.write_timeout} seconds"
+            )
+            return False
+        return item.get("ok", False)
+
+    def queue_depth(self):
+        return self.commands.qsize()
+
+    def write_loop(self):
+        while self.proc.poll() is None:
+            try:
+                item = self.commands.get(timeout=1)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                self.proc.stdin.write(item["data"])
+                self.proc.stdin.flush()
+                item["ok"] = True
+                self.metrics["written"] += 1
+            except (OSError, ValueError) as e:
+                item["ok"] = False
+                self.metrics["failed"] += 1
+                logger.error(
+                    f"Unable to write to stdin of server {self.server_id}: {e}"
+                )
+            self.metrics["last_write_ms"] = round(
+                (time.perf_counter() - started) * 1000, 2
+            )
+            item["delivered"].set()
+
+        # fail anything still waiting so senders don't wait out their timeout
+        while True:
+            try:
+                item = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            item["ok"] = False
+            item["delivered"].set()
+
+
 # **********************************************************************************
 #                               Minecraft Server Class
 # **********************************************************************************
@@ -105,6 +222,8 @@ class ServerInstance:
     management_helper: HelpersManagement
     stats: Stats
     stats_helper: HelperServerStats
+    # seconds a ping answer of a ready server is reused for
+    ready_ping_max_age = 300
 
     def __init__(self, server_id, helper, management_helper, stats, file_helper):
         self.helper = helper
@@ -112,6 +231,7 @@ class ServerInstance:
         self.management_helper = management_helper
         # holders for our process
         self.process = None
+        self.command_writer = None
         self.line = False
         self.start_time = None
         self.server_command = None
@@ -128,6 +248,17 @@ class ServerInstance:
         self.server_object = HelperServers.get_server_obj(self.server_id)
         self.stats_helper = HelperServerStats(self.server_id)
         self.last_backup_failed = False
+        self.isolation = ProcessIsolation(self.helper, self.server_id)
+        self.process_sampler = ProcessSampler()
+        # live state kept up to date from console events
+        self.online_players = frozenset()
+        self.server_ready = False
+        self.last_lag_ms = 0
+        self.last_save_time = None
+        # ping answer taken once the server was ready, see get_servers_stats
+        self.ready_ping_data = None
+        self.ready_ping_at = 0.0
+        ConsoleEventBus().subscribe(self.handle_console_event, self.server_id)
         try:
             tz = get_localzone()
         except ZoneInfoNotFoundError:
@@ -374,6 +505,8 @@ class ServerInstance:
                 )
             return
 
+        isolation_kwargs = self.isolation.popen_kwargs()
+
         if (
             not Helpers.is_os_windows()
             and HelperServers.get_server_type_by_id(self.server_id)
@@ -393,6 +526,7 @@ class ServerInstance:
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
                     env=my_env,
+                    **isolation_kwargs,
                 )
             except Exception as ex:
                 logger.error(
@@ -418,6 +552,7 @@ class ServerInstance:
                     stdin=subprocess.PIPE,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
+                    **isolation_kwargs,
                 )
             except Exception as ex:
                 # Checks for java on initial fail
@@ -448,7 +583,11 @@ class ServerInstance:
                     )
                 return False
 
+        self.isolation.apply_to(self.process.pid)
+        self.reset_console_state()
         out_buf = ServerOutBuf(self.helper, self.process, self.server_id)
+        self.command_writer = ServerCommandWriter(self.process, self.server_id)
+        self.command_writer.start()
 
         logger.debug(f"Starting virtual terminal listener for server {self.name}")
         threading.Thread(
@@ -661,6 +800,54 @@ class ServerInstance:
         self.is_crashed = False
         self.updating = False
         self.process = None
+        self.command_writer = None
+        self.isolation.remove_cgroup()
+        self.process_sampler.reset()
+        self.reset_console_state()
+
+    def reset_console_state(self):
+        self.online_players = frozenset()
+        self.server_ready = False
+        self.last_lag_ms = 0
+        self.last_save_time = None
+        self.ready_ping_data = None
+
+    def handle_console_event(self, _server_id, event_type, value):
+        if event_type == ConsoleEventType.SERVER_READY:
+            self.server_ready = True
+            logger.info(f"Server {self.name} is ready (startup took {value}s)")
+        elif event_type == ConsoleEventType.PLAYER_JOIN:
+            # replaced, never changed in place, the stats thread reads it
+            self.online_players = self.online_players | {value}
+        elif event_type == ConsoleEventType.PLAYER_LEAVE:
+            self.online_players = self.online_players - {value}
+        elif event_type == ConsoleEventType.SERVER_LAG:
+            self.last_lag_ms = int(value)
+            logger.warning(f"Server {self.name} can't keep up, {value}ms behind")
+        elif event_type == ConsoleEventType.SAVE_COMPLETE:
+            self.last_save_time = datetime.datetime.now()
+
+        event_data = {
+            "id": self.server_id,
+            "event": event_type,
+            "value": value,
+            "ready": self.server_ready,
+            "players": sorted(self.online_players),
+            "online": len(self.online_players),
+            "lag_ms": self.last_lag_ms,
+        }
+        try:
+            self.helper.websocket_helper.broadcast_page_params(
+                "/panel/server_detail",
+                {"id": str(self.server_id)},
+                "server_event",
+                event_data,
+            )
+            self.helper.websocket_helper.broadcast_page(
+                "/panel/dashboard", "server_event", event_data
+            )
+        except Exception as e:
+            logger.error(f"Unable to broadcast console event for {self.name}: {e}")
 
     def check_running(self):
         # if process is None, we never tried to start
@@ -672,17 +859,21 @@ class ServerInstance:
         self.last_rc = poll
         return False
 
-    def send_command(self, command):
+    def send_command(self, command, wait=True):
         if not self.check_running() and command.lower() != "start":
             logger.warning(f'Server not running, unable to send command "{command}"')
             return False
         Console.info(f"COMMAND TIME: {command}")
         logger.debug(f"Sending command {command} to server")
 
-        # send it
-        self.process.stdin.write(f"{command}\n".encode("utf-8"))
-        self.process.stdin.flush()
-        return True
+        if self.command_writer is None:
+            logger.warning(f'No command writer for server, unable to send "{command}"')
+            return False
+
+        # send it, with wait this blocks for up to the writer timeout, which
+        # is why code on the IOLoop either doesn't wait or runs this in the
+        # BlockingPool
+        return self.command_writer.send(command, wait)
 
     def crash_detected(self, name):
 
@@ -961,25 +1152,14 @@ class ServerInstance:
                 self.run_threaded_server(HelperUsers.get_user_id_by_name("system"))
             self.last_backup_failed = True
 
-    def backup_status(self, source_path, dest_path):
-        results = Helpers.calc_percent(source_path, dest_path)
-        self.backup_stats = results
-        if len(self.helper.websocket_helper.clients) > 0:
-            self.helper.websocket_helper.broadcast_page_params(
-                "/panel/server_detail",
-                {"id": str(self.server_id)},
-                "backup_status",
-                results,
-            )
-
     def last_backup_status(self):
         return self.last_backup_failed
 
     def send_backup_status(self):
-        try:
-            return self.backup_stats
-        except:
+        results = ProgressRegistry().snapshot(("backup", str(self.server_id)))
+        if results is None:
             return {"percent": 0, "total_files": 0}
+        return FileHelpers.backup_results(results)
 
     def list_backups(self):
         if not self.settings["backup_path"]:
@@ -1017,7 +1197,7 @@ class ServerInstance:
         update_thread.start()
 
     def check_update(self):
-        return self.stats_helper.get_server_stats()["updating"]
+        return self.stats_helper.get_update_status()
 
     def a_jar_update(self):
         was_started = "-1"
@@ -1083,11 +1263,11 @@ class ServerInstance:
         FileHelpers.copy_file(current_executable, backup_executable)
 
         # boolean returns true for false for success
-        downloaded = Helpers.download_file(
+        downloaded = self.helper.download_file(
             self.settings["executable_update_url"], current_executable
         )
 
-        while self.stats_helper.get_server_stats()["updating"]:
+        while self.stats_helper.get_update_status():
             if downloaded and not self.is_backingup:
                 logger.info("Executable updated successfully. Starting Server")
 
@@ -1224,6 +1404,15 @@ class ServerInstance:
             except:
                 Console.critical("Can't broadcast server status to websocket")
 
+    def get_process_stats(self):
+        # servers isolated in a cgroup get their stats from the cgroup counters,
+        # which covers the whole process tree without walking it
+        if self.check_running():
+            cgroup_stats = self.isolation.get_stats()
+            if cgroup_stats is not None:
+                return cgroup_stats
+        return self.process_sampler.try_sample(self.process, self.check_running())
+
     def get_servers_stats(self):
 
         server_stats = {}
@@ -1231,45 +1420,56 @@ class ServerInstance:
         logger.info("Getting Stats for Server " + self.name + " ...")
 
         server_id = self.server_id
-        server = HelperServers.get_server_data_by_id(server_id)
 
         logger.debug(f"Getting stats for server: {server_id}")
 
         # get our server object, settings and data dictionaries
         self.reload_server_settings()
+        server = self.settings
 
         # world data
         server_path = server["path"]
 
         # process stats
-        p_stats = Stats._try_get_process_stats(self.process, self.check_running())
+        p_stats = self.get_process_stats()
 
         internal_ip = server["server_ip"]
         server_port = server["server_port"]
         server_name = server.get("server_name", f"ID#{server_id}")
 
-        logger.debug(f"Pinging server '{server}' on {internal_ip}:{server_port}")
-        if HelperServers.get_server_type_by_id(server_id) == "minecraft-bedrock":
-            int_mc_ping = ping_bedrock(internal_ip, int(server_port))
-        else:
-            try:
-                int_mc_ping = ping(internal_ip, int(server_port))
-            except:
-                int_mc_ping = False
-
-        int_data = False
-        ping_data = {}
-
-        # if we got a good ping return, let's parse it
-        if int_mc_ping:
-            int_data = True
-            if (
-                HelperServers.get_server_type_by_id(server["server_id"])
-                == "minecraft-bedrock"
-            ):
-                ping_data = Stats.parse_server_raknet_ping(int_mc_ping)
+        # Once the console reported the server ready, players come from the
+        # join and leave events and a ping answer is reused for a while for
+        # the slots, description and version. Until then, or when the console
+        # output isn't recognised, the server is pinged every time.
+        int_data = (
+            self.ready_ping_data is not None
+            and time.monotonic() - self.ready_ping_at
+            < ServerInstance.ready_ping_max_age
+        )
+        ping_data = self.ready_ping_data if int_data else {}
+        if not int_data:
+            logger.debug(f"Pinging server '{server}' on {internal_ip}:{server_port}")
+            if server["type"] == "minecraft-bedrock":
+                int_mc_ping = ping_bedrock(internal_ip, int(server_port))
             else:
-                ping_data = Stats.parse_server_ping(int_mc_ping)
+                try:
+                    int_mc_ping = ping(internal_ip, int(server_port))
+                except:
+                    int_mc_ping = False
+
+            # if we got a good ping return, let's parse it
+            if int_mc_ping:
+                int_data = True
+                if server["type"] == "minecraft-bedrock":
+                    ping_data = Stats.parse_server_raknet_ping(int_mc_ping)
+                else:
+                    ping_data = Stats.parse_server_ping(int_mc_ping)
+                if self.server_ready:
+                    self.ready_ping_data = ping_data
+                    self.ready_ping_at = time.monotonic()
+        if self.server_ready:
+            players = self.online_players
+            ping_data = dict(ping_data, online=len(players), players=sorted(players))
         # Makes sure we only show stats when a server is online
         # otherwise people have gotten confused.
         if self.check_running():
@@ -1281,7 +1481,7 @@ class ServerInstance:
                 "mem": p_stats.get("memory_usage", 0),
                 "mem_percent": p_stats.get("mem_percentage", 0),
                 "world_name": server_name,
-                "world_size": Stats.get_world_size(server_path),
+                "world_size": self.stats.get_world_size(server_path),
                 "server_port": server_port,
                 "int_ping_results": int_data,
                 "online": ping_data.get("online", False),
@@ -1299,7 +1499,7 @@ class ServerInstance:
                 "mem": p_stats.get("memory_usage", 0),
                 "mem_percent": p_stats.get("mem_percentage", 0),
                 "world_name": server_name,
-                "world_size": Stats.get_world_size(server_path),
+                "world_size": self.stats.get_world_size(server_path),
                 "server_port": server_port,
                 "int_ping_results": int_data,
                 "online": False,
@@ -1312,6 +1512,9 @@ class ServerInstance:
         return server_stats
 
     def get_server_players(self):
+        if self.server_ready:
+            # kept up to date from the console, see handle_console_event
+            return sorted(self.online_players)
 
         server = HelperServers.get_server_data_by_id(self.server_id)
 
@@ -1372,7 +1575,7 @@ class ServerInstance:
         server_path = server_dt["path"]
 
         # process stats
-        p_stats = Stats._try_get_process_stats(self.process, self.check_running())
+        p_stats = self.get_process_stats()
 
         internal_ip = server_dt["server_ip"]
         server_port = server_dt["server_port"]
@@ -1402,7 +1605,7 @@ class ServerInstance:
                     "mem": p_stats.get("memory_usage", 0),
                     "mem_percent": p_stats.get("mem_percentage", 0),
                     "world_name": server_name,
-                    "world_size": Stats.get_world_size(server_path),
+                    "world_size": self.stats.get_world_size(server_path),
                     "server_port": server_port,
                     "int_ping_results": int_data,
                     "online": ping_data.get("online", False),
@@ -1431,7 +1634,7 @@ class ServerInstance:
                         "mem": p_stats.get("memory_usage", 0),
                         "mem_percent": p_stats.get("mem_percentage", 0),
                         "world_name": server_name,
-                        "world_size": Stats.get_world_size(server_path),
+                        "world_size": self.stats.get_world_size(server_path),
                         "server_port": server_port,
                         "int_ping_results": int_data,
                         "online": ping_data["online"],
@@ -1450,7 +1653,7 @@ class ServerInstance:
                         "mem": p_stats.get("memory_usage", 0),
                         "mem_percent": p_stats.get("mem_percentage", 0),
                         "world_name": server_name,
-                        "world_size": Stats.get_world_size(server_path),
+                        "world_size": self.stats.get_world_size(server_path),
                         "server_port": server_port,
                         "int_ping_results": int_data,
                         "online": False,
@@ -1469,7 +1672,7 @@ class ServerInstance:
                 "mem": p_stats.get("memory_usage", 0),
                 "mem_percent": p_stats.get("mem_percentage", 0),
                 "world_name": server_name,
-                "world_size": Stats.get_world_size(server_path),
+                "world_size": self.stats.get_world_size(server_path),
                 "server_port": server_port,
                 "int_ping_results": int_data,
                 "online": False,
@@ -1484,11 +1687,10 @@ class ServerInstance:
     def record_server_stats(self):
 
         server_stats = self.get_servers_stats()
-        self.stats_helper.insert_server_stats(server_stats)
-
-        # delete old data
-        max_age = self.helper.get_setting("history_max_age")
-        now = datetime.datetime.now()
-        minimum_to_exist = now - datetime.timedelta(days=max_age)
+        # refreshed by get_servers_stats
+        server_data = self.settings
+        # history retention is handled by the metrics store dropping partitions
+        self.stats_helper.insert_server_stats(server_stats, server_data)
 
-        self.stats_helper.remove_old_stats(minimum_to_exist)
+        if server_data:
+            StatusSnapshot().update(server_data, server_stats)
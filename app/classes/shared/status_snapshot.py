@@ -0,0 +1,119 @@
+import time
+import logging
+import threading
+from email.utils import formatdate
+import orjson
+
+from app.classes.shared.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class StatusSnapshot(metaclass=Singleton):
+    """
+    What the public status page shows, kept in memory.
+
+    Servers push their public fields in here every time their stats are
+    recorded, so serving /status never touches a database. Every change bumps
+    the version; the JSON body and the rendered pages are built at most once
+    per version and cached until the next change.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers = {}
+        # different on every start so etags from a previous run never match
+        self.boot = format(int(time.time()), "x")
+        self.version = 0
+        self.last_modified = time.time()
+        self.cache = {}
+
+    def update(self, server_data: dict, stats: dict):
+        server_id = int(server_data["server_id"])
+        entry = {
+            "id": server_id,
+            "name": server_data.get("server_name", ""),
+            "show_status": bool(server_data.get("show_status", True)),
+            "running": bool(stats.get("running")),
+            "int_ping_results": str(stats.get("int_ping_results")),
+            "online": int(stats.get("online") or 0),
+            "max": int(stats.get("max") or 0),
+            "desc": str(stats.get("desc")),
+            "version": str(stats.get("version")),
+        }
+        with self.lock:
+            if self.servers.get(server_id) == entry:
+                return
+            self.servers[server_id] = entry
+            self._changed()
+
+    def remove(self, server_id):
+        with self.lock:
+            if self.servers.pop(int(server_id), None) is not None:
+                self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self.last_modified = time.time()
+        self.cache = {}
+
+    def etag(self, variant=""):
+        return f'"{self.boot}-{self.version}{variant}"'
+
+    def last_modified_header(self):
+        return formatdate(self.last_modified, usegmt=True)
+
+    def public_servers(self):
+        with self.lock:
+            servers = [s for s in self.servers.values() if s["show_status"]]
+        return sorted(servers, key=lambda s: s["id"])
+
+    def cached(self, key, build):
+        """
+        Returns build() for the current version, building it only the first
+        time a version is asked for.
+        """
+        with self.lock:
+            version = self.version
+            if key in self.cache:
+                return self.cache[key]
+        value = build()
+        with self.lock:
+            # don't cache a value built from data that changed meanwhile
+            if self.version == version:
+                self.cache[key] = value
+        return value
+
+    def json(self) -> bytes:
+        def build():
+            servers = self.public_servers()
+            return orjson.dumps(
+                {
+                    "status": "ok",
+                    "data": {
+                        "running": sum(1 for s in servers if s["running"]),
+                        "servers": servers,
+                    },
+                }
+            )
+
+        return self.cached("json", build)
+
+    def page_data(self):
+        """The data the status template expects."""
+        servers = []
+        for srv in self.public_servers():
+            servers.append(
+                {
+                    "server_data": {
+                        "server_id": srv["id"],
+                        "server_name": srv["name"],
+                        "show_status": srv["show_status"],
+                    },
+                    "stats": dict(srv, server_id={"server_id": srv["id"]}),
+                }
+            )
+        return {
+            "servers": servers,
+            "running": sum(1 for s in servers if s["stats"]["running"]),
+        }
@@ -0,0 +1,145 @@
+import os
+import logging
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from app.classes.shared.helpers import Helpers
+from app.classes.shared.progress_tracker import ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+
+class SupportBundleJob:
+    """
+    Everything needed to write one support bundle. Files are added as
+    (source path, archive name) pairs and read straight into the archive when
+    the job runs; nothing is staged on disk first.
+    """
+
+    def __init__(self, user_id, zip_path, tracker: ProgressTracker, on_done=None):
+        self.user_id = user_id
+        self.zip_path = zip_path
+        self.tracker = tracker
+        self.on_done = on_done
+        self.files = []
+        self.texts = []
+
+    def add_file(self, path, arcname):
+        self.files.append((str(path), arcname))
+
+    def add_dir(self, path, arcname):
+        for root, _dirs, files in os.walk(path):
+            for file in files:
+                full_path = os.path.join(root, file)
+                rel_path = os.path.relpath(full_path, path)
+                self.add_file(full_path, os.path.join(arcname, rel_path))
+
+    def add_text(self, arcname, text):
+        self.texts.append((arcname, text))
+
+
+class SupportBundleBuilder:
+    """
+    Builds support bundles on a small bounded pool so several users asking
+    for logs at once can't start an unbounded number of archive writers.
+
+    Each log is capped to its last max_file_bytes. Logs are append only, so
+    the tail is where the useful part is, and a superuser bundle of hundreds
+    of servers stays a reasonable size.
+    """
+
+    def __init__(self, helper):
+        self.helper: Helpers = helper
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                workers = max(
+                    int(self.helper.get_setting("support_bundle_workers", 2)), 1
+                )
+                self.pool = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="support_bundle"
+                )
+            return self.pool
+
+    def max_file_bytes(self):
+        max_mb = self.helper.get_setting("support_log_max_file_mb", 10)
+        return max(int(max_mb), 1) * 1024 * 1024
+
+    def submit(self, job: SupportBundleJob):
+        return self._get_pool().submit(self.build, job)
+
+    @staticmethod
+    def system_info(version_file):
+        # Most people have a default editor for .txt also more mobile friendly...
+        try:
+            with open(version_file, "r", encoding="utf-8") as f:
+                info = f.read()
+        except OSError as e:
+            info = f"Unable to read version file: {e}"
+        return (
+            f"{info}\n"
+            f"OS Info:\n"
+            f"OS: {platform.system()}\n"
+            f"Version: {platform.release()}"
+        )
+
+    def build(self, job: SupportBundleJob):
+        max_bytes = self.max_file_bytes()
+        sizes = []
+        for path, _arcname in job.files:
+            try:
+                sizes.append(min(os.path.getsize(path), max_bytes))
+            except OSError:
+                sizes.append(0)
+        job.tracker.start(sum(sizes), len(job.files) + len(job.texts))
+
+        part_path = job.zip_path + ".part"
+        success = False
+        try:
+            Helpers.ensure_dir_exists(os.path.dirname(job.zip_path))
+            with ZipFile(part_path, "w", ZIP_DEFLATED) as zip_file:
+                for arcname, text in job.texts:
+                    zip_file.writestr(arcname, text)
+                    job.tracker.advance(0, current_file=arcname)
+                for (path, arcname), size in zip(job.files, sizes):
+                    try:
+                        SupportBundleBuilder._write_tail(
+                            zip_file, path, arcname, max_bytes
+                        )
+                    except OSError as e:
+                        logger.warning(f"Unable to add {path} to support logs: {e}")
+                    job.tracker.advance(size, current_file=arcname)
+            os.replace(part_path, job.zip_path)
+            success = True
+        except Exception:
+            logger.exception(f"Failed to build support logs for user {job.user_id}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        job.tracker.finish()
+
+        if job.on_done is not None:
+            job.on_done(job, success)
+        return success
+
+    @staticmethod
+    def _write_tail(zip_file: ZipFile, path, arcname, max_bytes):
+        size = os.path.getsize(path)
+        if size <= max_bytes:
+            zip_file.write(path, arcname)
+            return
+        with open(path, "rb") as src, zip_file.open(arcname, "w") as dest:
+            src.seek(size - max_bytes)
+            # drop the partial first line
+            src.readline()
+            notice = f"[crafty: log truncated, first {src.tell()} bytes omitted]\n"
+            dest.write(notice.encode("utf-8"))
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dest.write(chunk)
@@ -2,12 +2,11 @@ import os
 import time
 import logging
 import threading
-import asyncio
 import datetime
 
 from tzlocal import get_localzone
 from tzlocal.utils import ZoneInfoNotFoundError
-from apscheduler.events import EVENT_JOB_EXECUTED
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
@@ -15,8 +14,10 @@ from app.classes.models.management import HelpersManagement
 from app.classes.models.users import HelperUsers
 from app.classes.controllers.users_controller import UsersController
 from app.classes.shared.console import Console
+from app.classes.shared.console_events import ConsoleEventBus
 from app.classes.shared.file_helpers import FileHelpers
 from app.classes.shared.helpers import Helpers
+from app.classes.shared.instrumentation import Instrumentation
 from app.classes.shared.main_controller import Controller
 from app.classes.web.tornado_handler import Webserver
 
@@ -73,10 +74,6 @@ class TasksManager:
             target=self.command_watcher, daemon=True, name="command_watcher"
         )
 
-        self.realtime_thread = threading.Thread(
-            target=self.realtime, daemon=True, name="realtime"
-        )
-
         self.reload_schedule_from_db()
 
     def get_main_thread_run_status(self):
@@ -185,13 +182,20 @@ class TasksManager:
         logger.info("Launching log watcher...")
         Console.info("Launching log watcher...")
         self.log_watcher_thread.start()
-        logger.info("Launching realtime thread...")
-        Console.info("Launching realtime thread...")
-        self.realtime_thread.start()
+        logger.info("Launching host stats sampler...")
+        Console.info("Launching host stats sampler...")
+        host_sampler = self.controller.servers.stats.host_sampler
+        host_sampler.subscribe(self.realtime)
+        host_sampler.start()
 
     def scheduler_thread(self):
         schedules = HelpersManagement.get_schedules_enabled()
         self.scheduler.add_listener(self.schedule_watcher, mask=EVENT_JOB_EXECUTED)
+        self.scheduler.add_listener(
+            Instrumentation().scheduler_listener,
+            mask=EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR,
+        )
+        ConsoleEventBus().subscribe(self.console_event_watcher)
         # self.scheduler.add_job(
         #    self.scheduler.print_jobs, "interval", seconds=10, id="-1"
         # )
@@ -287,6 +291,7 @@ class TasksManager:
             job_data["cron_string"],
             job_data["parent"],
             job_data["delay"],
+            job_data.get("event", ""),
         )
 
         # Checks to make sure some doofus didn't actually make the newly
@@ -539,6 +544,34 @@ class TasksManager:
         else:
             logger.error(f"Task failed with error: {event.exception}")
 
+    def console_event_watcher(self, server_id, event_type, _value):
+        # Runs on the server's terminal thread, so we only queue the jobs here.
+        for schedule in HelpersManagement.get_event_schedules_by_server(
+            server_id, event_type
+        ):
+            if schedule.interval_type != "reaction":
+                continue
+            delaytime = datetime.datetime.now() + datetime.timedelta(
+                seconds=schedule.delay
+            )
+            logger.info(
+                f"Console event {event_type} on server {server_id} "
+                f"triggered task {schedule.schedule_id}"
+            )
+            self.scheduler.add_job(
+                HelpersManagement.add_command,
+                "date",
+                run_date=delaytime,
+                id=str(schedule.schedule_id),
+                replace_existing=True,
+                args=[
+                    schedule.server_id,
+                    self.users_controller.get_id_by_name("system"),
+                    "127.0.0.1",
+                    schedule.command,
+                ],
+            )
+
     def start_stats_recording(self):
         stats_update_frequency = self.helper.get_setting("stats_update_frequency")
         logger.info(
@@ -570,41 +603,22 @@ class TasksManager:
             id="serverjars",
         )
 
-    def realtime(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        host_stats = HelpersManagement.get_latest_hosts_stats()
-
-        while True:
-
-            if host_stats.get(
-                "cpu_usage"
-            ) != HelpersManagement.get_latest_hosts_stats().get(
-                "cpu_usage"
-            ) or host_stats.get(
-                "mem_percent"
-            ) != HelpersManagement.get_latest_hosts_stats().get(
-                "mem_percent"
-            ):
-                # Stats are different
-
-                host_stats = HelpersManagement.get_latest_hosts_stats()
-                if len(self.helper.websocket_helper.clients) > 0:
-                    # There are clients
-                    self.helper.websocket_helper.broadcast_page(
-                        "/panel/dashboard",
-                        "update_host_stats",
-                        {
-                            "cpu_usage": host_stats.get("cpu_usage"),
-                            "cpu_cores": host_stats.get("cpu_cores"),
-                            "cpu_cur_freq": host_stats.get("cpu_cur_freq"),
-                            "cpu_max_freq": host_stats.get("cpu_max_freq"),
-                            "mem_percent": host_stats.get("mem_percent"),
-                            "mem_usage": host_stats.get("mem_usage"),
-                        },
-                    )
-            time.sleep(1)
+    def realtime(self, host_stats):
+        # called by the host sampler whenever cpu or memory usage changed
+        if len(self.helper.websocket_helper.clients) > 0:
+            # There are clients
+            self.helper.websocket_helper.broadcast_page(
+                "/panel/dashboard",
+                "update_host_stats",
+                {
+                    "cpu_usage": host_stats.get("cpu_usage"),
+                    "cpu_cores": host_stats.get("cpu_count"),
+                    "cpu_cur_freq": host_stats.get("cpu_cur_freq"),
+                    "cpu_max_freq": host_stats.get("cpu_max_freq"),
+                    "mem_percent": host_stats.get("mem_percent"),
+                    "mem_usage": host_stats.get("mem_usage"),
+                },
+            )
 
     def log_watcher(self):
         self.controller.servers.check_for_old_logs()
@@ -614,3 +628,12 @@ class TasksManager:
             hours=6,
             id="log-mgmt",
         )
+        log_index_interval = self.helper.get_setting("log_index_interval", 60)
+        if log_index_interval > 0:
+            self.scheduler.add_job(
+                self.controller.servers.index_logs,
+                "interval",
+                seconds=log_index_interval,
+                id="log-index",
+                next_run_time=datetime.datetime.now(),
+            )
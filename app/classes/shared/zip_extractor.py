@@ -0,0 +1,89 @@
+import os
+import stat
+import time
+import logging
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+
+class ZipExtractor:
+    """
+    Extracts a zip archive member by member straight into its destination.
+
+    Every member path is checked before anything is written, so an archive
+    with absolute paths or ".." components is rejected as a whole instead of
+    being half extracted. Members are streamed in chunks, keep their unix
+    permission bits and modification times, and progress is reported as
+    (bytes written, total uncompressed bytes).
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, zip_path, dest_dir, progress=None):
+        self.zip_path = zip_path
+        self.dest_dir = os.path.realpath(dest_dir)
+        self.progress = progress
+        self.total = 0
+        self.done = 0
+
+    def target_path(self, name):
+        """
+        Returns the path a member is written to, or raises ValueError if it
+        would end up outside of dest_dir.
+        """
+        parts = name.replace("\\", "/").split("/")
+        if name.startswith(("/", "\\")) or ".." in parts or ":" in parts[0]:
+            raise ValueError(f"Unsafe path in archive: {name}")
+        target = os.path.realpath(os.path.join(self.dest_dir, *parts))
+        if os.path.commonpath([self.dest_dir, target]) != self.dest_dir:
+            raise ValueError(f"Unsafe path in archive: {name}")
+        return target
+
+    def extract(self):
+        with zipfile.ZipFile(self.zip_path, "r") as zip_ref:
+            members = zip_ref.infolist()
+            targets = [(m, self.target_path(m.filename)) for m in members]
+            self.total = sum(m.file_size for m in members)
+            self.done = 0
+            os.makedirs(self.dest_dir, exist_ok=True)
+
+            started = time.perf_counter()
+            for member, target in targets:
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                mode = member.external_attr >> 16
+                if stat.S_ISLNK(mode):
+                    # we never create links from archives
+                    logger.warning(f"Skipping symlink {member.filename} in archive")
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with zip_ref.open(member) as src, open(target, "wb") as dest:
+                    while True:
+                        chunk = src.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        self.done += len(chunk)
+                        if self.progress:
+                            self.progress(self.done, self.total)
+                self._restore_attributes(member, target, mode)
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Extracted {len(members)} entries ({self.done} bytes) "
+                f"from {self.zip_path} to {self.dest_dir} in {elapsed:.1f}s"
+            )
+        return self.dest_dir
+
+    @staticmethod
+    def _restore_attributes(member, target, mode):
+        try:
+            # only permission bits, never setuid/setgid from an archive
+            if mode & 0o777:
+                os.chmod(target, mode & 0o777)
+            mtime = time.mktime(member.date_time + (0, 0, -1))
+            os.utime(target, (mtime, mtime))
+        except (OSError, OverflowError, ValueError) as e:
+            logger.debug(f"Unable to restore attributes of {target}: {e}")
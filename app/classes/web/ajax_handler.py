@@ -1,9 +1,9 @@
+import asyncio
 import os
 import html
 import pathlib
 import re
 import logging
-import time
 import bleach
 import tornado.web
 import tornado.escape
@@ -25,8 +25,131 @@ class AjaxHandler(BaseHandler):
             translate=self.translator.translate,
         )
 
+    @staticmethod
+    def backup_tree_html(folder, excluded):
+        output = ""
+
+        dir_list = []
+        unsorted_files = []
+        file_list = os.listdir(folder)
+        for item in file_list:
+            if os.path.isdir(os.path.join(folder, item)):
+                dir_list.append(item)
+            else:
+                unsorted_files.append(item)
+        file_list = sorted(dir_list, key=str.casefold) + sorted(
+            unsorted_files, key=str.casefold
+        )
+        output += f"""<ul class="tree-nested d-block" id="{folder}ul">"""
+        for raw_filename in file_list:
+            filename = html.escape(raw_filename)
+            rel = os.path.join(folder, raw_filename)
+            dpath = os.path.join(folder, filename)
+            if str(dpath) in excluded:
+                if os.path.isdir(rel):
+                    output += f"""<li class="tree-item" data-path="{dpath}">
+                        \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
+                        <input type="checkbox" class="checkBoxClass" name="root_path" value="{dpath}" checked>
+                        <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
+                        <i style="color: #8862e0;" class="far fa-folder"></i>
+                        <i style="color: #8862e0;" class="far fa-folder-open"></i>
+                        <strong>{filename}</strong>
+                        </span>
+                        </input></div><li>
+                        \n"""
+                else:
+                    output += f"""<li
+                    class="d-block tree-ctx-item tree-file"
+                    data-path="{dpath}"
+                    data-name="{filename}"
+                    onclick=""><input type='checkbox' class="checkBoxClass" name='root_path' value="{dpath}" checked><span style="margin-right: 6px;">
+                    <i class="far fa-file"></i></span></input>{filename}</li>"""
+
+            else:
+                if os.path.isdir(rel):
+                    output += f"""<li class="tree-item" data-path="{dpath}">
+                        \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
+                        <input type="checkbox" class="checkBoxClass" name="root_path" value="{dpath}">
+                        <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
+                        <i style="color: #8862e0;" class="far fa-folder"></i>
+                        <i style="color: #8862e0;" class="far fa-folder-open"></i>
+                        <strong>{filename}</strong>
+                        </span>
+                        </input></div><li>
+                        \n"""
+                else:
+                    output += f"""<li
+                    class="d-block tree-ctx-item tree-file"
+                    data-path="{dpath}"
+                    data-name="{filename}"
+                    onclick=""><input type='checkbox' class="checkBoxClass" name='root_path' value="{dpath}">
+                    <span style="margin-right: 6px;"><i class="far fa-file">
+                    </i></span></input>{filename}</li>"""
+        return output
+
+    @staticmethod
+    def backup_dir_html(folder, excluded):
+        output = ""
+
+        dir_list = []
+        unsorted_files = []
+        file_list = os.listdir(folder)
+        for item in file_list:
+            if os.path.isdir(os.path.join(folder, item)):
+                dir_list.append(item)
+            else:
+                unsorted_files.append(item)
+        file_list = sorted(dir_list, key=str.casefold) + sorted(
+            unsorted_files, key=str.casefold
+        )
+        output += f"""<ul class="tree-nested d-block" id="{folder}ul">"""
+        for raw_filename in file_list:
+            filename = html.escape(raw_filename)
+            rel = os.path.join(folder, raw_filename)
+            dpath = os.path.join(folder, filename)
+            if str(dpath) in excluded:
+                if os.path.isdir(rel):
+                    output += f"""<li class="tree-item" data-path="{dpath}">
+                        \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
+                        <input type="checkbox" name="root_path" value="{dpath}" checked>
+                        <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
+                        <i class="far fa-folder"></i>
+                        <i class="far fa-folder-open"></i>
+                        <strong>{filename}</strong>
+                        </span>
+                        </input></div><li>"""
+                else:
+                    output += f"""<li
+                    class="tree-item tree-nested d-block tree-ctx-item tree-file"
+                    data-path="{dpath}"
+                    data-name="{filename}"
+                    onclick=""><input type='checkbox' name='root_path' value='{dpath}' checked><span style="margin-right: 6px;">
+                    <i class="far fa-file"></i></span></input>{filename}</li>"""
+
+            else:
+                if os.path.isdir(rel):
+                    output += f"""<li class="tree-item" data-path="{dpath}">
+                        \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
+                        <input type="checkbox" name="root_path" value="{dpath}">
+                        <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
+                        <i class="far fa-folder"></i>
+                        <i class="far fa-folder-open"></i>
+                        <strong>{filename}</strong>
+                        </span>
+                        </input></div><li>"""
+                else:
+                    output += f"""<li
+                    class="tree-item tree-nested d-block tree-ctx-item tree-file"
+                    data-path="{dpath}"
+                    data-name="{filename}"
+                    onclick=""><input type='checkbox' name='root_path' value='{dpath}'>
+                    <span style="margin-right: 6px;"><i class="far fa-file">
+                    </i></span></input>{filename}</li>"""
+
+        return output
+
     @tornado.web.authenticated
-    def get(self, page):
+    async def get(self, page):
         _, _, exec_user = self.current_user
         error = bleach.clean(self.get_argument("error", "WTF Error!"))
 
@@ -62,7 +185,8 @@ class AjaxHandler(BaseHandler):
 
             if full_log:
                 log_lines = self.helper.get_setting("max_log_lines")
-                data = Helpers.tail_file(
+                data = await self.run_blocking(
+                    Helpers.tail_file,
                     # If the log path is absolute it returns it as is
                     # If it is relative it joins the paths below like normal
                     pathlib.Path(server_data["path"], server_data["log_path"]),
@@ -90,152 +214,39 @@ class AjaxHandler(BaseHandler):
         elif page == "get_zip_tree":
             path = self.get_argument("path", None)
 
-            self.write(
-                Helpers.get_os_understandable_path(path)
-                + "\n"
-                + Helpers.generate_zip_tree(path)
-            )
+            tree = await self.run_blocking(Helpers.generate_zip_tree, path)
+            self.write(Helpers.get_os_understandable_path(path) + "\n" + tree)
             self.finish()
 
         elif page == "get_zip_dir":
             path = self.get_argument("path", None)
 
-            self.write(
-                Helpers.get_os_understandable_path(path)
-                + "\n"
-                + Helpers.generate_zip_dir(path)
-            )
+            tree = await self.run_blocking(Helpers.generate_zip_dir, path)
+            self.write(Helpers.get_os_understandable_path(path) + "\n" + tree)
             self.finish()
 
         elif page == "get_backup_tree":
             server_id = self.get_argument("id", None)
             folder = self.get_argument("path", None)
 
-            output = ""
-
-            dir_list = []
-            unsorted_files = []
-            file_list = os.listdir(folder)
-            for item in file_list:
-                if os.path.isdir(os.path.join(folder, item)):
-                    dir_list.append(item)
-                else:
-                    unsorted_files.append(item)
-            file_list = sorted(dir_list, key=str.casefold) + sorted(
-                unsorted_files, key=str.casefold
+            excluded = await self.run_blocking(
+                self.controller.management.get_excluded_backup_dirs, server_id
+            )
+            output = await self.run_blocking(
+                AjaxHandler.backup_tree_html, folder, excluded
             )
-            output += f"""<ul class="tree-nested d-block" id="{folder}ul">"""
-            for raw_filename in file_list:
-                filename = html.escape(raw_filename)
-                rel = os.path.join(folder, raw_filename)
-                dpath = os.path.join(folder, filename)
-                if str(dpath) in self.controller.management.get_excluded_backup_dirs(
-                    server_id
-                ):
-                    if os.path.isdir(rel):
-                        output += f"""<li class="tree-item" data-path="{dpath}">
-                            \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
-                            <input type="checkbox" class="checkBoxClass" name="root_path" value="{dpath}" checked>
-                            <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
-                            <i style="color: #8862e0;" class="far fa-folder"></i>
-                            <i style="color: #8862e0;" class="far fa-folder-open"></i>
-                            <strong>{filename}</strong>
-                            </span>
-                            </input></div><li>
-                            \n"""
-                    else:
-                        output += f"""<li
-                        class="d-block tree-ctx-item tree-file"
-                        data-path="{dpath}"
-                        data-name="{filename}"
-                        onclick=""><input type='checkbox' class="checkBoxClass" name='root_path' value="{dpath}" checked><span style="margin-right: 6px;">
-                        <i class="far fa-file"></i></span></input>{filename}</li>"""
-
-                else:
-                    if os.path.isdir(rel):
-                        output += f"""<li class="tree-item" data-path="{dpath}">
-                            \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
-                            <input type="checkbox" class="checkBoxClass" name="root_path" value="{dpath}">
-                            <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
-                            <i style="color: #8862e0;" class="far fa-folder"></i>
-                            <i style="color: #8862e0;" class="far fa-folder-open"></i>
-                            <strong>{filename}</strong>
-                            </span>
-                            </input></div><li>
-                            \n"""
-                    else:
-                        output += f"""<li
-                        class="d-block tree-ctx-item tree-file"
-                        data-path="{dpath}"
-                        data-name="{filename}"
-                        onclick=""><input type='checkbox' class="checkBoxClass" name='root_path' value="{dpath}">
-                        <span style="margin-right: 6px;"><i class="far fa-file">
-                        </i></span></input>{filename}</li>"""
             self.write(Helpers.get_os_understandable_path(folder) + "\n" + output)
             self.finish()
 
         elif page == "get_backup_dir":
             server_id = self.get_argument("id", None)
             folder = self.get_argument("path", None)
-            output = ""
-
-            dir_list = []
-            unsorted_files = []
-            file_list = os.listdir(folder)
-            for item in file_list:
-                if os.path.isdir(os.path.join(folder, item)):
-                    dir_list.append(item)
-                else:
-                    unsorted_files.append(item)
-            file_list = sorted(dir_list, key=str.casefold) + sorted(
-                unsorted_files, key=str.casefold
+            excluded = await self.run_blocking(
+                self.controller.management.get_excluded_backup_dirs, server_id
+            )
+            output = await self.run_blocking(
+                AjaxHandler.backup_dir_html, folder, excluded
             )
-            output += f"""<ul class="tree-nested d-block" id="{folder}ul">"""
-            for raw_filename in file_list:
-                filename = html.escape(raw_filename)
-                rel = os.path.join(folder, raw_filename)
-                dpath = os.path.join(folder, filename)
-                if str(dpath) in self.controller.management.get_excluded_backup_dirs(
-                    server_id
-                ):
-                    if os.path.isdir(rel):
-                        output += f"""<li class="tree-item" data-path="{dpath}">
-                            \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
-                            <input type="checkbox" name="root_path" value="{dpath}" checked>
-                            <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
-                            <i class="far fa-folder"></i>
-                            <i class="far fa-folder-open"></i>
-                            <strong>{filename}</strong>
-                            </span>
-                            </input></div><li>"""
-                    else:
-                        output += f"""<li
-                        class="tree-item tree-nested d-block tree-ctx-item tree-file"
-                        data-path="{dpath}"
-                        data-name="{filename}"
-                        onclick=""><input type='checkbox' name='root_path' value='{dpath}' checked><span style="margin-right: 6px;">
-                        <i class="far fa-file"></i></span></input>{filename}</li>"""
-
-                else:
-                    if os.path.isdir(rel):
-                        output += f"""<li class="tree-item" data-path="{dpath}">
-                            \n<div id="{dpath}" data-path="{dpath}" data-name="{filename}" class="tree-caret tree-ctx-item tree-folder">
-                            <input type="checkbox" name="root_path" value="{dpath}">
-                            <span id="{dpath}span" class="files-tree-title" data-path="{dpath}" data-name="{filename}" onclick="getDirView(event)">
-                            <i class="far fa-folder"></i>
-                            <i class="far fa-folder-open"></i>
-                            <strong>{filename}</strong>
-                            </span>
-                            </input></div><li>"""
-                    else:
-                        output += f"""<li
-                        class="tree-item tree-nested d-block tree-ctx-item tree-file"
-                        data-path="{dpath}"
-                        data-name="{filename}"
-                        onclick=""><input type='checkbox' name='root_path' value='{dpath}'>
-                        <span style="margin-right: 6px;"><i class="far fa-file">
-                        </i></span></input>{filename}</li>"""
-
             self.write(Helpers.get_os_understandable_path(folder) + "\n" + output)
             self.finish()
 
@@ -250,15 +261,48 @@ class AjaxHandler(BaseHandler):
             if Helpers.validate_traversal(
                 self.controller.servers.get_server_data_by_id(server_id)["path"], path
             ):
-                self.write(
-                    Helpers.get_os_understandable_path(path)
-                    + "\n"
-                    + Helpers.generate_dir(path)
-                )
+                tree = await self.run_blocking(Helpers.generate_dir, path)
+                self.write(Helpers.get_os_understandable_path(path) + "\n" + tree)
             self.finish()
 
+    def restore_backup(self, server_id, zip_name):
+        """Replaces a server with the contents of one of its backups."""
+        svr_obj = self.controller.servers.get_server_obj(server_id)
+        server_data = self.controller.servers.get_server_data_by_id(server_id)
+        temp_dir = self.helper.unzip_backup_archive(svr_obj.backup_path, zip_name)
+        # moving the files is reported like a backup, on the same page
+        tracker = self.controller.file_helper.backup_tracker(server_id)
+        if server_data["type"] == "minecraft-java":
+            new_server_id = self.controller.import_zip_server(
+                svr_obj.server_name,
+                temp_dir,
+                server_data["executable"],
+                "1",
+                "2",
+                server_data["server_port"],
+                tracker=tracker,
+            )
+        else:
+            new_server_id = self.controller.import_bedrock_zip_server(
+                svr_obj.server_name,
+                temp_dir,
+                server_data["executable"],
+                server_data["server_port"],
+                tracker=tracker,
+            )
+        new_server = self.controller.servers.get_server_data(new_server_id)
+        self.controller.rename_backup_dir(
+            server_id, new_server_id, new_server["server_uuid"], tracker
+        )
+        tracker.finish()
+        try:
+            self.tasks_manager.remove_all_server_tasks(server_id)
+        except:
+            logger.info("No active tasks found for server")
+        self.controller.remove_server(server_id, True)
+
     @tornado.web.authenticated
-    def post(self, page):
+    async def post(self, page):
         api_key, _, exec_user = self.current_user
         superuser = exec_user["superuser"]
         if api_key is not None:
@@ -313,7 +357,7 @@ class AjaxHandler(BaseHandler):
                 command = None
             if command:
                 if srv_obj.check_running():
-                    srv_obj.send_command(command)
+                    srv_obj.send_command(command, wait=False)
 
             self.controller.management.add_to_audit_log(
                 exec_user["user_id"],
@@ -360,10 +404,10 @@ class AjaxHandler(BaseHandler):
             server_id = self.get_argument("id", None)
             svr = self.controller.servers.get_server_instance_by_id(server_id)
             try:
-                svr.kill()
-                time.sleep(5)
-                svr.cleanup_server_object()
-                svr.record_server_stats()
+                await self.run_blocking(svr.kill)
+                await asyncio.sleep(5)
+                await self.run_blocking(svr.cleanup_server_object)
+                await self.run_blocking(svr.record_server_stats)
             except Exception as e:
                 logger.error(
                     f"Could not find PID for requested termsig. Full error: {e}"
@@ -382,61 +426,22 @@ class AjaxHandler(BaseHandler):
             server_id = bleach.clean(self.get_argument("id", None))
             zip_name = bleach.clean(self.get_argument("zip_file", None))
             svr_obj = self.controller.servers.get_server_obj(server_id)
-            server_data = self.controller.servers.get_server_data_by_id(server_id)
-            if server_data["type"] == "minecraft-java":
-                backup_path = svr_obj.backup_path
-                if Helpers.validate_traversal(backup_path, zip_name):
-                    temp_dir = Helpers.unzip_backup_archive(backup_path, zip_name)
-                    new_server = self.controller.import_zip_server(
-                        svr_obj.server_name,
-                        temp_dir,
-                        server_data["executable"],
-                        "1",
-                        "2",
-                        server_data["server_port"],
-                    )
-                    new_server_id = new_server
-                    new_server = self.controller.servers.get_server_data(new_server)
-                    self.controller.rename_backup_dir(
-                        server_id, new_server_id, new_server["server_uuid"]
-                    )
-                    try:
-                        self.tasks_manager.remove_all_server_tasks(server_id)
-                    except:
-                        logger.info("No active tasks found for server")
-                    self.controller.remove_server(server_id, True)
-                    self.redirect("/panel/dashboard")
-
-            else:
-                backup_path = svr_obj.backup_path
-                if Helpers.validate_traversal(backup_path, zip_name):
-                    temp_dir = Helpers.unzip_backup_archive(backup_path, zip_name)
-                    new_server = self.controller.import_bedrock_zip_server(
-                        svr_obj.server_name,
-                        temp_dir,
-                        server_data["executable"],
-                        server_data["server_port"],
-                    )
-                    new_server_id = new_server
-                    new_server = self.controller.servers.get_server_data(new_server)
-                    self.controller.rename_backup_dir(
-                        server_id, new_server_id, new_server["server_uuid"]
-                    )
-                    try:
-                        self.tasks_manager.remove_all_server_tasks(server_id)
-                    except:
-                        logger.info("No active tasks found for server")
-                    self.controller.remove_server(server_id, True)
-                    self.redirect("/panel/dashboard")
+            if Helpers.validate_traversal(svr_obj.backup_path, zip_name):
+                # extracting and moving a whole server, the progress of the
+                # move is published on the backup page meanwhile
+                await self.run_blocking(self.restore_backup, server_id, zip_name)
+                self.redirect("/panel/dashboard")
 
         elif page == "unzip_server":
             path = self.get_argument("path", None)
             if Helpers.check_file_exists(path):
-                self.helper.unzip_server(path, exec_user["user_id"])
+                await self.run_blocking(
+                    self.helper.unzip_server, path, exec_user["user_id"]
+                )
             else:
                 user_id = exec_user["user_id"]
                 if user_id:
-                    time.sleep(5)
+                    await asyncio.sleep(5)
                     user_lang = self.controller.users.get_user_lang_by_id(user_id)
                     self.helper.websocket_helper.broadcast_user(
                         user_id,
@@ -163,7 +163,7 @@ class SendCommand(ApiHandler):
         if command:
             server = self.controller.servers.get_server_instance_by_id(server_id)
             if server.check_running:
-                server.send_command(command)
+                server.send_command(command, wait=False)
                 self.return_response(200, {"run": True})
             else:
                 self.return_response(200, {"error": "SER_NOT_RUNNING"})
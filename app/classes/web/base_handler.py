@@ -7,6 +7,7 @@ import tornado.web
 
 from app.classes.models.crafty_permissions import EnumPermissionsCrafty
 from app.classes.models.users import ApiKeys
+from app.classes.shared.blocking_pool import BlockingPool, LoopSteps
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.main_controller import Controller
 from app.classes.shared.translation import Translation
@@ -24,6 +25,8 @@ class BaseHandler(tornado.web.RequestHandler):
     helper: Helpers
     controller: Controller
     translator: Translation
+    # seconds this request held the IOLoop outside of _execute
+    loop_held = 0.0
 
     # noinspection PyAttributeOutsideInit
     def initialize(
@@ -237,6 +240,25 @@ class BaseHandler(tornado.web.RequestHandler):
             )
             return None
 
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Runs blocking work (disk, database, psutil, network) on the
+        BlockingPool instead of the IOLoop and returns its result.
+        """
+        name = f"{type(self).__name__}.{getattr(func, '__name__', 'call')}"
+        return await BlockingPool().run(name, func, *args, **kwargs)
+
+    async def _execute(self, transforms, *args, **kwargs):
+        # only the synchronous steps of the request hold the loop, not its
+        # awaits on the pool, on slow clients or on the request body
+        steps = LoopSteps(super()._execute(transforms, *args, **kwargs))
+        try:
+            return await steps
+        finally:
+            BlockingPool().record_block(
+                type(self).__name__, steps.held + self.loop_held, self.request.path
+            )
+
     def finish_json(self, status: int, data: t.Dict[str, t.Any]):
         self.set_status(status)
         self.set_header("Content-Type", "application/json")
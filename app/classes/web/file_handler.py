@@ -7,6 +7,7 @@ import tornado.escape
 from app.classes.models.server_permissions import EnumPermissionsServer
 from app.classes.shared.console import Console
 from app.classes.shared.helpers import Helpers
+from app.classes.shared.file_editor import FileConflictError, FileEditor
 from app.classes.shared.file_helpers import FileHelpers
 from app.classes.web.base_handler import BaseHandler
 
@@ -21,8 +22,23 @@ class FileHandler(BaseHandler):
             translate=self.translator.translate,
         )
 
+    @staticmethod
+    def read_for_editor(file_path, max_bytes):
+        size = os.path.getsize(file_path)
+        if size > max_bytes:
+            return {"content": "", "error": "FileTooLarge", "size": size}
+        if FileEditor.is_binary(file_path):
+            return {"content": "", "error": "UnicodeDecodeError", "size": size}
+        window = FileEditor.read_window(file_path, 0, max(size, 1), with_hash=True)
+        return {
+            "content": window["content"],
+            "error": None,
+            "size": window["size"],
+            "sha256": window["sha256"],
+        }
+
     @tornado.web.authenticated
-    def get(self, page):
+    async def get(self, page):
         api_key, _, exec_user = self.current_user
         superuser = exec_user["superuser"]
         if api_key is not None:
@@ -71,16 +87,12 @@ class FileHandler(BaseHandler):
                 )
                 return
 
-            error = None
-
-            try:
-                with open(file_path, encoding="utf-8") as file:
-                    file_contents = file.read()
-            except UnicodeDecodeError:
-                file_contents = ""
-                error = "UnicodeDecodeError"
-
-            self.write({"content": file_contents, "error": error})
+            # big files are opened through the ranged files API instead
+            max_bytes = int(self.helper.get_setting("editor_max_file_mb", 4) * 1048576)
+            file_data = await self.run_blocking(
+                FileHandler.read_for_editor, file_path, max_bytes
+            )
+            self.write(file_data)
             self.finish()
 
         elif page == "get_tree":
@@ -97,11 +109,9 @@ class FileHandler(BaseHandler):
             if Helpers.validate_traversal(
                 self.controller.servers.get_server_data_by_id(server_id)["path"], path
             ):
-                self.write(
-                    Helpers.get_os_understandable_path(path)
-                    + "\n"
-                    + Helpers.generate_tree(path)
-                )
+                # big folders take a while to list, keep it off the loop
+                tree = await self.run_blocking(Helpers.generate_tree, path)
+                self.write(Helpers.get_os_understandable_path(path) + "\n" + tree)
             self.finish()
 
         elif page == "get_dir":
@@ -118,15 +128,13 @@ class FileHandler(BaseHandler):
             if Helpers.validate_traversal(
                 self.controller.servers.get_server_data_by_id(server_id)["path"], path
             ):
-                self.write(
-                    Helpers.get_os_understandable_path(path)
-                    + "\n"
-                    + Helpers.generate_dir(path)
-                )
+                # big folders take a while to list, keep it off the loop
+                tree = await self.run_blocking(Helpers.generate_dir, path)
+                self.write(Helpers.get_os_understandable_path(path) + "\n" + tree)
             self.finish()
 
     @tornado.web.authenticated
-    def post(self, page):
+    async def post(self, page):
         api_key, _, exec_user = self.current_user
         superuser = exec_user["superuser"]
         if api_key is not None:
@@ -220,7 +228,8 @@ class FileHandler(BaseHandler):
             path = Helpers.get_os_understandable_path(self.get_argument("path", None))
             if Helpers.is_os_windows():
                 path = Helpers.wtol_path(path)
-            FileHelpers.unzip_file(path)
+            # extraction can take minutes for big archives, keep it off the loop
+            await self.run_blocking(FileHelpers.unzip_file, path)
             self.redirect(f"/panel/server_detail?id={server_id}&subpage=files")
             return
 
@@ -312,7 +321,7 @@ class FileHandler(BaseHandler):
                 FileHelpers.del_dirs(dir_path)
 
     @tornado.web.authenticated
-    def put(self, page):
+    async def put(self, page):
         api_key, _, exec_user = self.current_user
         superuser = exec_user["superuser"]
         if api_key is not None:
@@ -362,9 +371,19 @@ class FileHandler(BaseHandler):
                 )
                 return
 
-            # Open the file in write mode and store the content in file_object
-            with open(file_path, "w", encoding="utf-8") as file_object:
-                file_object.write(file_contents)
+            # refuse to overwrite changes made since the editor loaded the file
+            try:
+                saved = await self.run_blocking(
+                    FileEditor.save,
+                    file_path,
+                    file_contents,
+                    self.get_body_argument("sha256", default=None, strip=True),
+                )
+            except FileConflictError as e:
+                self.set_status(409)
+                self.finish({"error": "FileChanged", "sha256": e.current_sha256})
+                return
+            self.finish(saved)
 
         elif page == "rename_file":
             if not permissions["Files"] in user_perms:
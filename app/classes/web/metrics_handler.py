@@ -0,0 +1,25 @@
+import logging
+
+from app.classes.shared.instrumentation import Instrumentation
+from app.classes.web.base_handler import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsHandler(BaseHandler):
+    """
+    Instrumentation in the Prometheus text format, for superusers only.
+    Scrapers authenticate with an API token as a bearer token.
+    """
+
+    def get(self):
+        auth_data = self.authenticate_user()
+        if not auth_data:
+            return
+        if not auth_data[3]:
+            self.finish_json(403, {"status": "error", "error": "NOT_AUTHORIZED"})
+            return
+
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.set_header("Cache-Control", "no-store")
+        self.finish(Instrumentation().render(self.helper.websocket_helper))
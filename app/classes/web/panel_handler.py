@@ -24,6 +24,7 @@ from app.classes.models.server_permissions import EnumPermissionsServer
 from app.classes.models.crafty_permissions import EnumPermissionsCrafty
 from app.classes.models.management import HelpersManagement
 from app.classes.controllers.roles_controller import RolesController
+from app.classes.shared.console_events import ConsoleEventType
 from app.classes.shared.helpers import Helpers
 from app.classes.shared.main_models import DatabaseShortcuts
 from app.classes.web.base_handler import BaseHandler
@@ -119,19 +120,21 @@ class PanelHandler(BaseHandler):
                 roles.add(role.role_id)
         return roles
 
-    def download_file(self, name: str, file: str):
+    async def download_file(self, name: str, file: str):
         self.set_header("Content-Type", "application/octet-stream")
         self.set_header("Content-Disposition", f"attachment; filename={name}")
         chunk_size = 1024 * 1024 * 4  # 4 MiB
 
         with open(file, "rb") as f:
             while True:
-                chunk = f.read(chunk_size)
+                # reads happen on the blocking pool, and waiting for the
+                # client to take each chunk keeps only one chunk in memory
+                chunk = await self.run_blocking(f.read, chunk_size)
                 if not chunk:
                     break
                 try:
                     self.write(chunk)  # write the chunk to response
-                    self.flush()  # send the chunk to client
+                    await self.flush()  # send the chunk to client
                 except iostream.StreamClosedError:
                     # this means the client has closed the connection
                     # so break the loop
@@ -248,31 +251,17 @@ class PanelHandler(BaseHandler):
             )
 
         user_order = self.controller.users.get_user_by_id(exec_user["user_id"])
-        user_order = user_order["server_order"].split(",")
-        page_servers = []
-        server_ids = []
-
-        for server_id in user_order[:]:
-            for server in defined_servers[:]:
-                if str(server.server_id) == str(server_id):
-                    page_servers.append(
-                        DatabaseShortcuts.get_data_obj(server.server_object)
-                    )
-                    user_order.remove(server_id)
-                    defined_servers.remove(server)
-
-        for server in defined_servers:
-            server_ids.append(str(server.server_id))
-            if server not in page_servers:
-                page_servers.append(
-                    DatabaseShortcuts.get_data_obj(server.server_object)
-                )
-
-        for server_id in user_order[:]:
-            # remove IDs in list that user no longer has access to
-            if str(server_id) not in server_ids:
-                user_order.remove(server_id)
-        defined_servers = page_servers
+        position = {}
+        for server_id in user_order["server_order"].split(","):
+            position.setdefault(server_id, len(position))
+        defined_servers = [
+            DatabaseShortcuts.get_data_obj(server.server_object)
+            for server in sorted(
+                defined_servers,
+                key=lambda server: position.get(str(server.server_id), len(position)),
+            )
+        ]
+        running_servers = len(self.controller.servers.list_running_servers())
 
         try:
             tz = get_localzone()
@@ -297,11 +286,8 @@ class PanelHandler(BaseHandler):
             },
             "server_stats": {
                 "total": len(defined_servers),
-                "running": len(self.controller.servers.list_running_servers()),
-                "stopped": (
-                    len(self.controller.servers.list_defined_servers())
-                    - len(self.controller.servers.list_running_servers())
-                ),
+                "running": running_servers,
+                "stopped": len(self.controller.servers.servers_list) - running_servers,
             },
             "menu_servers": defined_servers,
             "hosts_data": self.controller.management.get_latest_hosts_stats(),
@@ -407,28 +393,12 @@ class PanelHandler(BaseHandler):
             page_data["first_log"] = self.controller.first_login
             if self.controller.first_login and exec_user["username"] == "admin":
                 self.controller.first_login = False
-            if superuser:  # TODO: Figure out a better solution
-                try:
-                    page_data[
-                        "servers"
-                    ] = self.controller.servers.get_all_servers_stats()
-                except IndexError:
-                    self.controller.servers.stats.record_stats()
-                    page_data[
-                        "servers"
-                    ] = self.controller.servers.get_all_servers_stats()
+            if superuser:
+                page_data["servers"] = self.controller.servers.get_dashboard_servers()
             else:
-                try:
-                    user_auth = self.controller.servers.get_authorized_servers_stats(
-                        exec_user["user_id"]
-                    )
-                except IndexError:
-                    self.controller.servers.stats.record_stats()
-                    user_auth = self.controller.servers.get_authorized_servers_stats(
-                        exec_user["user_id"]
-                    )
-                logger.debug(f"ASFR: {user_auth}")
-                page_data["servers"] = user_auth
+                page_data["servers"] = self.controller.servers.get_dashboard_servers(
+                    exec_user["user_id"]
+                )
                 page_data["server_stats"]["running"] = len(
                     list(filter(lambda x: x["stats"]["running"], page_data["servers"]))
                 )
@@ -436,59 +406,16 @@ class PanelHandler(BaseHandler):
                     len(page_data["servers"]) - page_data["server_stats"]["running"]
                 )
 
-            # set user server order
+            # set user server order, servers missing from it go last
             user_order = self.controller.users.get_user_by_id(exec_user["user_id"])
-            user_order = user_order["server_order"].split(",")
-            page_servers = []
-            server_ids = []
-            un_used_servers = page_data["servers"]
-            flag = 0
-            for server_id in user_order[:]:
-                for server in un_used_servers[:]:
-                    if flag == 0:
-                        server["stats"][
-                            "downloading"
-                        ] = self.controller.servers.get_download_status(
-                            str(server["stats"]["server_id"]["server_id"])
-                        )
-                        server["stats"]["crashed"] = self.controller.servers.is_crashed(
-                            str(server["stats"]["server_id"]["server_id"])
-                        )
-                        try:
-                            server["stats"][
-                                "waiting_start"
-                            ] = self.controller.servers.get_waiting_start(
-                                str(server["stats"]["server_id"]["server_id"])
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to get server waiting to start: {e}")
-                            server["stats"]["waiting_start"] = False
-
-                    if str(server["server_data"]["server_id"]) == str(server_id):
-                        page_servers.append(server)
-                        un_used_servers.remove(server)
-                        user_order.remove(server_id)
-                # we only want to set these server stats values once.
-                # We need to update the flag so it only hits that if once.
-                flag += 1
-
-            for server in un_used_servers:
-                server_ids.append(str(server["server_data"]["server_id"]))
-                if server not in page_servers:
-                    page_servers.append(server)
-            for server_id in user_order:
-                # remove IDs in list that user no longer has access to
-                if str(server_id) not in server_ids[:]:
-                    user_order.remove(server_id)
-            page_data["servers"] = page_servers
-            for server in page_data["servers"]:
-                server_obj = self.controller.servers.get_server_instance_by_id(
-                    server["server_data"]["server_id"]
+            position = {}
+            for server_id in user_order["server_order"].split(","):
+                position.setdefault(server_id, len(position))
+            page_data["servers"].sort(
+                key=lambda server: position.get(
+                    str(server["server_data"]["server_id"]), len(position)
                 )
-                alert = False
-                if server_obj.last_backup_status():
-                    alert = True
-                server["alert"] = alert
+            )
 
             # num players is set to zero here. If we poll all servers while
             # dashboard is loading it takes FOREVER. We leave this to the
@@ -752,7 +679,7 @@ class PanelHandler(BaseHandler):
                 self.redirect("/panel/error?error=Invalid path detected")
                 return
 
-            self.download_file(file, backup_file)
+            await self.download_file(file, backup_file)
 
             self.redirect(f"/panel/server_detail?id={server_id}&subpage=backup")
 
@@ -910,6 +837,8 @@ class PanelHandler(BaseHandler):
             page_data["schedule"]["cron_string"] = ""
             page_data["schedule"]["time"] = ""
             page_data["schedule"]["interval"] = ""
+            page_data["schedule"]["event"] = ""
+            page_data["console_events"] = ConsoleEventType.ALL
             # we don't need to check difficulty here.
             # We'll just default to basic for new schedules
             page_data["schedule"]["difficulty"] = "basic"
@@ -989,6 +918,8 @@ class PanelHandler(BaseHandler):
             page_data["schedule"]["time"] = schedule.start_time
             page_data["schedule"]["interval"] = schedule.interval
             page_data["schedule"]["interval_type"] = schedule.interval_type
+            page_data["schedule"]["event"] = schedule.event or ""
+            page_data["console_events"] = ConsoleEventType.ALL
             if schedule.interval_type == "reaction":
                 difficulty = "reaction"
             elif schedule.cron_string == "":
@@ -1249,7 +1180,7 @@ class PanelHandler(BaseHandler):
                 self.redirect("/panel/error?error=Invalid path detected")
                 return
 
-            self.download_file(name, file)
+            await self.download_file(name, file)
             self.redirect(f"/panel/server_detail?id={server_id}&subpage=files")
 
         elif page == "wiki":
@@ -1580,6 +1511,12 @@ class PanelHandler(BaseHandler):
                 action = bleach.clean(self.get_argument("action", None))
                 delay = bleach.clean(self.get_argument("delay", None))
                 parent = bleach.clean(self.get_argument("parent", None))
+                event = bleach.clean(self.get_argument("event", ""))
+                if event not in ConsoleEventType.ALL:
+                    event = ""
+                if event:
+                    # fired by the console event, not by a parent schedule
+                    parent = None
                 if action == "command":
                     command = bleach.clean(self.get_argument("command", None))
                 elif action == "start":
@@ -1647,6 +1584,7 @@ class PanelHandler(BaseHandler):
                     "one_time": one_time,
                     "parent": parent,
                     "delay": delay,
+                    "event": event,
                 }
             elif difficulty == "advanced":
                 job_data = {
@@ -1736,6 +1674,12 @@ class PanelHandler(BaseHandler):
                 action = bleach.clean(self.get_argument("action", None))
                 delay = bleach.clean(self.get_argument("delay", None))
                 parent = bleach.clean(self.get_argument("parent", None))
+                event = bleach.clean(self.get_argument("event", ""))
+                if event not in ConsoleEventType.ALL:
+                    event = ""
+                if event:
+                    # fired by the console event, not by a parent schedule
+                    parent = None
                 if action == "command":
                     command = bleach.clean(self.get_argument("command", None))
                 elif action == "start":
@@ -1818,6 +1762,7 @@ class PanelHandler(BaseHandler):
                     "one_time": one_time,
                     "parent": parent,
                     "delay": delay,
+                    "event": event,
                 }
             else:
                 job_data = {
@@ -13,15 +13,23 @@ from app.classes.web.routes.api.roles.role.index import ApiRolesRoleIndexHandler
 from app.classes.web.routes.api.roles.role.servers import ApiRolesRoleServersHandler
 from app.classes.web.routes.api.roles.role.users import ApiRolesRoleUsersHandler
 from app.classes.web.routes.api.servers.index import ApiServersIndexHandler
+from app.classes.web.routes.api.servers.logs import ApiServersLogsSearchHandler
 from app.classes.web.routes.api.servers.server.action import (
     ApiServersServerActionHandler,
 )
+from app.classes.web.routes.api.servers.server.files import (
+    ApiServersServerFilesContentHandler,
+    ApiServersServerFilesHandler,
+)
 from app.classes.web.routes.api.servers.server.index import ApiServersServerIndexHandler
 from app.classes.web.routes.api.servers.server.logs import ApiServersServerLogsHandler
 from app.classes.web.routes.api.servers.server.public import (
     ApiServersServerPublicHandler,
 )
-from app.classes.web.routes.api.servers.server.stats import ApiServersServerStatsHandler
+from app.classes.web.routes.api.servers.server.stats import (
+    ApiServersServerStatsHandler,
+    ApiServersServerStatsHistoryHandler,
+)
 from app.classes.web.routes.api.servers.server.stdin import ApiServersServerStdinHandler
 from app.classes.web.routes.api.servers.server.tasks.index import (
     ApiServersServerTasksIndexHandler,
@@ -107,6 +115,11 @@ def api_handlers(handler_args):
             ApiServersIndexHandler,
             handler_args,
         ),
+        (
+            r"/api/v2/servers/logs/search/?",
+            ApiServersLogsSearchHandler,
+            handler_args,
+        ),
         (
             r"/api/v2/servers/([0-9]+)/?",
             ApiServersServerIndexHandler,
@@ -132,11 +145,26 @@ def api_handlers(handler_args):
             ApiServersServerStatsHandler,
             handler_args,
         ),
+        (
+            r"/api/v2/servers/([0-9]+)/stats/history/?",
+            ApiServersServerStatsHistoryHandler,
+            handler_args,
+        ),
         (
             r"/api/v2/servers/([0-9]+)/action/([a-z_]+)/?",
             ApiServersServerActionHandler,
             handler_args,
         ),
+        (
+            r"/api/v2/servers/([0-9]+)/files/?",
+            ApiServersServerFilesHandler,
+            handler_args,
+        ),
+        (
+            r"/api/v2/servers/([0-9]+)/files/content/?",
+            ApiServersServerFilesContentHandler,
+            handler_args,
+        ),
         (
             r"/api/v2/servers/([0-9]+)/logs/?",
             ApiServersServerLogsHandler,
@@ -0,0 +1,52 @@
+import logging
+from app.classes.models.server_permissions import EnumPermissionsServer
+from app.classes.controllers.servers_controller import ServersController
+from app.classes.web.base_api_handler import BaseApiHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ApiServersLogsSearchHandler(BaseApiHandler):
+    def get(self):
+        auth_data = self.authenticate_user()
+        if not auth_data:
+            return
+
+        # GET /api/v2/servers/logs/search?q=Notch&server_id=1&from=...&to=...
+        query = self.get_query_argument("q", "")
+        if not query.strip():
+            return self.finish_json(400, {"status": "error", "error": "MISSING_QUERY"})
+        try:
+            start = self.get_query_argument("from", None)
+            start = int(start) if start is not None else None
+            end = self.get_query_argument("to", None)
+            end = int(end) if end is not None else None
+            limit = min(max(int(self.get_query_argument("limit", 100)), 1), 1000)
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+
+        accessible = [str(x["server_id"]) for x in auth_data[0]]
+        server_ids = self.get_query_arguments("server_id") or accessible
+        for server_id in server_ids:
+            if server_id not in accessible or (
+                EnumPermissionsServer.LOGS
+                not in self.controller.server_perms.get_user_id_permissions_list(
+                    auth_data[4]["user_id"], server_id
+                )
+            ):
+                # if the user can't read the logs of a server, return an error
+                return self.finish_json(
+                    400, {"status": "error", "error": "NOT_AUTHORIZED"}
+                )
+
+        matches = ServersController.get_log_index().search(
+            query, server_ids, start, end, limit
+        )
+
+        self.finish_json(
+            200,
+            {
+                "status": "ok",
+                "data": matches,
+            },
+        )
@@ -0,0 +1,203 @@
+import logging
+import pathlib
+import orjson
+from jsonschema import validate
+from jsonschema.exceptions import ValidationError
+from app.classes.models.server_permissions import EnumPermissionsServer
+from app.classes.shared.dir_listing import DirListing
+from app.classes.shared.file_editor import FileConflictError, FileEditor
+from app.classes.shared.helpers import Helpers
+from app.classes.web.base_api_handler import BaseApiHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ApiServersServerFilesHandler(BaseApiHandler):
+    # entries per chunk when streaming a whole directory
+    stream_chunk = 1000
+
+    async def get(self, server_id: str):
+        auth_data = self.authenticate_user()
+        if not auth_data:
+            return
+
+        if server_id not in [str(x["server_id"]) for x in auth_data[0]]:
+            # if the user doesn't have access to the server, return an error
+            return self.finish_json(400, {"status": "error", "error": "NOT_AUTHORIZED"})
+
+        if (
+            EnumPermissionsServer.FILES
+            not in self.controller.server_perms.get_user_id_permissions_list(
+                auth_data[4]["user_id"], server_id
+            )
+        ):
+            # if the user doesn't have Files permission, return an error
+            return self.finish_json(400, {"status": "error", "error": "NOT_AUTHORIZED"})
+
+        # GET /api/v2/servers/1/files?path=world/region&offset=0&limit=500
+        # GET /api/v2/servers/1/files?path=world/region&sort=size&order=desc
+        # GET /api/v2/servers/1/files?path=world/region&stream=true
+        sort = self.get_query_argument("sort", "name")
+        reverse = self.get_query_argument("order", "asc") == "desc"
+        stream = self.get_query_argument("stream", None) == "true"
+        try:
+            offset = max(int(self.get_query_argument("offset", 0)), 0)
+            limit = min(max(int(self.get_query_argument("limit", 500)), 1), 5000)
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+        if sort not in DirListing.sort_keys:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_SORT"})
+
+        server_path = self.controller.servers.get_server_data_by_id(server_id)["path"]
+        try:
+            folder = Helpers.validate_traversal(
+                server_path, self.get_query_argument("path", "")
+            )
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "TRAVERSAL"})
+        relative = folder.relative_to(pathlib.Path(server_path).resolve()).as_posix()
+
+        listing = DirListing()
+        try:
+            # scanning and stat'ing can take a while on big or slow disks
+            if not stream:
+                page = await self.run_blocking(
+                    listing.page, folder, offset, limit, sort, reverse
+                )
+                return self.finish_json(
+                    200,
+                    {"status": "ok", "data": dict(page, path=relative)},
+                )
+            entries = await self.run_blocking(listing.entries, folder, sort, reverse)
+        except (FileNotFoundError, NotADirectoryError):
+            return self.finish_json(404, {"status": "error", "error": "NOT_FOUND"})
+
+        # one JSON document per line, the first one describes the listing
+        self.set_header("Content-Type", "application/x-ndjson")
+        self.write(orjson.dumps({"path": relative, "total": len(entries)}) + b"\n")
+        for start in range(0, len(entries), ApiServersServerFilesHandler.stream_chunk):
+            chunk = entries[start : start + ApiServersServerFilesHandler.stream_chunk]
+            described = await self.run_blocking(
+                lambda chunk=chunk: [DirListing.describe(*item) for item in chunk],
+            )
+            self.write(b"".join(orjson.dumps(e) + b"\n" for e in described))
+            await self.flush()
+        self.finish()
+
+
+file_range_schema = {
+    "type": "object",
+    "properties": {
+        "path": {"type": "string", "minLength": 1},
+        "offset": {"type": "integer", "minimum": 0},
+        "length": {"type": "integer", "minimum": 0},
+        "content": {"type": "string"},
+        "sha256": {"type": "string"},
+    },
+    "required": ["path", "offset", "length", "content", "sha256"],
+    "additionalProperties": False,
+}
+
+
+class ApiServersServerFilesContentHandler(BaseApiHandler):
+    def get_file_path(self, server_id, path):
+        """
+        The absolute path of a file in the server directory, or None when the
+        request was answered with an error.
+        """
+        auth_data = self.authenticate_user()
+        if not auth_data:
+            return None
+
+        if server_id not in [str(x["server_id"]) for x in auth_data[0]] or (
+            EnumPermissionsServer.FILES
+            not in self.controller.server_perms.get_user_id_permissions_list(
+                auth_data[4]["user_id"], server_id
+            )
+        ):
+            # if the user doesn't have Files permission, return an error
+            self.finish_json(400, {"status": "error", "error": "NOT_AUTHORIZED"})
+            return None
+
+        server_path = self.controller.servers.get_server_data_by_id(server_id)["path"]
+        try:
+            file_path = Helpers.validate_traversal(server_path, path or "")
+        except ValueError:
+            self.finish_json(400, {"status": "error", "error": "TRAVERSAL"})
+            return None
+        if not file_path.is_file():
+            self.finish_json(404, {"status": "error", "error": "NOT_FOUND"})
+            return None
+        return file_path
+
+    async def get(self, server_id: str):
+        # GET /api/v2/servers/1/files/content?path=logs/latest.log&offset=0
+        file_path = self.get_file_path(server_id, self.get_query_argument("path", ""))
+        if file_path is None:
+            return
+        try:
+            offset = max(int(self.get_query_argument("offset", 0)), 0)
+            length = min(
+                max(int(self.get_query_argument("length", FileEditor.max_window)), 1),
+                FileEditor.max_window,
+            )
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+        with_hash = self.get_query_argument("hash", None) == "true"
+
+        def read():
+            if FileEditor.is_binary(file_path):
+                return None
+            return FileEditor.read_window(file_path, offset, length, with_hash)
+
+        window = await self.run_blocking(read)
+        if window is None:
+            return self.finish_json(400, {"status": "error", "error": "BINARY_FILE"})
+        self.finish_json(200, {"status": "ok", "data": window})
+
+    async def put(self, server_id: str):
+        # PUT /api/v2/servers/1/files/content
+        # {"path": "server.properties", "offset": 120, "length": 12,
+        #  "content": "motd=Hello", "sha256": "<sha256 the range was read at>"}
+        try:
+            data = orjson.loads(self.request.body)
+        except orjson.JSONDecodeError as e:
+            return self.finish_json(
+                400, {"status": "error", "error": "INVALID_JSON", "error_data": str(e)}
+            )
+        try:
+            validate(data, file_range_schema)
+        except ValidationError as e:
+            return self.finish_json(
+                400,
+                {
+                    "status": "error",
+                    "error": "INVALID_JSON_SCHEMA",
+                    "error_data": str(e),
+                },
+            )
+
+        file_path = self.get_file_path(server_id, data["path"])
+        if file_path is None:
+            return
+        try:
+            written = await self.run_blocking(
+                FileEditor.write_range,
+                file_path,
+                data["offset"],
+                data["length"],
+                data["content"].encode("utf-8"),
+                data["sha256"],
+            )
+        except FileConflictError as e:
+            return self.finish_json(
+                409,
+                {
+                    "status": "error",
+                    "error": "FILE_CHANGED",
+                    "error_data": e.current_sha256,
+                },
+            )
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+        self.finish_json(200, {"status": "ok", "data": written})
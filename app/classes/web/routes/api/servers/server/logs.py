@@ -3,10 +3,10 @@ import logging
 import pathlib
 import re
 from app.classes.models.server_permissions import EnumPermissionsServer
+from app.classes.shared.log_reader import LogReader, LogCursorError
 from app.classes.shared.server import ServerOutBuf
 from app.classes.web.base_api_handler import BaseApiHandler
 
-
 logger = logging.getLogger(__name__)
 
 ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
@@ -26,6 +26,16 @@ class ApiServersServerLogsHandler(BaseApiHandler):
         disable_ansi_strip = self.get_query_argument("raw", None) == "true"
         # GET /api/v2/servers/server/logs?html=true
         use_html = self.get_query_argument("html", None) == "true"
+        # GET /api/v2/servers/server/logs?file=true&cursor=true
+        # GET /api/v2/servers/server/logs?file=true&after=<cursor>
+        # GET /api/v2/servers/server/logs?file=true&before=<cursor>
+        after = self.get_query_argument("after", None)
+        before = self.get_query_argument("before", None)
+        use_cursor = (
+            self.get_query_argument("cursor", None) == "true"
+            or after is not None
+            or before is not None
+        )
 
         if server_id not in [str(x["server_id"]) for x in auth_data[0]]:
             # if the user doesn't have access to the server, return an error
@@ -42,7 +52,27 @@ class ApiServersServerLogsHandler(BaseApiHandler):
 
         server_data = self.controller.servers.get_server_data_by_id(server_id)
 
-        if read_log_file:
+        chunk = None
+        if read_log_file and use_cursor:
+            log_lines = self.helper.get_setting("max_log_lines")
+            log_path = pathlib.Path(server_data["path"], server_data["log_path"])
+            try:
+                if after is not None:
+                    chunk = LogReader.read_after(log_path, after, log_lines)
+                elif before is not None:
+                    chunk = LogReader.read_before(log_path, before, log_lines)
+                else:
+                    chunk = LogReader.tail(log_path, log_lines)
+            except LogCursorError:
+                return self.finish_json(
+                    400, {"status": "error", "error": "INVALID_CURSOR"}
+                )
+            except OSError:
+                return self.finish_json(
+                    404, {"status": "error", "error": "LOG_NOT_FOUND"}
+                )
+            raw_lines = chunk.lines
+        elif read_log_file:
             log_lines = self.helper.get_setting("max_log_lines")
             raw_lines = self.helper.tail_file(
                 # If the log path is absolute it returns it as is
@@ -72,7 +102,17 @@ class ApiServersServerLogsHandler(BaseApiHandler):
             except Exception as e:
                 logger.warning(f"Skipping Log Line due to error: {e}")
 
-        if use_html:
+        if chunk is not None:
+            chunk.lines = lines
+            if use_html:
+                self.set_header("X-Log-Start", chunk.start_cursor)
+                self.set_header("X-Log-End", chunk.end_cursor)
+                self.set_header("X-Log-Reset", str(chunk.reset).lower())
+                for line in lines:
+                    self.write(f"{line}<br />")
+            else:
+                self.finish_json(200, {"status": "ok", "data": chunk.to_dict()})
+        elif use_html:
             for line in lines:
                 self.write(f"{line}<br />")
         else:
@@ -1,3 +1,4 @@
+import time
 import logging
 from app.classes.web.base_api_handler import BaseApiHandler
 from app.classes.controllers.servers_controller import ServersController
@@ -26,3 +27,38 @@ class ApiServersServerStatsHandler(BaseApiHandler):
                 "data": latest,
             },
         )
+
+
+class ApiServersServerStatsHistoryHandler(BaseApiHandler):
+    async def get(self, server_id: str):
+        auth_data = self.authenticate_user()
+        if not auth_data:
+            return
+
+        if server_id not in [str(x["server_id"]) for x in auth_data[0]]:
+            # if the user doesn't have access to the server, return an error
+            return self.finish_json(400, {"status": "error", "error": "NOT_AUTHORIZED"})
+
+        now = int(time.time())
+        try:
+            end = int(self.get_query_argument("to", now))
+            start = int(self.get_query_argument("from", end - 3600))
+        except ValueError:
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+        resolution = self.get_query_argument("resolution", None)
+        if start >= end or resolution not in (None, "raw", "1m", "1h"):
+            return self.finish_json(400, {"status": "error", "error": "INVALID_RANGE"})
+
+        srv = ServersController().get_server_instance_by_id(server_id)
+        # a long range of raw rows spans several partitions
+        history = await self.run_blocking(
+            srv.stats_helper.get_stats_history, start, end, resolution
+        )
+
+        self.finish_json(
+            200,
+            {
+                "status": "ok",
+                "data": history,
+            },
+        )
@@ -3,12 +3,11 @@ import logging
 from app.classes.models.server_permissions import EnumPermissionsServer
 from app.classes.web.base_api_handler import BaseApiHandler
 
-
 logger = logging.getLogger(__name__)
 
 
 class ApiServersServerStdinHandler(BaseApiHandler):
-    def post(self, server_id: str):
+    async def post(self, server_id: str):
         auth_data = self.authenticate_user()
         if not auth_data:
             return
@@ -36,7 +35,8 @@ class ApiServersServerStdinHandler(BaseApiHandler):
             )
             return self.finish_json(400, {"status": "error", "error": "NOT_AUTHORIZED"})
 
-        if svr.send_command(self.request.body.decode("utf-8")):
+        # waits for the server to take the command, off the IOLoop
+        if await self.run_blocking(svr.send_command, self.request.body.decode("utf-8")):
             return self.finish_json(
                 200,
                 {"status": "ok"},
@@ -6,6 +6,7 @@ import logging
 from jsonschema import ValidationError, validate
 from app.classes.models.management import HelpersManagement
 from app.classes.models.server_permissions import EnumPermissionsServer
+from app.classes.shared.console_events import ConsoleEventType
 
 from app.classes.web.base_api_handler import BaseApiHandler
 
@@ -42,6 +43,8 @@ task_patch_schema = {
         "cron_string": {"type": "string", "default": ""},
         "parent": {"type": ["integer", "null"]},
         "delay": {"type": "integer", "default": 0},
+        # Console event that fires a reaction task, see ConsoleEventType
+        "event": {"type": "string", "enum": ["", *ConsoleEventType.ALL]},
     },
     "additionalProperties": False,
     "minProperties": 1,
@@ -1,53 +1,115 @@
 import logging
+from email.utils import parsedate_to_datetime
 
+from app.classes.shared.rate_limiter import RateLimiter
+from app.classes.shared.status_snapshot import StatusSnapshot
 from app.classes.web.base_handler import BaseHandler
 
 logger = logging.getLogger(__name__)
 
 
 class StatusHandler(BaseHandler):
-    def get(self):
-        page_data = {}
-        page_data["lang"] = self.helper.get_setting("language")
-        page_data["lang_page"] = self.helper.get_lang_page(
-            self.helper.get_setting("language")
-        )
-        page_data["servers"] = self.controller.servers.get_all_servers_stats()
-        running = 0
-        for srv in page_data["servers"]:
-            if srv["stats"]["running"]:
-                running += 1
-            server_data = srv.get("server_data", False)
-            server_id = server_data.get("server_id", False)
-            srv["raw_ping_result"] = self.controller.servers.get_server_stats_by_id(
-                server_id
-            )
-            if "icon" not in srv["raw_ping_result"]:
-                srv["raw_ping_result"]["icon"] = False
+    """
+    The public status page. Served from StatusSnapshot, rendered once per
+    snapshot version and answered with a 304 when the client has it already.
+    """
 
-        page_data["running"] = running
+    rate_limiter = None
+    trusted_proxies = frozenset()
 
-        template = "public/status.html"
+    def client_ip(self):
+        """
+        The address requests are limited by. Forwarding headers are only
+        believed when the connection comes from one of the trusted_proxies,
+        anyone else could send a new address with every request.
+        """
+        remote_ip = self.request.remote_ip
+        if remote_ip not in StatusHandler.trusted_proxies:
+            return remote_ip
+        real_ip = self.request.headers.get("X-Real-IP", "").strip()
+        if real_ip:
+            return real_ip
+        # the rightmost address no proxy of ours added is the client
+        forwarded = self.request.headers.get("X-Forwarded-For", "").split(",")
+        for address in reversed([a.strip() for a in forwarded if a.strip()]):
+            if address not in StatusHandler.trusted_proxies:
+                return address
+        return remote_ip
 
-        self.render(
-            template,
-            data=page_data,
-            translate=self.translator.translate,
+    def limit_rate(self):
+        """Returns True if the request was answered with a 429."""
+        if StatusHandler.rate_limiter is None:
+            StatusHandler.trusted_proxies = frozenset(
+                self.helper.get_setting("trusted_proxies", [])
+            )
+            StatusHandler.rate_limiter = RateLimiter(
+                self.helper.get_setting("status_rate_per_minute", 60)
+            )
+        remote_ip = self.client_ip()
+        if StatusHandler.rate_limiter.allow(remote_ip):
+            return False
+        self.set_status(429)
+        self.set_header(
+            "Retry-After", str(StatusHandler.rate_limiter.retry_after(remote_ip))
         )
+        self.finish()
+        return True
 
-    def post(self):
-        page_data = {}
-        page_data["servers"] = self.controller.servers.get_all_servers_stats()
-        for srv in page_data["servers"]:
-            server_data = srv.get("server_data", False)
-            server_id = server_data.get("server_id", False)
-            srv["raw_ping_result"] = self.controller.servers.get_server_stats_by_id(
-                server_id
+    def not_modified(self, snapshot: StatusSnapshot, variant):
+        """Sets the cache headers, returns True if the request was answered with a 304."""
+        self.set_header("Etag", snapshot.etag(variant))
+        self.set_header("Last-Modified", snapshot.last_modified_header())
+        self.set_header("Cache-Control", "public, max-age=5")
+        if self.request.headers.get("If-None-Match"):
+            fresh = self.check_etag_header()
+        else:
+            fresh = self.modified_since(snapshot)
+        if fresh:
+            self.set_status(304)
+            self.finish()
+        return fresh
+
+    def modified_since(self, snapshot: StatusSnapshot):
+        since = self.request.headers.get("If-Modified-Since")
+        if not since:
+            return False
+        try:
+            return (
+                int(snapshot.last_modified) <= parsedate_to_datetime(since).timestamp()
             )
-        template = "public/status.html"
+        except (TypeError, ValueError):
+            return False
+
+    def get(self):
+        if self.limit_rate():
+            return
+        snapshot = StatusSnapshot()
+        # the page differs between http and https (websocket url)
+        variant = f"-{self.request.protocol}"
+        if self.not_modified(snapshot, variant):
+            return
+        self.finish(snapshot.cached(f"html{variant}", self.render_status))
+
+    def post(self):
+        self.get()
 
-        self.render(
-            template,
+    def render_status(self):
+        page_data = StatusSnapshot().page_data()
+        page_data["lang"] = self.helper.get_setting("language")
+        page_data["lang_page"] = self.helper.get_lang_page(page_data["lang"])
+        return self.render_string(
+            "public/status.html",
             data=page_data,
             translate=self.translator.translate,
         )
+
+
+class StatusJsonHandler(StatusHandler):
+    def get(self):
+        if self.limit_rate():
+            return
+        snapshot = StatusSnapshot()
+        if self.not_modified(snapshot, "-json"):
+            return
+        self.set_header("Content-Type", "application/json")
+        self.finish(snapshot.json())
@@ -1,6 +1,5 @@
 import os
 import sys
-import json
 import asyncio
 import logging
 import tornado.web
@@ -11,8 +10,10 @@ import tornado.escape
 import tornado.locale
 import tornado.httpserver
 
+from app.classes.shared.blocking_pool import BlockingPool
 from app.classes.shared.console import Console
 from app.classes.shared.helpers import Helpers
+from app.classes.shared.instrumentation import Instrumentation
 from app.classes.shared.main_controller import Controller
 from app.classes.web.file_handler import FileHandler
 from app.classes.web.public_handler import PublicHandler
@@ -37,8 +38,8 @@ from app.classes.web.websocket_handler import SocketHandler
 from app.classes.web.static_handler import CustomStaticHandler
 from app.classes.web.upload_handler import UploadHandler
 from app.classes.web.http_handler import HTTPHandler, HTTPHandlerPage
-from app.classes.web.status_handler import StatusHandler
-
+from app.classes.web.status_handler import StatusHandler, StatusJsonHandler
+from app.classes.web.metrics_handler import MetricsHandler
 
 logger = logging.getLogger(__name__)
 
@@ -58,17 +59,12 @@ class Webserver:
 
     @staticmethod
     def log_function(handler):
-
-        info = {
-            "Status_Code": handler.get_status(),
-            "Method": handler.request.method,
-            "URL": handler.request.uri,
-            "Remote_IP": handler.request.remote_ip,
-            # pylint: disable=consider-using-f-string
-            "Elapsed_Time": "%.2fms" % (handler.request.request_time() * 1000),
-        }
-
-        tornado.log.access_log.info(json.dumps(info, indent=4))
+        Instrumentation().observe_request(handler)
+        tornado.log.access_log.info(
+            f"{handler.get_status()} {handler.request.method} {handler.request.uri} "
+            f"{handler.request.remote_ip} {type(handler).__name__} "
+            f"{handler.request.request_time() * 1000:.2f}ms"
+        )
 
     @staticmethod
     def _asyncio_patch():
@@ -133,6 +129,7 @@ class Webserver:
         logger.info(f"Starting Web Server on ports http:{http_port} https:{https_port}")
 
         asyncio.set_event_loop(asyncio.new_event_loop())
+        BlockingPool(self.helper.get_setting("web_blocking_workers", 16))
 
         tornado.template.Loader(".")
 
@@ -155,6 +152,8 @@ class Webserver:
             (r"/ws", SocketHandler, handler_args),
             (r"/upload", UploadHandler, handler_args),
             (r"/status", StatusHandler, handler_args),
+            (r"/status/json", StatusJsonHandler, handler_args),
+            (r"/metrics", MetricsHandler, handler_args),
             # API Routes V1
             (r"/api/v1/stats/servers", ServersStats, handler_args),
             (r"/api/v1/stats/node", NodeStats, handler_args),
@@ -227,6 +226,7 @@ class Webserver:
         Console.info("Server Init Complete: Listening For Connections!")
 
         self.ioloop = tornado.ioloop.IOLoop.current()
+        self.ioloop.spawn_callback(Instrumentation().watch_loop)
         self.ioloop.start()
 
     def stop_web_server(self):
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import time
@@ -139,22 +140,26 @@ class UploadHandler(BaseHandler):
         # If max_body_size is not set, you cannot upload files > 100MB
         self.request.connection.set_max_body_size(max_streamed_size)
 
-    def post(self):
+    async def post(self):
         logger.info("Upload completed")
         files_left = int(self.request.headers.get("X-Files-Left", None))
 
         if self.do_upload:
-            time.sleep(5)
+            # closing flushes what is left of the upload to disk
+            await self.run_blocking(self.f.close)
+            await asyncio.sleep(5)
             if files_left == 0:
                 self.helper.websocket_helper.broadcast("close_upload_box", "success")
             self.finish("success")  # Nope, I'm sending "success"
-            self.f.close()
         else:
-            time.sleep(5)
+            await asyncio.sleep(5)
             if files_left == 0:
                 self.helper.websocket_helper.broadcast("close_upload_box", "error")
             self.finish("error")
 
     def data_received(self, chunk):
         if self.do_upload:
+            # runs on the loop for every chunk of the body
+            started = time.perf_counter()
             self.f.write(chunk)
+            self.loop_held += time.perf_counter() - started
@@ -1,9 +1,16 @@
 import json
 import logging
 import asyncio
+import threading
 from urllib.parse import parse_qsl
 import tornado.websocket
 
+from app.classes.models.server_permissions import EnumPermissionsServer
+from app.classes.shared.console_subscriptions import (
+    ConsoleFilterError,
+    ConsoleSubscriptions,
+    LineFilter,
+)
 from app.classes.shared.helpers import Helpers
 
 logger = logging.getLogger(__name__)
@@ -16,6 +23,8 @@ class SocketHandler(tornado.websocket.WebSocketHandler):
     tasks_manager = None
     translator = None
     io_loop = None
+    # messages queued by write_message_helper that aren't written yet
+    pending_sends = 0
 
     def initialize(
         self, helper=None, controller=None, tasks_manager=None, translator=None
@@ -25,6 +34,7 @@ class SocketHandler(tornado.websocket.WebSocketHandler):
         self.tasks_manager = tasks_manager
         self.translator = translator
         self.io_loop = tornado.ioloop.IOLoop.current()
+        self.pending_lock = threading.Lock()
 
     def get_remote_ip(self):
         remote_ip = (
@@ -76,22 +86,80 @@ class SocketHandler(tornado.websocket.WebSocketHandler):
         self.helper.websocket_helper.add_client(self)
         logger.debug("Opened WebSocket connection")
 
-    # pylint: disable=arguments-renamed
+        # the server pages follow the console, filtered by the page's
+        # level, regex and player params if it has any
+        server_id = self.page_query_params.get("id")
+        if self.page == "/panel/server_detail" and server_id:
+            self.subscribe_console(
+                {
+                    "server_id": server_id,
+                    "level": self.page_query_params.get("level"),
+                    "regex": self.page_query_params.get("regex"),
+                    "player": self.page_query_params.get("player"),
+                }
+            )
+
     @staticmethod
-    def on_message(raw_message):
+    def split_list(value):
+        if isinstance(value, str):
+            value = value.split(",")
+        return [item.strip() for item in value or [] if item and item.strip()]
 
+    def subscribe_console(self, data):
+        server_id = str(data.get("server_id", ""))
+        if EnumPermissionsServer.TERMINAL not in (
+            self.controller.server_perms.get_user_id_permissions_list(
+                self.get_user_id(), server_id
+            )
+        ):
+            return
+        try:
+            line_filter = LineFilter(
+                levels=SocketHandler.split_list(data.get("level")),
+                regex=data.get("regex"),
+                players=SocketHandler.split_list(data.get("player")),
+            )
+        except ConsoleFilterError as e:
+            self.helper.websocket_helper.send_message(self, "notification", str(e))
+            return
+        ConsoleSubscriptions().subscribe(self, server_id, line_filter)
+
+    # pylint: disable=arguments-renamed
+    def on_message(self, raw_message):
         logger.debug(f"Got message from WebSocket connection {raw_message}")
         message = json.loads(raw_message)
         logger.debug(f"Event Type: {message['event']}, Data: {message['data']}")
 
+        if not self.check_auth():
+            return
+        # {"event": "subscribe_console",
+        #  "data": {"server_id": 1, "level": ["WARN", "ERROR"], "player": "Notch"}}
+        if message["event"] == "subscribe_console":
+            self.subscribe_console(message["data"] or {})
+        elif message["event"] == "unsubscribe_console":
+            ConsoleSubscriptions().unsubscribe(
+                self, (message["data"] or {}).get("server_id")
+            )
+
     def on_close(self):
         self.helper.websocket_helper.remove_client(self)
+        ConsoleSubscriptions().unsubscribe(self)
         logger.debug("Closed WebSocket connection")
 
     async def write_message_int(self, message):
-        self.write_message(message)
+        try:
+            # resolves once the message is handed to the socket, so slow
+            # clients show up in pending_sends
+            await self.write_message(message)
+        except tornado.websocket.WebSocketClosedError:
+            pass
+        finally:
+            with self.pending_lock:
+                self.pending_sends -= 1
 
     def write_message_helper(self, message):
+        with self.pending_lock:
+            self.pending_sends += 1
         asyncio.run_coroutine_threadsafe(
             self.write_message_int(message), self.io_loop.asyncio_loop
         )
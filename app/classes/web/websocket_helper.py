@@ -22,6 +22,19 @@ class WebSocketHelper:
             message = str(json.dumps({"event": event_type, "data": data}))
             client.write_message_helper(message)
 
+    def send_to_clients(self, clients, event_type: str, data):
+        # serialised once for all of them
+        message = str(json.dumps({"event": event_type, "data": data}))
+        for client in clients:
+            try:
+                if client.check_auth():
+                    client.write_message_helper(message)
+            except Exception as e:
+                logger.exception(
+                    f"Error caught while sending WebSocket message to "
+                    f"{client.get_remote_ip()} {e}"
+                )
+
     def broadcast(self, event_type: str, data):
         logger.debug(
             f"Sending to {len(self.clients)} clients: "
@@ -0,0 +1,47 @@
+# Generated by database migrator
+import peewee
+
+
+def migrate(migrator, database, **kwargs):
+    db = database
+
+    class ServerState(peewee.Model):
+        server_id = peewee.IntegerField(primary_key=True)
+        updating = peewee.BooleanField(default=False)
+        waiting_start = peewee.BooleanField(default=False)
+        first_run = peewee.BooleanField(default=True)
+        crashed = peewee.BooleanField(default=False)
+        downloading = peewee.BooleanField(default=False)
+
+        class Meta:
+            table_name = "server_state"
+            database = db
+
+    migrator.create_table(ServerState)
+    migrator.sql(
+        "INSERT OR REPLACE INTO server_state "
+        "SELECT server_id, updating, waiting_start, first_run, crashed, downloading "
+        "FROM server_stats ORDER BY created"
+    )
+    migrator.drop_columns(
+        "server_stats",
+        ["updating", "waiting_start", "first_run", "crashed", "downloading"],
+    )
+    """
+    Write your migrations here.
+    """
+
+
+def rollback(migrator, database, **kwargs):
+    migrator.add_columns(
+        "server_stats",
+        updating=peewee.BooleanField(default=False),
+        waiting_start=peewee.BooleanField(default=False),
+        first_run=peewee.BooleanField(default=True),
+        crashed=peewee.BooleanField(default=False),
+        downloading=peewee.BooleanField(default=False),
+    )
+    migrator.drop_table("server_state")
+    """
+    Write your rollback migrations here.
+    """
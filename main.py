@@ -6,14 +6,15 @@ import time
 import argparse
 import logging.config
 import signal
-import peewee
 from app.classes.shared.file_helpers import FileHelpers
 
 from app.classes.shared.import3 import Import3
+from app.classes.shared.boot_profile import BootProfile
 from app.classes.shared.console import Console
 from app.classes.shared.helpers import Helpers
 from app.classes.models.users import HelperUsers
 
+boot_profile = BootProfile()
 console = Console()
 helper = Helpers()
 if helper.check_root():
@@ -28,12 +29,14 @@ if helper.check_root():
 try:
     from app.classes.models.base_model import database_proxy
     from app.classes.shared.main_models import DatabaseBuilder
+    from app.classes.shared.database import DatabaseManager
     from app.classes.shared.tasks import TasksManager
     from app.classes.shared.main_controller import Controller
     from app.classes.shared.migration import MigrationManager
     from app.classes.shared.command import MainPrompt
 except ModuleNotFoundError as err:
     helper.auto_installer_fix(err)
+boot_profile.mark("imports")
 
 
 def do_intro():
@@ -107,15 +110,16 @@ if __name__ == "__main__":
 
     # our session file, helps prevent multiple controller agents on the same machine.
     helper.create_session_file(ignore=args.ignore)
+    boot_profile.mark("logging and session")
 
     # start the database
-    database = peewee.SqliteDatabase(
-        helper.db_path, pragmas={"journal_mode": "wal", "cache_size": -1024 * 10}
-    )
+    database = DatabaseManager().get_database(helper.db_path)
     database_proxy.initialize(database)
+    boot_profile.mark("database")
 
     migration_manager = MigrationManager(database, helper)
     migration_manager.up()  # Automatically runs migrations
+    boot_profile.mark("migrations")
 
     # do our installer stuff
     user_helper = HelperUsers(database, helper)
@@ -133,12 +137,15 @@ if __name__ == "__main__":
         installer.default_settings()
     else:
         Console.debug("Existing install detected")
+    boot_profile.mark("installer")
     file_helper = FileHelpers(helper)
     # now the tables are created, we can load the tasks_manager and server controller
     controller = Controller(database, helper, file_helper)
     import3 = Import3(helper, controller)
+    boot_profile.mark("controller")
     tasks_manager = TasksManager(helper, controller)
     tasks_manager.start_webserver()
+    boot_profile.mark("tasks manager and webserver")
 
     def signal_handler(signum, _frame):
         if not args.daemon:
@@ -156,18 +163,20 @@ if __name__ == "__main__":
     logger.info("Initializing all servers defined")
     Console.info("Initializing all servers defined")
     controller.servers.init_all_servers()
+    boot_profile.mark("init servers")
 
     def tasks_starter():
-        # start stats logging
-        tasks_manager.start_stats_recording()
+        with boot_profile.phase("tasks starter"):
+            # start stats logging
+            tasks_manager.start_stats_recording()
 
-        # once the controller is up and stats are logging, we can kick off
-        # the scheduler officially
-        tasks_manager.start_scheduler()
+            # once the controller is up and stats are logging, we can kick off
+            # the scheduler officially
+            tasks_manager.start_scheduler()
 
-        # refresh our cache and schedule for every 12 hoursour cache refresh
-        # for serverjars.com
-        tasks_manager.serverjar_cache_refresher()
+            # refresh our cache and schedule for every 12 hoursour cache refresh
+            # for serverjars.com
+            tasks_manager.serverjar_cache_refresher()
 
     tasks_starter_thread = Thread(target=tasks_starter, name="tasks_starter")
 
@@ -176,7 +185,9 @@ if __name__ == "__main__":
         logger.info("Checking Internet. This may take a minute.")
         Console.info("Checking Internet. This may take a minute.")
 
-        if not helper.check_internet():
+        with boot_profile.phase("internet check"):
+            online = helper.check_internet()
+        if not online:
             logger.warning(
                 "We have detected the machine running Crafty has no "
                 "connection to the internet. Client connections to "
@@ -191,13 +202,14 @@ if __name__ == "__main__":
     internet_check_thread = Thread(target=internet_check, name="internet_check")
 
     def controller_setup():
-        if not controller.check_system_user():
-            controller.add_system_user()
+        with boot_profile.phase("controller setup"):
+            if not controller.check_system_user():
+                controller.add_system_user()
 
-        project_root = os.path.dirname(__file__)
-        controller.set_project_root(project_root)
-        controller.clear_unexecuted_commands()
-        controller.clear_support_status()
+            project_root = os.path.dirname(__file__)
+            controller.set_project_root(project_root)
+            controller.clear_unexecuted_commands()
+            controller.clear_support_status()
 
     crafty_prompt = MainPrompt(
         helper, tasks_manager, migration_manager, controller, import3
@@ -225,6 +237,7 @@ if __name__ == "__main__":
         controller_setup_thread.join()
 
         Console.info("Crafty has fully started and is now ready for use!")
+        boot_profile.report()
         crafty_prompt.prompt = f"Crafty Controller v{helper.get_version_string()} > "
         try:
             logger.info("Removing old temp dirs")
@@ -0,0 +1,118 @@
+import os
+import time
+import tempfile
+import unittest
+
+from app.classes.shared.metrics_store import MetricsStore
+
+SERVERS = 5
+HOURS = 3
+INTERVAL = 30
+
+
+def setUpModule():
+    global store, now
+    store = MetricsStore(os.path.join(tempfile.mkdtemp(), "crafty_metrics.sqlite"))
+    now = int(time.time()) // 3600 * 3600
+    for ts in range(now - HOURS * 3600, now, INTERVAL):
+        for server_id in range(1, SERVERS + 1):
+            store.record(server_id, {"cpu": 1.0, "online": ts // INTERVAL % 3}, ts=ts)
+    # no ANALYZE, Crafty never runs it, plans must hold without statistics
+    store.writer.run(lambda: None)
+
+
+class CapturedQueries:
+    """Records the statements the store runs on its partitions."""
+
+    def __init__(self, database):
+        self.database = database
+        self.statements = []
+
+    def __enter__(self):
+        execute_sql = self.database.execute_sql
+
+        def capture(sql, params=None, *args, **kwargs):
+            if " FROM metrics_" in sql and "sqlite_master" not in sql:
+                self.statements.append((sql, params))
+            return execute_sql(sql, params, *args, **kwargs)
+
+        self.database.execute_sql = capture
+        return self
+
+    def __exit__(self, *exc):
+        del self.database.execute_sql
+
+
+def query_plan(sql, params):
+    return store.writer.run(
+        lambda: [
+            row[-1]
+            for row in store.database.execute_sql(
+                f"EXPLAIN QUERY PLAN {sql}", params
+            ).fetchall()
+        ]
+    )
+
+
+class TestMetricsStoreQueryPlans(unittest.TestCase):
+    """The statements the store runs stay index lookups as partitions grow."""
+
+    def assertIndexed(self, statements, allow_group_by=False):
+        self.assertTrue(statements)
+        for sql, params in statements:
+            for detail in query_plan(sql, params):
+                with self.subTest(sql=sql, detail=detail):
+                    if detail.startswith("SCAN"):
+                        self.assertIn(" USING ", detail)
+                    if "TEMP B-TREE" in detail:
+                        # grouping a range of one rollup chunk is fine,
+                        # sorting a whole partition is not
+                        self.assertTrue(allow_group_by)
+                        self.assertIn("GROUP BY", detail)
+
+    def test_ranged_queries(self):
+        for resolution in MetricsStore.resolutions:
+            with CapturedQueries(store.database) as captured:
+                rows = store.query(1, now - HOURS * 3600, now, resolution)
+            with self.subTest(resolution=resolution):
+                self.assertTrue(rows)
+                self.assertIndexed(captured.statements)
+
+    def test_last_online(self):
+        with CapturedQueries(store.database) as captured:
+            found = store.last_online(1, now - HOURS * 3600)
+        self.assertIsNotNone(found)
+        self.assertIndexed(captured.statements)
+
+    def test_rollups(self):
+        with CapturedQueries(store.database) as captured:
+            # the first sample of the next hour completes a 1m and a 1h bucket
+            for server_id in range(1, SERVERS + 1):
+                store.record(server_id, {"cpu": 1.0, "online": 1}, ts=now)
+            store.writer.run(lambda: None)
+        rollups = [s for s in captured.statements if s[0].startswith("INSERT")]
+        self.assertEqual(
+            {sql.split()[4].split("_")[1] for sql, _ in rollups}, {"1m", "1h"}
+        )
+        self.assertIndexed(rollups, allow_group_by=True)
+
+
+class TestMetricsStoreImport(unittest.TestCase):
+    def test_import_rolls_up(self):
+        # older than what the regular rollups already went past
+        start = now - 6 * 3600
+        store.import_samples(
+            SERVERS + 1,
+            [
+                (ts, {"cpu": 2.0, "online": 1})
+                for ts in range(start, start + 3600, INTERVAL)
+            ],
+        )
+        self.assertEqual(len(store.query(SERVERS + 1, start, now, "1m")), 60)
+        (hour,) = store.query(SERVERS + 1, start, now, "1h")
+        self.assertEqual(hour["samples"], 3600 // INTERVAL)
+        self.assertEqual(hour["cpu_avg"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
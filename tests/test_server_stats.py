@@ -0,0 +1,98 @@
+import os
+import datetime
+import sqlite3
+import tempfile
+import unittest
+
+from app.classes.models.server_stats import HelperServerStats, STATE_FLAGS
+
+# server_stats as per-server db_stats databases had it, flags included
+LEGACY_SCHEMA = """
+CREATE TABLE server_stats (
+    stats_id INTEGER NOT NULL PRIMARY KEY,
+    created DATETIME NOT NULL,
+    server_id INTEGER NOT NULL,
+    started VARCHAR(255) NOT NULL,
+    running INTEGER NOT NULL,
+    cpu REAL NOT NULL,
+    mem REAL NOT NULL,
+    mem_percent REAL NOT NULL,
+    world_name VARCHAR(255) NOT NULL,
+    world_size VARCHAR(255) NOT NULL,
+    server_port INTEGER NOT NULL,
+    int_ping_results VARCHAR(255) NOT NULL,
+    online INTEGER NOT NULL,
+    max INTEGER NOT NULL,
+    players VARCHAR(255) NOT NULL,
+    desc VARCHAR(255) NOT NULL,
+    version VARCHAR(255) NOT NULL,
+    updating INTEGER NOT NULL,
+    waiting_start INTEGER NOT NULL,
+    first_run INTEGER NOT NULL,
+    crashed INTEGER NOT NULL,
+    downloading INTEGER NOT NULL
+)
+"""
+
+
+def legacy_row(created, online, first_run, crashed):
+    return (
+        created, 1, "2022-08-01 10:00:00", 1, 12.5, "1.5GB", 40.0, "world",
+        "2.0GB", 25565, "True", online, 20, "[]", "A server", "1.19",
+        0, 0, first_run, crashed, 0,
+    )  # fmt: skip
+
+
+class TestLegacyStatsImport(unittest.TestCase):
+    def setUp(self):
+        self.legacy_file = os.path.join(
+            tempfile.mkdtemp(), "crafty_server_stats.sqlite"
+        )
+        with sqlite3.connect(self.legacy_file) as conn:
+            conn.execute(LEGACY_SCHEMA)
+            conn.executemany(
+                f"INSERT INTO server_stats VALUES (NULL, {', '.join(['?'] * 21)})",
+                [
+                    legacy_row("2022-08-01 10:00:00.000000", 0, 1, 0),
+                    legacy_row("2022-08-01 10:01:00.000000", 3, 0, 1),
+                ],
+            )
+
+    def test_flags_of_latest_row(self):
+        latest, state = HelperServerStats.read_legacy_stats(self.legacy_file, 1)
+        self.assertEqual(latest["online"], 3)
+        self.assertEqual(latest["server_id"], 1)
+        self.assertEqual(
+            state,
+            {
+                "updating": False,
+                "waiting_start": False,
+                "first_run": False,
+                "crashed": True,
+                "downloading": False,
+            },
+        )
+
+    def test_missing_flag_columns(self):
+        with sqlite3.connect(self.legacy_file) as conn:
+            conn.execute("ALTER TABLE server_stats DROP COLUMN crashed")
+        _, state = HelperServerStats.read_legacy_stats(self.legacy_file, 1)
+        self.assertFalse(state["first_run"])
+        self.assertEqual(state["crashed"], dict(STATE_FLAGS)["crashed"])
+
+    def test_history(self):
+        since = datetime.datetime(2022, 8, 1, 10, 0, 30).timestamp()
+        history = HelperServerStats.read_legacy_history(self.legacy_file, 1, since)
+        self.assertEqual(len(history), 1)
+        ts, sample = history[0]
+        self.assertEqual(ts, datetime.datetime(2022, 8, 1, 10, 1).timestamp())
+        self.assertEqual(sample["online"], 3)
+        self.assertEqual(sample["mem"], int(1.5 * 1024**3))
+        self.assertEqual(sample["world_size"], 2 * 1024**3)
+
+    def test_unknown_server(self):
+        self.assertIsNone(HelperServerStats.read_legacy_stats(self.legacy_file, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Contention benchmark for the stats database.
+
+Simulates a number of servers that each record a stats row on their own
+thread, while readers poll the latest rows like the dashboard does. Runs once
+with every thread writing directly using the old pragmas, and once through
+the tuned DatabaseManager with its writer thread.
+
+    python -m tools.database_benchmark --servers 100 --seconds 10
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import datetime
+import threading
+import statistics
+import peewee
+
+from app.classes.shared.database import DatabaseManager
+
+OLD_PRAGMAS = {"journal_mode": "wal", "cache_size": -1024 * 10}
+
+
+class BenchStats(peewee.Model):
+    created = peewee.DateTimeField(default=datetime.datetime.now)
+    server_id = peewee.IntegerField(index=True)
+    cpu = peewee.FloatField(default=0)
+    mem = peewee.FloatField(default=0)
+    online = peewee.IntegerField(default=0)
+    players = peewee.CharField(default="")
+    desc = peewee.CharField(default="")
+
+
+def _row(server_id):
+    return {
+        BenchStats.server_id: server_id,
+        BenchStats.cpu: random.random() * 100,
+        BenchStats.mem: random.random() * 100,
+        BenchStats.online: random.randint(0, 20),
+        BenchStats.players: "['" + "', '".join(["player"] * 10) + "']",
+        BenchStats.desc: "A Minecraft Server",
+    }
+
+
+def run(mode, servers, seconds, interval, readers):
+    db_file = os.path.join(tempfile.mkdtemp(), f"bench_{mode}.sqlite")
+    if mode == "direct":
+        database = peewee.SqliteDatabase(db_file, pragmas=OLD_PRAGMAS)
+        writer = None
+    else:
+        database = DatabaseManager().get_database(db_file)
+        writer = DatabaseManager().get_writer(database)
+    database.bind([BenchStats])
+    database.create_tables([BenchStats])
+
+    latencies = []
+    errors = []
+    reads = [0]
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def server(server_id):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                query = BenchStats.insert(_row(server_id))
+                if writer is None:
+                    query.execute()
+                else:
+                    writer.submit(query.execute)
+            except peewee.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+            with lock:
+                latencies.append(time.perf_counter() - started)
+            stop.wait(interval)
+
+    def reader():
+        while not stop.is_set():
+            server_id = random.randint(1, servers)
+            (
+                BenchStats.select()
+                .where(BenchStats.server_id == server_id)
+                .order_by(BenchStats.created.desc())
+                .first()
+            )
+            with lock:
+                reads[0] += 1
+
+    threads = [
+        threading.Thread(target=server, args=(i + 1,), daemon=True)
+        for i in range(servers)
+    ] + [threading.Thread(target=reader, daemon=True) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if writer is not None:
+        # wait for the queue to drain so we count committed rows
+        writer.run(lambda: None)
+    elapsed = time.perf_counter() - started
+
+    rows = BenchStats.select().count()
+    latencies.sort()
+    print(
+        f"{mode:>7}: {rows / elapsed:8.0f} rows/s committed, "
+        f"{reads[0] / elapsed:8.0f} reads/s, "
+        f"caller p50 {statistics.median(latencies) * 1000:6.2f}ms "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f}ms, "
+        f"{len(errors)} lock errors"
+    )
+    if writer is not None:
+        print(f"         writer: {writer.metrics}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--servers", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument(
+        "--interval", type=float, default=0.05, help="seconds between stats rows"
+    )
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+    for mode in ("direct", "writer"):
+        run(mode, args.servers, args.seconds, args.interval, args.readers)
+
+
+if __name__ == "__main__":
+    main()